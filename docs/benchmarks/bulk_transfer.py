@@ -0,0 +1,132 @@
+"""Time of the bulk transfer against one transfer request per recipient
+
+Creates a SQLite database with `--recipients` users, then sends 10 points
+to every one of them from an admin, with a single
+`POST /admin/transaction/bulk` and with one
+`POST /transaction/{username}?usepdm=true` per recipient (the admin panel
+before the bulk route), through the app in process (no network).
+
+    python docs/benchmarks/bulk_transfer.py --recipients 100,1000,3000
+
+Every request checks the admin password (bcrypt), the requests per
+recipient are only sent up to `--single-max` recipients.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+os.environ['DUNDIE_DB__uri'] = 'sqlite:///' + os.path.join(
+    tempfile.mkdtemp(), 'bulk_transfer.db'
+)
+os.environ.setdefault('DUNDIE_SECURITY__SECRET_KEY', 'benchmark')
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlmodel import Session, SQLModel, func, select  # noqa: E402
+
+from dundie.app import app  # noqa: E402
+from dundie.auth.functions import create_access_token  # noqa: E402
+from dundie.db import engine  # noqa: E402
+from dundie.models import Balance, User  # noqa: E402
+from dundie.security import get_password_hash  # noqa: E402
+
+ADMIN_PASSWORD = 'Benchmark123'
+
+
+def populate(recipients: int):
+    """The admin, pointsdeliveryman and the `recipients` users"""
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        users = [
+            User(
+                name=username.title(),
+                username=username,
+                dept='management',
+                email=f'{username}@dm.com',
+                password=get_password_hash(ADMIN_PASSWORD),
+                currency='USD',
+            )
+            for username in ('admin', 'pointsdeliveryman')
+        ] + [
+            User(
+                name=f'User {index}',
+                username=f'user{index}',
+                dept='sales',
+                email=f'user{index}@dm.com',
+                password='!',
+                currency='USD',
+            )
+            for index in range(recipients)
+        ]
+        session.add_all(users)
+        session.commit()
+        session.add_all(Balance(user_id=user.id, value=0) for user in users)
+        session.commit()
+
+
+def get_credited_points() -> int:
+    with Session(engine) as session:
+        return session.exec(select(func.sum(Balance.value))).one()
+
+
+def run_bulk(client: TestClient, headers: dict, recipients: int):
+    response = client.post(
+        '/admin/transaction/bulk',
+        json={
+            'transfers': [
+                {'username': f'user{index}', 'points': 10}
+                for index in range(recipients)
+            ]
+        },
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+
+
+def run_single(client: TestClient, headers: dict, recipients: int):
+    for index in range(recipients):
+        response = client.post(
+            f'/transaction/user{index}?points=10&usepdm=true',
+            headers=headers,
+        )
+        assert response.status_code == 200, response.text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recipients', default='100,1000,3000')
+    parser.add_argument('--single-max', type=int, default=500)
+    args = parser.parse_args()
+
+    token = create_access_token(data={'sub': 'admin'})
+    headers = {
+        'Authorization': f'Bearer {token}',
+        'X-Admin-Password': ADMIN_PASSWORD,
+    }
+    client = TestClient(app)
+
+    print('| recipients | route | requests | time | per recipient |')
+    print('|---:|---|---:|---:|---:|')
+    for recipients in map(int, args.recipients.split(',')):
+        for name, function, requests in (
+            ('bulk', run_bulk, 1),
+            ('one per recipient', run_single, recipients),
+        ):
+            if requests > args.single_max:
+                continue
+            populate(recipients)
+            start = time.perf_counter()
+            function(client, headers, recipients)
+            duration = time.perf_counter() - start
+            assert get_credited_points() == recipients * 10
+            print(
+                f'| {recipients} | {name} | {requests} '
+                f'| {duration * 1000:.0f} ms '
+                f'| {duration / recipients * 1000:.2f} ms |'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Payload size and encode time of MessagePack against JSON
+
+Fills the database of `serialization.py`, then requests a 100 posts page
+of `/post`, the whole `/transaction/list` of a user and a 100 users page of
+`/admin/user` as JSON and as MessagePack (`Accept: application/msgpack`).
+
+For each route it prints the payload sizes (raw and gzipped) and the time
+to encode and decode the same data with the stdlib `json`, orjson and
+msgpack, with the datetimes as ISO strings in JSON and as timestamps in
+MessagePack, then the median request time of each format.
+
+    python docs/benchmarks/msgpack_payloads.py --transactions 10000
+"""
+
+import argparse
+import gzip
+import json
+import statistics
+import time
+
+import msgpack
+import orjson
+from serialization import populate  # noqa: I001 (sets the database)
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from dundie.app import app
+from dundie.auth.functions import create_access_token
+from dundie.db import engine
+from dundie.models import Balance, User
+from dundie.serialization import MsgPackResponse
+
+
+def create_admin() -> str:
+    with Session(engine) as session:
+        admin = User(
+            name='Michael Scott',
+            username='michael',
+            dept='management',
+            email='michael@dm.com',
+            password='!',
+            currency='USD',
+        )
+        session.add(admin)
+        session.commit()
+        session.add(Balance(user_id=admin.id, value=0))
+        session.commit()
+    return 'michael'
+
+
+def timed(function, repeat: int) -> float:
+    """Median milliseconds of `repeat` calls"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations) * 1000
+
+
+def to_json_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(type(value).__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=10000)
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    users = populate(args.users, args.transactions, args.posts)
+    client = TestClient(app)
+    tokens = {
+        'user': create_access_token(data={'sub': users[0].username}),
+        'admin': create_access_token(data={'sub': create_admin()}),
+    }
+    urls = {
+        '/post?size=100&sort=like_desc': 'user',
+        '/transaction/list': 'user',
+        '/admin/user?size=100': 'admin',
+    }
+
+    sizes, codecs, requests = [], [], []
+    for url, token in urls.items():
+        headers = {'Authorization': f'Bearer {tokens[token]}'}
+        packed_headers = headers | {'Accept': 'application/msgpack'}
+        body = client.get(url, headers=headers).content
+        packed = client.get(url, headers=packed_headers).content
+        sizes.append(
+            f'| `{url}` | {len(body) / 1000:.1f} kB '
+            f'| {len(packed) / 1000:.1f} kB '
+            f'| {len(gzip.compress(body)) / 1000:.1f} kB '
+            f'| {len(gzip.compress(packed)) / 1000:.1f} kB |'
+        )
+
+        data = msgpack.unpackb(packed, timestamp=3)
+        encoders = {
+            'json': lambda: json.dumps(data, default=to_json_value),
+            'orjson': lambda: orjson.dumps(data),
+            'msgpack': lambda: MsgPackResponse(data).body,
+        }
+        decoders = {
+            'json': lambda: json.loads(body),
+            'orjson': lambda: orjson.loads(body),
+            'msgpack': lambda: msgpack.unpackb(packed, timestamp=3),
+        }
+        for name in encoders:
+            codecs.append(
+                f'| `{url}` | {name} '
+                f'| {timed(encoders[name], args.repeat):.2f} ms '
+                f'| {timed(decoders[name], args.repeat):.2f} ms |'
+            )
+
+        for name, request_headers in (
+            ('json', headers), ('msgpack', packed_headers)
+        ):
+            duration = timed(
+                lambda: client.get(url, headers=request_headers),
+                args.repeat,
+            )
+            requests.append(f'| `{url}` | {name} | {duration:.1f} ms |')
+
+    print('| route | JSON | MessagePack | JSON gzip | MessagePack gzip |')
+    print('|---|---:|---:|---:|---:|')
+    print('\n'.join(sizes))
+    print('\n| route | encoder | encode | decode |\n|---|---|---:|---:|')
+    print('\n'.join(codecs))
+    print('\n| route | format | median request |\n|---|---|---:|')
+    print('\n'.join(requests))
+
+
+if __name__ == '__main__':
+    main()
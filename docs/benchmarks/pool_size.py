@@ -0,0 +1,98 @@
+"""Throughput of the sync engine by connection pool size
+
+Runs `--workers` threads that check out a connection, run a query and keep
+the connection for `--hold-ms` (the database work and network round trip
+of a real request), for `--seconds` with each pool size.
+
+    python docs/benchmarks/pool_size.py --sizes 1,2,5,10,20 --workers 32
+
+The database is `--uri` or `DUNDIE_DB__uri`, on PostgreSQL the query is a
+`pg_sleep` of `--hold-ms` instead of sleeping in Python.
+"""
+
+import argparse
+import os
+import statistics
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+
+def run(uri: str, size: int, workers: int, seconds: float, hold: float):
+    engine = create_engine(
+        uri, pool_size=size, max_overflow=0, pool_timeout=5
+    )
+    is_postgres = engine.dialect.name == 'postgresql'
+    query = f'SELECT pg_sleep({hold})' if is_postgres else 'SELECT 1'
+
+    # Checkout waits of every attempt, the timed out ones included
+    waits, queries, timeouts = [], 0, 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        nonlocal queries, timeouts
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                with engine.connect() as connection:
+                    waited = time.perf_counter() - start
+                    connection.exec_driver_sql(query)
+                    if not is_postgres:
+                        time.sleep(hold)
+            except PoolTimeoutError:
+                with lock:
+                    timeouts += 1
+                    waits.append(time.perf_counter() - start)
+                continue
+            with lock:
+                queries += 1
+                waits.append(waited)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    quantiles = statistics.quantiles(waits, n=100)
+    return {
+        'size': size,
+        'throughput': queries / seconds,
+        'wait_p50_ms': quantiles[49] * 1000,
+        'wait_p95_ms': quantiles[94] * 1000,
+        'wait_max_ms': max(waits) * 1000,
+        'timeouts': timeouts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--uri', default=os.environ.get('DUNDIE_DB__uri'))
+    parser.add_argument('--sizes', default='1,2,5,10,20')
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--hold-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    print(
+        '| pool size | queries/s | checkout wait p50 | p95 | max '
+        '| timeouts |\n|---:|---:|---:|---:|---:|---:|'
+    )
+    for size in map(int, args.sizes.split(',')):
+        result = run(
+            args.uri, size, args.workers, args.seconds, args.hold_ms / 1000
+        )
+        print(
+            f'| {result["size"]} | {result["throughput"]:.0f} '
+            f'| {result["wait_p50_ms"]:.1f} ms '
+            f'| {result["wait_p95_ms"]:.1f} ms '
+            f'| {result["wait_max_ms"]:.0f} ms | {result["timeouts"]} |'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Payload throughput of the list routes with and without FAST_JSON
+
+Creates a SQLite database with `--transactions` transactions of one user
+and `--posts` posts, then requests `/transaction/list` (every transaction)
+and a 100 posts page of `/post` `--requests` times each, in each of the
+`--modes`, through the app in process (no network).
+
+    python docs/benchmarks/serialization.py --transactions 10000
+
+`--modes off` runs without `dundie.serialization`, to measure older trees.
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+os.environ['DUNDIE_DB__uri'] = 'sqlite:///' + os.path.join(
+    tempfile.mkdtemp(), 'serialization.db'
+)
+os.environ.setdefault('DUNDIE_SECURITY__SECRET_KEY', 'benchmark')
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlmodel import Session, SQLModel  # noqa: E402
+
+from dundie.app import app  # noqa: E402
+from dundie.auth.functions import create_access_token  # noqa: E402
+from dundie.config import settings  # noqa: E402
+from dundie.db import engine  # noqa: E402
+from dundie.models import Balance, Post, Transaction, User  # noqa: E402
+from dundie.utils.utils import get_utcnow  # noqa: E402
+
+
+def populate(users: int, transactions: int, posts: int) -> list[User]:
+    """`transactions` of the first user with the others and `posts`"""
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        created = [
+            User(
+                name=f'User {index}',
+                username=f'user{index}',
+                dept='sales',
+                email=f'user{index}@dm.com',
+                password='!',
+                currency='USD',
+                bio='Assistant to the regional manager',
+            )
+            for index in range(users)
+        ]
+        session.add_all(created)
+        session.commit()
+        session.add_all(Balance(user_id=user.id, value=0) for user in created)
+
+        now = get_utcnow()
+        session.add_all(
+            Transaction(
+                user_id=created[index % users].id,
+                from_id=created[0].id,
+                value=10,
+                date=now - timedelta(seconds=index),
+            )
+            for index in range(transactions)
+        )
+        session.add_all(
+            Post(
+                content='Bears. Beets. Battlestar Galactica. ' * 4,
+                user_id=created[index % users].id,
+                likes=index % 100,
+                date=now - timedelta(seconds=index),
+            )
+            for index in range(posts)
+        )
+        session.commit()
+        for user in created:
+            session.refresh(user)
+        return created
+
+
+def run(client: TestClient, url: str, headers: dict, requests: int) -> dict:
+    # The first request fills the caches (user, page totals)
+    client.get(url, headers=headers)
+
+    durations, size = [], 0
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(url, headers=headers)
+        durations.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+        size = len(response.content)
+
+    median = statistics.median(durations)
+    return {
+        'size': size,
+        'median_ms': median * 1000,
+        'mb_per_second': size / median / 1_000_000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=10000)
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--modes', default='off,on')
+    args = parser.parse_args()
+
+    users = populate(args.users, args.transactions, args.posts)
+    token = create_access_token(data={'sub': users[0].username})
+    headers = {'Authorization': f'Bearer {token}'}
+    client = TestClient(app)
+
+    print(
+        '| route | FAST_JSON | payload | median | throughput |\n'
+        '|---|---|---:|---:|---:|'
+    )
+    for url in ('/transaction/list', '/post?size=100&sort=like_desc'):
+        for mode in args.modes.split(','):
+            if mode == 'on':
+                settings.serialization['FAST_JSON'] = True
+            elif 'serialization' in settings:
+                settings.serialization['FAST_JSON'] = False
+            result = run(client, url, headers, args.requests)
+            print(
+                f'| `{url}` | {mode} | {result["size"] / 1000:.0f} kB '
+                f'| {result["median_ms"]:.1f} ms '
+                f'| {result["mb_per_second"]:.1f} MB/s |'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,58 @@
-import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI
+from starlette.concurrency import run_in_threadpool
 
+from dundie.config import settings
+from dundie.controllers.ranking import sync_leaderboard
+from dundie.controllers.search import sync_user_search
+from dundie.db import monitor_replicas, warm_up_async_pool, warm_up_pool
 from dundie.middlewares import configure as cfg_middlewares
 from dundie.routes import main_router
+from dundie.security import hasher
+from dundie.serialization import get_default_response_class
+
+logger = logging.getLogger('dundie.app')
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Opens the pool connections before the first requests need them
+    try:
+        await run_in_threadpool(warm_up_pool, settings.db.POOL_WARMUP)
+        await warm_up_async_pool(settings.db.POOL_WARMUP)
+    except Exception:
+        logger.exception('Failed to warm up the connection pools')
+
+    # Loads the in-memory indexes on startup and keeps them in sync with
+    # changes made by other processes, checks the read replicas health
+    sync_tasks = [
+        asyncio.create_task(sync_leaderboard(settings.ranking.SYNC_SECONDS)),
+        asyncio.create_task(
+            sync_user_search(settings.user_search.SYNC_SECONDS)
+        ),
+        asyncio.create_task(
+            monitor_replicas(settings.db.REPLICA_CHECK_SECONDS)
+        ),
+    ]
+    yield
+    for task in sync_tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    hasher.shutdown()
+
 
 app = FastAPI(
-    title='dundie', version='0.1.0', description='Dundie is a rewards API.'
+    title='dundie',
+    version='0.1.0',
+    description='Dundie is a rewards API.',
+    lifespan=lifespan,
+    default_response_class=get_default_response_class(),
 )
 
 
 cfg_middlewares(app)
 app.include_router(main_router)
-
-
-@app.middleware('http')
-async def add_process_time_header(request: Request, call_next):
-    start_time = time.time()
-
-    response = await call_next(request)
-
-    process_time = time.time() - start_time
-    response.headers['X-Process-Time'] = str(process_time)
-    return response
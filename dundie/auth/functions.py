@@ -1,17 +1,21 @@
+import time
 from datetime import datetime, timedelta, timezone
 from functools import partial
-from typing import Callable
 
 from fastapi import Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from sqlalchemy.orm import make_transient_to_detached
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
 from dundie.auth.models import TokenData
 from dundie.config import settings
 from dundie.db import engine
 from dundie.models.user import User
-from dundie.security import verify_password
+from dundie.security import verify_password_async
+from dundie.utils.cache import TTLCache
 from dundie.utils.status import exp401
 
 SECRET_KEY = settings.security.secret_key
@@ -19,7 +23,38 @@ ALGORITHM = settings.security.algorithm
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.security.access_token_expire_minutes
 REFRESH_TOKEN_EXPIRE_MINUTES = settings.security.refresh_token_expire_minutes
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token')
+
+class BearerTokenHeader(OAuth2PasswordBearer):
+    """
+    Extracts the token from the `Authorization: Bearer <token>` header.
+
+    This is the only place where the header is parsed, the other auth
+    dependencies receive the token from it.
+    """
+
+    async def __call__(self, request: Request) -> str:
+        authorization = request.headers.get('authorization')
+        if not authorization:
+            raise exp401('Not authenticated')
+
+        scheme, _, token = authorization.partition(' ')
+        if scheme.lower() != 'bearer':
+            raise HTTPException(
+                401, "Invalid authentication method. Use Bearer."
+            )
+        if not token:
+            raise exp401('Invalid authorization header format')
+
+        return token
+
+
+oauth2_scheme = BearerTokenHeader(tokenUrl='token')
+
+# Authenticated users keyed by (username, token iat)
+user_cache = TTLCache(
+    maxsize=settings.security.USER_CACHE_MAX_SIZE,
+    ttl=settings.security.USER_CACHE_TTL_SECONDS,
+)
 
 
 def create_access_token(
@@ -38,7 +73,9 @@ def create_access_token(
         expire = datetime.now(timezone.utc) + timedelta(minutes=5)
 
     to_encode = data.copy()
-    to_encode.update({'exp': expire, 'scope': scope})
+    to_encode.update(
+        {'exp': expire, 'iat': datetime.now(timezone.utc), 'scope': scope}
+    )
     encoded_jwt = jwt.encode(
         to_encode,
         SECRET_KEY,
@@ -72,32 +109,15 @@ def create_both_tokens(
 create_refresh_token = partial(create_access_token, scope='refresh_token')
 
 
-def correct_authorization_header_syntax(request: Request):
-    if authorization := request.headers.get('authorization'):
-        try:
-            splited = authorization.split(' ')
-
-            # Checks if the token was sent
-            splited[1]
-
-            if splited[0].lower() != 'bearer':
-                raise HTTPException(
-                    401, "Invalid authentication method. Use Bearer."
-                )
-
-        except IndexError:
-            raise exp401('Invalid authorization header format')
-
-
-def authenticate_user(
-    get_user: Callable, username: str, password: str
+async def authenticate_user(
+    session: AsyncSession, username: str, password: str
 ) -> User | None:
     """Authenticate the user"""
 
-    user = get_user(username)
+    user = await get_user_async(username, session=session)
     if not user:
         return
-    if not verify_password(password, user.password):
+    if not await verify_password_async(password, user.password):
         return
     return user
 
@@ -113,36 +133,85 @@ def get_user(username, session: Session | None = None) -> User | None:
         return session.exec(stmt).first()
 
 
-def get_current_user(
-    _: None = Depends(correct_authorization_header_syntax),
-    token: str = Depends(oauth2_scheme),
-    request: Request = None,
-    fresh: bool = False,
-) -> User:
-    """Get the current user authenticated"""
-    # Extract the token from the authorization header
-    # The header is in the format: `Bearer <token>`
-    if request:
-        if authorization := request.headers.get('authorization'):
-            try:
-                token = authorization.split(' ')[1]
-            except IndexError:
-                raise exp401('Invalid authorization header format')
-    # Verify the token and get the username from the payload
+async def get_user_async(username, session: AsyncSession) -> User | None:
+    """Get user from database using an async session"""
+    stmt = select(User).where(User.username == username)
+    return (await session.exec(stmt)).first()
+
+
+def get_user_version(username: str) -> datetime | None:
+    """The `updated_at` of the user, None if it does not exist"""
+    stmt = select(User.updated_at).where(User.username == username)
+    with Session(engine) as session:
+        return session.exec(stmt).first()
+
+
+def get_cached_user(username: str, issued_at: int | None) -> User | None:
+    """
+    Get user from the authenticated users cache or from the database.
+
+    The cache stores only the column values, every call builds a new
+    detached `User`, so a request can change it or add it to its session
+    without affecting other requests.
+
+    Entries checked more than `security.USER_CACHE_REVALIDATE_SECONDS` ago
+    are compared with the user `updated_at` and reloaded when it changed,
+    `invalidate_cached_user` only reaches the cache of its own process.
+    """
+    key = (username, issued_at)
+    entry = user_cache.get(key)
+
+    now = time.monotonic()
+    revalidate = settings.security.USER_CACHE_REVALIDATE_SECONDS
+    if entry is not None and now - entry[0] >= revalidate:
+        if get_user_version(username) != entry[1]['updated_at']:
+            entry = None
+        else:
+            entry[0] = now
+
+    if entry is None:
+        user = get_user(username)
+        if not user:
+            user_cache.delete(key)
+            return
+        # [checked at, column values]
+        entry = [now, user.model_dump()]
+        user_cache.set(key, entry)
+
+    user = User(**entry[1])
+    make_transient_to_detached(user)
+    return user
+
+
+def invalidate_cached_user(username: str) -> None:
+    """
+    Removes every cached entry of the user, must be called when the user
+    is disabled, renamed or has any profile data changed.
+    """
+    user_cache.invalidate(lambda key: key[0] == username)
+
+
+def decode_token(token: str) -> dict:
+    """Decodes the token payload, raises 401 if it is invalid"""
     # The token is decoded using the SECRET_KEY and the ALGORITHM specified
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get('sub')
-        if not username:
-            raise exp401('Token does not contain a valid username (sub)')
-
-        token_data = TokenData(username=username)
-
     except JWTError:
         raise exp401('Could not decode token or token is invalid')
 
-    # Get user from database if user exists
-    user = get_user(username=token_data.username)
+    if not payload.get('sub'):
+        raise exp401('Token does not contain a valid username (sub)')
+
+    return payload
+
+
+def get_user_from_token(token: str, fresh: bool = False) -> User:
+    """Get the user the token was issued to"""
+    payload = decode_token(token)
+    token_data = TokenData(username=payload['sub'])
+
+    # Get user from cache or database if user exists
+    user = get_cached_user(token_data.username, payload.get('iat'))
     if not user:
         raise exp401('User not found')
 
@@ -154,6 +223,32 @@ def get_current_user(
     return user
 
 
+def get_current_user(
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+) -> User:
+    """
+    Get the current user authenticated
+
+    The user is resolved once per request and stored in `request.state.user`,
+    every other auth dependency of the request reuses it.
+    """
+    user = getattr(request.state, 'user', None)
+    if user is None:
+        user = get_user_from_token(token)
+        request.state.user = user
+    return user
+
+
+async def get_optional_user(request: Request) -> User | None:
+    """Get the current user authenticated or None if not authenticated"""
+    try:
+        token = await oauth2_scheme(request)
+        return await run_in_threadpool(get_current_user, request, token)
+    except HTTPException:
+        return None
+
+
 async def get_user_if_change_password_is_allowed(
     *, request: Request, username: str, pwd_reset_token: str | None = None
 ) -> User:
@@ -164,25 +259,26 @@ async def get_user_if_change_password_is_allowed(
     - authenticated user is superuser, or
     - authenticated user is the User
     """
-    target_user = get_user(username)
+    current_user = await get_optional_user(request)
+
+    # Users changing their own password don't need another lookup
+    if current_user and current_user.username == username:
+        target_user = current_user
+    else:
+        target_user = await run_in_threadpool(get_user, username)
     if not target_user:
         raise HTTPException(404, 'User not found')
 
     try:
         if pwd_reset_token:
-            valid_pwd_reset_token = (
-                get_current_user(token=pwd_reset_token or '') == target_user
-            )
+            payload = decode_token(pwd_reset_token)
+            valid_pwd_reset_token = payload['sub'] == target_user.username
         else:
             valid_pwd_reset_token = False
     except HTTPException:
         # if pwd_reset_token sent is invalid
         raise HTTPException(403, 'Possibly the token has expired')
 
-    try:
-        current_user = get_current_user(token='', request=request)
-    except HTTPException:
-        current_user = False
     if any(
         [
             valid_pwd_reset_token,
@@ -244,7 +340,7 @@ async def validate_token(token: str = Depends(oauth2_scheme)) -> User:
     Returns:
         User: The user
     """
-    user = get_current_user(token=token)
+    user = get_user_from_token(token)
     return user
 
 
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 import typer
 from rich import print as bprint
 from rich.console import Console
@@ -102,14 +104,76 @@ def transfer(points: int, username: str):
     """Transfer points to a user"""
 
     from dundie.controllers.transaction import check_and_transfer_points
+    from dundie.response_cache import invalidate_responses
 
     check_and_transfer_points(points=points, username=username)
+    invalidate_responses('ranking', 'transactions')
 
     typer.echo(f"Transferred {points} points to '{username}'")
 
 
+@main.command()
+def export_transactions(
+    output: typer.FileTextWrite = typer.Option('-', help='Defaults to stdout'),
+    fmt: str = typer.Option('csv', '--format', help='csv or ndjson'),
+    username: str = typer.Option(None, help='Only this user transactions'),
+    start: datetime = typer.Option(None, help='Transactions since this date'),
+    end: datetime = typer.Option(None, help='Transactions before this date'),
+):
+    """Exports the transactions ledger as CSV or NDJSON"""
+
+    from dundie.auth.functions import get_user
+    from dundie.controllers.transaction import (
+        get_export_transactions_stmt,
+        iter_export_lines,
+    )
+
+    if fmt not in ('csv', 'ndjson'):
+        raise typer.BadParameter("format must be 'csv' or 'ndjson'")
+
+    with Session(engine) as session:
+        user_id = None
+        if username:
+            user = get_user(username, session=session)
+            if not user:
+                raise typer.BadParameter(f"user '{username}' not found")
+            user_id = user.id
+
+        stmt = get_export_transactions_stmt(user_id, start, end)
+        result = session.exec(stmt)
+        for chunk in iter_export_lines(result.partitions(), fmt):
+            output.write(chunk)
+
+
+@main.command()
+def worker(
+    concurrency: int = typer.Option(
+        None, help='Jobs run at once, defaults to jobs.CONCURRENCY'
+    ),
+    burst: bool = typer.Option(False, help='Exits when no job is due'),
+):
+    """Runs the background jobs (password reset emails...)"""
+    import logging
+    import signal
+    import threading
+
+    from dundie.tasks.queue import run_worker
+
+    logging.basicConfig(
+        level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s'
+    )
+    # The running jobs are finished before exiting
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+
+    run_worker(concurrency, burst=burst, stop=stop)
+
+
 @main.command()
 def disable_user(username):
+    from dundie.auth.functions import invalidate_cached_user
+
     with Session(engine) as session:
         stmt = select(User).where(User.username == username)
         user = session.exec(stmt).first()
@@ -118,6 +182,9 @@ def disable_user(username):
         session.add(user)
         session.commit()
         session.refresh(user)
+        # API workers run in other processes, they see the change within
+        # `security.USER_CACHE_REVALIDATE_SECONDS` (see `get_cached_user`)
+        invalidate_cached_user(username)
         bprint("user '{username}' deactivated")
 
 
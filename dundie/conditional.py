@@ -0,0 +1,150 @@
+"""Conditional GET of routes with cheap validators
+
+    @router.get('/shop/products', response_model=list[ProductResponse])
+    @conditional_response(get_products_validators)
+    async def get_products(session: AsyncSession = ReadSession, ...):
+
+    async def get_products_validators(session: AsyncSession):
+        # SELECT count(id), max(updated_at) FROM products
+        return f'{count}:{updated_at}', updated_at
+
+The validators function is called before the endpoint with the endpoint
+arguments of the same names, and returns a version of the response (any
+value whose text changes whenever the body changes) and its last
+modification time. They are sent as a weak `ETag` and `Last-Modified`.
+
+A request whose `If-None-Match` matches the ETag, or, without it, whose
+`If-Modified-Since` is not older than the last modification, is answered
+with an empty 304 and the endpoint does not run. Returning None from the
+validators skips all of that, e.g. to let the endpoint answer a 404.
+
+Put it above `cache_response`, the ETag is part of the cache key, so a body
+cached for an old version is never sent with a new ETag.
+"""
+
+import functools
+import hashlib
+import inspect
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Awaitable, Callable
+
+from fastapi import Request, Response
+
+from dundie.metrics import Counter
+from dundie.response_cache import inject_param
+
+NOT_MODIFIED = Counter(
+    'dundie_not_modified_total',
+    'Conditional requests answered with 304 Not Modified',
+    labels=('route',),
+)
+
+Validators = tuple[Any, datetime | None]
+
+
+def get_etag(request: Request, version: Any) -> str:
+    """Weak ETag of the `version` of the requested URL"""
+    source = f'{request.url.path}?{request.url.query}|{version}'
+    return f'W/"{hashlib.sha1(source.encode()).hexdigest()[:20]}"'
+
+
+def as_utc(value: datetime) -> datetime:
+    """The database columns store UTC, some drivers without the timezone"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def format_http_date(value: datetime) -> str:
+    return format_datetime(as_utc(value), usegmt=True)
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """Weak comparison of `etag` with the tags of `If-None-Match`"""
+    if if_none_match.strip() == '*':
+        return True
+    opaque_tag = etag.removeprefix('W/')
+    return any(
+        tag.strip().removeprefix('W/') == opaque_tag
+        for tag in if_none_match.split(',')
+    )
+
+
+def is_not_modified(
+    request: Request, etag: str, last_modified: datetime | None
+) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        # If-Modified-Since is ignored when If-None-Match is present
+        return etag_matches(etag, if_none_match)
+
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have no fraction of seconds
+    return as_utc(last_modified).replace(microsecond=0) <= as_utc(since)
+
+
+def conditional_response(
+    get_validators: Callable[..., Awaitable[Validators | None]],
+):
+    """
+    Answers conditional GETs of the decorated endpoint with 304 Not
+    Modified, see the module docstring. Put it below the route decorator.
+
+    get_validators: returns the version and the last modification time of
+    the response, called with the endpoint arguments it names
+    """
+    validators_params = list(inspect.signature(get_validators).parameters)
+
+    def decorator(endpoint):
+        signature, request_name, request_added = inject_param(
+            inspect.signature(endpoint), 'conditional_request', Request
+        )
+        signature, response_name, response_added = inject_param(
+            signature, 'conditional_response', Response
+        )
+
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            # The added parameters are not ones of the endpoint
+            get = kwargs.pop if request_added else kwargs.get
+            request = get(request_name)
+            get = kwargs.pop if response_added else kwargs.get
+            response = get(response_name)
+
+            validators = await get_validators(
+                **{name: kwargs[name] for name in validators_params}
+            )
+            if validators is None:
+                return await endpoint(*args, **kwargs)
+
+            version, last_modified = validators
+            etag = get_etag(request, version)
+            headers = {'ETag': etag}
+            if last_modified is not None:
+                headers['Last-Modified'] = format_http_date(last_modified)
+
+            if is_not_modified(request, etag, last_modified):
+                route = request.scope['route']
+                NOT_MODIFIED.inc(route.path)
+                return Response(status_code=304, headers=headers)
+
+            # Read by `get_cache_key` of the response cache
+            request.state.etag = etag
+            result = await endpoint(*args, **kwargs)
+            # Returned responses are sent as they are, the headers of the
+            # injected response are only added to the returned data
+            target = result if isinstance(result, Response) else response
+            target.headers.update(headers)
+            return result
+
+        wrapper.__signature__ = signature
+        return wrapper
+
+    return decorator
@@ -1,3 +1,11 @@
-from .user import create_user_and_balance
+from .user import (
+    create_user_and_balance,
+    get_listed_users_stmt,
+    get_user_names_stmt,
+)
 
-__all__ = ['create_user_and_balance']
+__all__ = [
+    'create_user_and_balance',
+    'get_listed_users_stmt',
+    'get_user_names_stmt',
+]
@@ -1,22 +1,188 @@
-from sqlmodel import Session, select
-from dundie.models import User, LikedPosts
+from typing import Literal
 
+from fastapi import HTTPException
+from sqlalchemy import Row, delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import Select
+from fastapi_pagination import Page
+from dundie.db import get_dialect_insert
+from dundie.models import Post, User, LikedPosts
+from dundie.pagination import PageParams, paginate_counted_async
+from dundie.utils.singleflight import SingleFlight
 
-def check_post_is_liked(
-    user: User,
-    post_id: int,
-    session: Session,
-    notbool: bool = False
-) -> bool | LikedPosts:
+PostSort = Literal['date_asc', 'date_desc', 'like_asc', 'like_desc']
 
-    condition = (
-        (LikedPosts.post_id == post_id)
-        & (LikedPosts.user_id == user.id)
+# Feed pages being loaded, see `get_posts_page`
+_feed_flights = SingleFlight()
+
+
+async def change_post_likes(
+    post_id: int, amount: int, session: AsyncSession
+) -> int | None:
+    """
+    Adds `amount` to the post likes counter in the database itself
+    (`likes = likes + amount`), so concurrent changes are never lost.
+    Returns the new count or None if the post does not exist.
+    """
+    stmt = (
+        update(Post)
+        .where(Post.id == post_id)
+        .values(likes=Post.likes + amount)
+        .returning(Post.likes)
+    )
+    return (await session.exec(stmt)).scalar_one_or_none()
+
+
+async def add_post_like(
+    user: User, post_id: int, session: AsyncSession
+) -> int | None:
+    """
+    Likes the post and returns its new likes count, or None if the user has
+    already liked it.
+
+    The like is inserted with `ON CONFLICT DO NOTHING` and the counter is
+    only incremented when the row was actually inserted, both in the same
+    transaction, so parallel likes of the same user count once.
+    """
+    insert = get_dialect_insert(session.bind.dialect.name)
+    stmt = (
+        insert(LikedPosts)
+        .values(user_id=user.id, post_id=post_id)
+        .on_conflict_do_nothing()
+        .returning(LikedPosts.post_id)
+    )
+
+    try:
+        if not (await session.exec(stmt)).first():
+            await session.rollback()
+            return None
+        likes = await change_post_likes(post_id, 1, session)
+    except IntegrityError:
+        # Foreign key violation, there is no post with that id
+        likes = None
+
+    if likes is None:
+        await session.rollback()
+        raise HTTPException(404, 'Post not found')
+
+    await session.commit()
+    return likes
+
+
+async def remove_post_like(
+    user: User, post_id: int, session: AsyncSession
+) -> int | None:
+    """
+    Unlikes the post and returns its new likes count, or None if the user
+    has not liked it. The counter is only decremented when the like row was
+    actually deleted, in the same transaction.
+    """
+    stmt = (
+        delete(LikedPosts)
+        .where(
+            (LikedPosts.user_id == user.id) & (LikedPosts.post_id == post_id)
+        )
+        .returning(LikedPosts.post_id)
     )
-    stmt = select(LikedPosts).where(condition)
-    is_liked = session.exec(stmt).first()
 
-    if is_liked and notbool:
-        return is_liked
+    if not (await session.exec(stmt)).first():
+        await session.rollback()
+        return None
+
+    likes = await change_post_likes(post_id, -1, session)
+    await session.commit()
+    return likes
+
+
+def get_sorted_posts_stmt(sort: PostSort) -> Select:
+    """
+    Returns the statement selecting all posts in the `sort` order.
+
+    The author is joined in the same query and only the columns used by
+    `PostResponse` are selected. `Post.id` is always the last sort column,
+    so the order is unique and can be used by both offset and cursor
+    pagination.
+    """
+    stmt = select(
+        Post.id,
+        Post.date,
+        Post.content,
+        Post.likes,
+        User.id.label('user_id'),
+        User.name.label('user_name'),
+        User.username.label('user_username'),
+        User.dept.label('user_dept'),
+        User.avatar.label('user_avatar'),
+    ).join(User, Post.user_id == User.id)
+
+    match sort:
+        case 'date_asc':
+            return stmt.order_by(Post.date.asc(), Post.id.asc())
+        case 'date_desc':
+            return stmt.order_by(Post.date.desc(), Post.id.desc())
+        case 'like_asc':
+            return stmt.order_by(Post.likes.asc(), Post.id.asc())
+        case 'like_desc':
+            return stmt.order_by(Post.likes.desc(), Post.id.desc())
+
+
+async def get_posts_page(
+    session: AsyncSession, sort: PostSort, params: PageParams
+) -> Page:
+    """
+    Returns a page of the posts in the `sort` order, without the liked
+    state of the user. Concurrent requests of the same page from the same
+    database share a single load, each one gets its own copy of the page.
+    """
+    key = (session.bind, sort, params.page, params.size, params.include_total)
+    page = await _feed_flights.do(
+        key, paginate_counted_async, session, get_sorted_posts_stmt(sort),
+        params,
+    )
+    return page.model_copy()
+
+
+async def get_liked_post_ids(
+    user: User, post_ids: list[int], session: AsyncSession
+) -> set[int]:
+    """Returns which of the `post_ids` the user liked, in a single query"""
+    if not post_ids:
+        return set()
+
+    stmt = select(LikedPosts.post_id).where(
+        (LikedPosts.user_id == user.id) & (LikedPosts.post_id.in_(post_ids))
+    )
+    return set((await session.exec(stmt)).all())
+
+
+async def build_post_items(
+    rows: list[Row], user: User, session: AsyncSession
+) -> list[dict]:
+    """
+    Adjusts the rows selected by `get_sorted_posts_stmt` to the
+    `PostResponse` format, the liked state of the whole page is loaded
+    with one query.
+    """
+    liked_ids = await get_liked_post_ids(
+        user, [row.id for row in rows], session
+    )
 
-    return bool(is_liked)
+    return [
+        {
+            "id": row.id,
+            "date": row.date,
+            "content": row.content,
+            "user": {
+                "id": row.user_id,
+                "name": row.user_name,
+                "username": row.user_username,
+                "dept": row.user_dept,
+                "avatar": row.user_avatar
+            },
+            "likes": row.likes,
+            "liked": row.id in liked_ids
+        }
+        for row in rows
+    ]
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from dundie.db import async_engine, was_cancelled
+from dundie.models import Balance, User
+from dundie.response_cache import invalidate_responses_async
+from dundie.utils.leaderboard import Leaderboard
+from dundie.utils.singleflight import SingleFlight
+
+logger = logging.getLogger('dundie.ranking')
+
+# Points ranking served by /ranking, kept up to date by the code changing
+# balances in this process. Changes made by other processes (CLI, other
+# workers) are picked up by the periodic `sync_leaderboard`
+leaderboard = Leaderboard()
+_flights = SingleFlight()
+# Times the users changed during a load are read again
+RELOAD_ROUNDS = 3
+
+
+def get_ranking_profile(user: User) -> dict:
+    """The user fields returned by the ranking besides id and points"""
+    return {
+        'name': user.name,
+        'username': user.username,
+        'avatar': user.avatar,
+    }
+
+
+async def load_leaderboard(session: AsyncSession):
+    """
+    Rebuilds the leaderboard from the balances, in one query. The users
+    whose points changed in this process while it was read are read again,
+    up to `RELOAD_ROUNDS` times, see `Leaderboard.track`. If they keep
+    changing, the next sync fixes them.
+    """
+    changed = leaderboard.track()
+    try:
+        stmt = select(
+            User.id, User.name, User.username, User.avatar, Balance.value
+        ).join(Balance)
+        rows = (await session.exec(stmt)).all()
+        stale = leaderboard.load(
+            ((row.id, get_ranking_profile(row), row.value) for row in rows),
+            changed,
+        )
+
+        for _ in range(RELOAD_ROUNDS):
+            if not stale:
+                break
+            stmt = select(Balance.user_id, Balance.value).where(
+                Balance.user_id.in_(stale)
+            )
+            points = dict((await session.exec(stmt)).all())
+            stale = leaderboard.set_points(points, changed)
+    finally:
+        leaderboard.untrack(changed)
+
+    await invalidate_responses_async('ranking')
+
+
+async def ensure_leaderboard(session: AsyncSession):
+    """Loads the leaderboard on first use, once for concurrent requests"""
+    if not leaderboard.loaded:
+        await _flights.do('leaderboard', load_leaderboard, session)
+
+
+async def update_ranking_profile(user: User):
+    """Shows the new name, username or avatar of the user in the ranking"""
+    leaderboard.set_profile(user.id, get_ranking_profile(user))
+    await invalidate_responses_async('ranking')
+
+
+async def sync_leaderboard(interval: float):
+    """Reloads the leaderboard every `interval` seconds, runs forever"""
+    while True:
+        try:
+            async with AsyncSession(async_engine) as session:
+                await load_leaderboard(session)
+        except Exception as e:
+            if was_cancelled(e):
+                raise asyncio.CancelledError from e
+            # Keeps serving the current ranking, tries again next round
+            logger.exception('Failed to load the leaderboard')
+        await asyncio.sleep(interval)
@@ -0,0 +1,48 @@
+import asyncio
+import logging
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from dundie.db import async_engine, was_cancelled
+from dundie.models import User
+from dundie.utils.search import UserSearchIndex
+from dundie.utils.utils import get_username
+
+logger = logging.getLogger('dundie.search')
+
+# Active public users searched by /user/names, kept up to date by the code
+# changing users in this process. Changes made by other processes (CLI,
+# other workers) are picked up by the periodic `sync_user_search`
+user_search = UserSearchIndex(normalize=get_username)
+
+
+def update_user_search(user: User):
+    """Indexes the user if it is listed (active and public) or removes it"""
+    if user.is_active and not user.private:
+        user_search.upsert(user.id, user.username, user.name)
+    else:
+        user_search.remove(user.id)
+
+
+async def load_user_search(session: AsyncSession):
+    """Rebuilds the search index from the listed users, in one query"""
+    stmt = select(User.id, User.username, User.name).where(
+        User.is_active == True,  # noqa: E712
+        User.private == False,  # noqa: E712
+    )
+    user_search.load((await session.exec(stmt)).all())
+
+
+async def sync_user_search(interval: float):
+    """Reloads the search index every `interval` seconds, runs forever"""
+    while True:
+        try:
+            async with AsyncSession(async_engine) as session:
+                await load_user_search(session)
+        except Exception as e:
+            if was_cancelled(e):
+                raise asyncio.CancelledError from e
+            # Keeps serving the current index, tries again next round
+            logger.exception('Failed to load the user search index')
+        await asyncio.sleep(interval)
@@ -0,0 +1,39 @@
+from sqlalchemy import func
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
+
+from dundie.conditional import Validators
+from dundie.models import Orders, Products
+
+
+def get_orders_stmt() -> SelectOfScalar[Orders]:
+    """
+    Returns the statement selecting all orders by status, `id` makes the
+    order unique for pagination. Served by the `ix_orders_status_id` index.
+    """
+    return select(Orders).order_by(Orders.status.desc(), Orders.id.desc())
+
+
+async def get_products_validators(session: AsyncSession) -> Validators:
+    """
+    Version of the products list, the count (which changes on deletes) and
+    the latest `updated_at`, served by the `ix_products_updated_at` index.
+
+    Deleting a product does not change the `Last-Modified` date, only the
+    ETag, clients must send `If-None-Match` to notice deletes.
+    """
+    stmt = select(func.count(Products.id), func.max(Products.updated_at))
+    count, updated_at = (await session.exec(stmt)).one()
+    return f'{count}:{updated_at}', updated_at
+
+
+async def get_product_validators(
+    product_id: int, session: AsyncSession
+) -> Validators | None:
+    """Version of a product, None if it does not exist"""
+    stmt = select(Products.updated_at).where(Products.id == product_id)
+    updated_at = (await session.exec(stmt)).first()
+    if updated_at is None:
+        return None
+    return updated_at, updated_at
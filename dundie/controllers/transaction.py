@@ -1,10 +1,24 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterable, Iterator, Literal
+
 from fastapi import HTTPException
+from sqlalchemy import Row, case, insert, or_, update
+from sqlalchemy.orm import aliased, selectinload
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import Select, SelectOfScalar
 
-from dundie.auth.functions import get_user
+from dundie.auth.functions import get_user, get_user_async
+from dundie.controllers.ranking import leaderboard
+from dundie.controllers.user import build_user_item
 from dundie.db import engine
 from dundie.exc import SystemDefaultUserNotFound
 from dundie.models import Balance, Transaction, User
+from dundie.response_cache import invalidate_responses_async
+from dundie.utils.utils import get_utcnow
 
 
 def make_transaction(
@@ -13,41 +27,88 @@ def make_transaction(
     points: int,
     session: Session,
 ):
+    """
+    Transfers `points` between the users and records it in the ledger, all
+    in one database transaction.
 
-    transaction = Transaction(
-        user_id=to_user.id, from_id=from_user.id, value=points
-    )
+    Both balances are changed by a single guarded UPDATE, the sender row is
+    only matched while `value >= points`, so the funds check and the debit
+    are atomic and concurrent transfers can never overdraw. The UPDATE does
+    not lock its rows in a set order (on PostgreSQL it follows the plan), so
+    both rows are first locked by a `SELECT ... FOR UPDATE ORDER BY user_id`
+    and opposite transfers between two users do not deadlock. Superusers
+    send points without being debited.
 
-    # Gets the 'from_user' Balance object
-    stmt = select(Balance).where(Balance.user_id == from_user.id)
-    from_user_balance: Balance = session.exec(stmt).first()
+    The callers drop the cached 'ranking' and 'transactions' responses, the
+    API runs it through `run_sync` on the event loop, where the blocking
+    `invalidate_responses` must not be called.
+    """
+    if from_user.id == to_user.id:
+        raise HTTPException(400, 'You cannot transfer points to yourself')
 
-    # Gets the 'to_user' Balance object
-    stmt = select(Balance).where(Balance.user_id == to_user.id)
-    to_user_balance: Balance = session.exec(stmt).first()
+    if from_user.superuser:
+        stmt = (
+            update(Balance)
+            .where(Balance.user_id == to_user.id)
+            .values(value=Balance.value + points)
+        )
+        lock_stmt = None
+        expected_rows = 1
+    else:
+        # SQLite has no FOR UPDATE (it is left out), its writes are serialized
+        lock_stmt = (
+            select(Balance.user_id)
+            .where(Balance.user_id.in_([from_user.id, to_user.id]))
+            .order_by(Balance.user_id)
+            .with_for_update()
+        )
+        stmt = (
+            update(Balance)
+            .where(
+                Balance.user_id.in_([from_user.id, to_user.id]),
+                or_(Balance.user_id == to_user.id, Balance.value >= points),
+            )
+            .values(
+                value=Balance.value + case(
+                    (Balance.user_id == to_user.id, points), else_=-points
+                )
+            )
+        )
+        expected_rows = 2
 
-    # Updates users points
-    from_user_balance.value -= points if not from_user.superuser else 0
-    to_user_balance.value += points
+    transaction = Transaction(
+        user_id=to_user.id, from_id=from_user.id, value=points
+    )
 
-    # COMMIT THE BALANCES
     try:
+        if lock_stmt is not None:
+            session.exec(lock_stmt).all()
+        if session.exec(stmt).rowcount != expected_rows:
+            session.rollback()
+            raise HTTPException(403, 'Insufficient funds')
+
         session.add(transaction)
-        session.add(to_user_balance)
-        session.add(from_user_balance)
+        # Built before the commit expires the objects, avoids refreshes
+        result = {
+            'from': from_user.username,
+            'to': to_user.username,
+            'value': points,
+            'date': transaction.date,
+        }
         session.commit()
-        session.refresh(transaction)
+    except HTTPException:
+        raise
     except Exception:
+        session.rollback()
         raise HTTPException(
             500, 'An error occurred while performing the transfer'
         )
 
-    return {
-        'from': from_user.username,
-        'to': to_user.username,
-        'value': points,
-        'date': transaction.date,
-    }
+    if expected_rows == 2:
+        leaderboard.add_points(from_user.id, -points)
+    leaderboard.add_points(to_user.id, points)
+
+    return result
 
 
 def check_and_transfer_points(
@@ -57,38 +118,249 @@ def check_and_transfer_points(
     session: Session | None = None,
 ):
 
+    if session is None:
+        with Session(engine) as session:
+            return check_and_transfer_points(
+                username, points, from_user=from_user, session=session
+            )
+
     if points < 10:
         raise HTTPException(400, 'Points must be greater than or equal to 10')
 
-    # Checks whether the transaction can be carried out
-    if from_user and from_user.balance < points and not from_user.superuser:
-        raise HTTPException(403, 'Insufficient funds')
-
     # Gets the reiceiving user
-    to_user = get_user(username)
+    to_user = get_user(username, session=session)
     if not to_user or not to_user.is_active or to_user.private:
         raise HTTPException(404, 'User not found, impossible to transfer')
 
     # If not from_user, use system 'PointsDeliveryMan' user to send points
     if not from_user:
-        from_user = get_user('pointsdeliveryman')
+        from_user = get_user('pointsdeliveryman', session=session)
         if not from_user:
             raise SystemDefaultUserNotFound()
 
-    if session:
-        transaction = make_transaction(
-            from_user=from_user,
-            to_user=to_user,
-            points=points,
-            session=session,
+    # The funds are checked by the transfer itself, see `make_transaction`
+    return make_transaction(
+        from_user=from_user,
+        to_user=to_user,
+        points=points,
+        session=session,
+    )
+
+
+async def bulk_transfer_points(
+    transfers: dict[str, int], session: AsyncSession
+) -> dict:
+    """
+    Sends points from 'pointsdeliveryman' to many users at once.
+
+    The recipients are validated with a single `IN` query, the ledger rows
+    are inserted with one executemany and the balances are credited by one
+    `UPDATE ... SET value = value + CASE user_id ... END`, all committed
+    together, so either every recipient gets the points or none does.
+    """
+    from_user = await get_user_async('pointsdeliveryman', session=session)
+    if not from_user:
+        raise SystemDefaultUserNotFound()
+
+    stmt = select(User.id, User.username).where(
+        User.username.in_(transfers),
+        User.is_active == True,  # noqa: E712
+        User.private == False,  # noqa: E712
+    )
+    user_ids = {
+        username: uid for uid, username in (await session.exec(stmt)).all()
+    }
+    missing = sorted(set(transfers) - set(user_ids))
+    if missing:
+        raise HTTPException(
+            404,
+            'Users not found, impossible to transfer: ' + ', '.join(missing),
         )
-    else:
-        with Session(engine) as session:
-            transaction = make_transaction(
-                from_user=from_user,
-                to_user=to_user,
-                points=points,
-                session=session,
+
+    points = {
+        user_ids[username]: value for username, value in transfers.items()
+    }
+    date = get_utcnow()
+
+    try:
+        await session.exec(
+            insert(Transaction),
+            params=[
+                {
+                    'user_id': uid,
+                    'from_id': from_user.id,
+                    'value': value,
+                    'date': date,
+                }
+                for uid, value in points.items()
+            ],
+        )
+        result = await session.exec(
+            update(Balance)
+            .where(Balance.user_id.in_(points))
+            .values(
+                value=Balance.value + case(points, value=Balance.user_id)
             )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != len(points):
+            raise ValueError('missing balances')
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise HTTPException(
+            500, 'An error occurred while performing the transfer'
+        )
+
+    for uid, value in points.items():
+        leaderboard.add_points(uid, value)
+    await invalidate_responses_async('ranking', 'transactions')
+
+    return {
+        'from_username': from_user.username,
+        'recipients': len(points),
+        'points': sum(points.values()),
+        'date': date,
+    }
+
+
+async def get_transactions_owner_id(
+    username: str | None, user: User, session: AsyncSession
+) -> int:
+    """
+    Returns the id of the user whose transactions are listed, the user with
+    `username` if passed or the authenticated `user` otherwise.
+    """
+    if not username:
+        return user.id
+
+    target_user = await get_user_async(username, session=session)
+    if not target_user:
+        raise HTTPException(404, 'User not found')
+    return target_user.id
+
+
+def get_user_transactions_stmt(uid: int) -> SelectOfScalar[Transaction]:
+    """
+    Returns the statement selecting the transactions the user is involved
+    in, newest first. `Transaction.id` breaks ties between equal dates, so
+    the order is unique and can be used by cursor pagination.
+    """
+    return (
+        select(Transaction)
+        .options(
+            selectinload(Transaction.user),
+            selectinload(Transaction.from_user),
+        )
+        .where(or_(Transaction.user_id == uid, Transaction.from_id == uid))
+        .order_by(Transaction.date.desc(), Transaction.id.desc())
+    )
+
+
+def build_transaction_items(transactions: list[Transaction]) -> list[dict]:
+    """
+    Adjusts transactions to the `UserTransactionsResponse` format, each
+    user is built once and shared by all of its transactions
+    """
+    users = {}
+
+    def get_user_item(user: User) -> dict:
+        item = users.get(user.id)
+        if item is None:
+            item = users[user.id] = build_user_item(user)
+        return item
+
+    return [
+        {
+            "id": transaction.id,
+            "from_id": transaction.from_id,
+            "to_id": transaction.user_id,
+            "from_user": get_user_item(transaction.from_user),
+            "to_user": get_user_item(transaction.user),
+            "points": transaction.value,
+            "date": transaction.date,
+        }
+        for transaction in transactions
+    ]
+
+
+ExportFormat = Literal['csv', 'ndjson']
+
+EXPORT_FIELDS = ('id', 'date', 'from_username', 'to_username', 'points')
+
+# Rows fetched from the database cursor at a time by the exports
+EXPORT_BATCH_SIZE = 1000
+
+
+def get_export_transactions_stmt(
+    user_id: int | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> Select:
+    """
+    Returns the statement selecting the `EXPORT_FIELDS` of the ledger,
+    oldest first, optionally only the transactions the user is involved in
+    and in the `[start, end)` date range.
+
+    The usernames are joined in the same query and rows are fetched in
+    batches of `EXPORT_BATCH_SIZE` (a server-side cursor where supported),
+    so the export runs in constant memory.
+    """
+    from_user = aliased(User)
+    to_user = aliased(User)
+
+    stmt = (
+        select(
+            Transaction.id,
+            Transaction.date,
+            from_user.username.label('from_username'),
+            to_user.username.label('to_username'),
+            Transaction.value.label('points'),
+        )
+        .join(from_user, Transaction.from_id == from_user.id)
+        .join(to_user, Transaction.user_id == to_user.id)
+        .order_by(Transaction.date.asc(), Transaction.id.asc())
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+    if user_id is not None:
+        stmt = stmt.where(
+            or_(Transaction.user_id == user_id, Transaction.from_id == user_id)
+        )
+    if start is not None:
+        stmt = stmt.where(Transaction.date >= start)
+    if end is not None:
+        stmt = stmt.where(Transaction.date < end)
+
+    return stmt
+
+
+def format_export_header(fmt: ExportFormat) -> str:
+    """CSV files start with the column names, NDJSON has no header"""
+    return ','.join(EXPORT_FIELDS) + '\r\n' if fmt == 'csv' else ''
+
+
+def format_export_rows(rows: Iterable[Row], fmt: ExportFormat) -> str:
+    """Formats a batch of rows selected by `get_export_transactions_stmt`"""
+    if fmt == 'ndjson':
+        return ''.join(
+            json.dumps(
+                {**row._asdict(), 'date': row.date.isoformat()}
+            ) + '\n'
+            for row in rows
+        )
+
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        (row.id, row.date.isoformat(), *row[2:]) for row in rows
+    )
+    return buffer.getvalue()
+
 
-    return transaction
+def iter_export_lines(
+    batches: Iterable[Iterable[Row]], fmt: ExportFormat
+) -> Iterator[str]:
+    """Yields the formatted export, one chunk per batch of rows"""
+    yield format_export_header(fmt)
+    for rows in batches:
+        yield format_export_rows(rows, fmt)
@@ -1,8 +1,20 @@
 from fastapi import HTTPException
+from sqlalchemy import and_
 from sqlalchemy.exc import IntegrityError
-from sqlmodel import Session
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import Select, SelectOfScalar
 
+from dundie.conditional import Validators, as_utc
+from dundie.controllers.ranking import get_ranking_profile, leaderboard
+from dundie.controllers.search import update_user_search
 from dundie.models import Balance, User
+from dundie.serializers.admin import UserAdminResponse
+from dundie.serializers.user import UserResponse
+
+# Fields of the users in the lists, see `build_user_item`
+USER_RESPONSE_FIELDS = tuple(UserResponse.model_fields)
+ADMIN_USER_RESPONSE_FIELDS = tuple(UserAdminResponse.model_fields)
 
 
 def create_user_and_balance(user_data, session: Session) -> User:
@@ -25,4 +37,97 @@ def create_user_and_balance(user_data, session: Session) -> User:
         session.rollback()
         raise HTTPException(500, 'Database IntegrityError')
 
+    leaderboard.add_user(db_user.id, get_ranking_profile(db_user), 0)
+    update_user_search(db_user)
+
     return db_user
+
+
+def get_listed_users_stmt() -> SelectOfScalar[User]:
+    """
+    Returns the statement selecting the active public users by id, served
+    by the `ix_user_listed` partial index.
+    """
+    return (
+        select(User)
+        .where(
+            and_(User.is_active == True, User.private == False)  # noqa: E712
+        )
+        .order_by(User.id)
+    )
+
+
+def build_user_item(
+    user: User, fields: tuple[str, ...] = USER_RESPONSE_FIELDS
+) -> dict:
+    """
+    Adjusts an user to the `UserResponse` format (or other `fields`),
+    without dumping (and then validating) every column of the model
+    """
+    return {field: getattr(user, field) for field in fields}
+
+
+def build_user_items(users: list[User]) -> list[dict]:
+    return [build_user_item(user) for user in users]
+
+
+def build_admin_user_items(users: list[User]) -> list[dict]:
+    """Adjusts users to the `UserAdminResponse` format"""
+    return [
+        build_user_item(user, ADMIN_USER_RESPONSE_FIELDS) for user in users
+    ]
+
+
+def get_user_names_stmt(query: str, limit: int = 10) -> Select:
+    """
+    Returns the statement searching active public users whose username
+    contains `query`, served by `ix_user_listed_username_trgm` on postgres
+    and by scanning `ix_user_listed` on sqlite.
+    """
+    return (
+        select(User.username, User.name)
+        .where(
+            and_(
+                User.is_active == True,  # noqa: E712
+                User.private == False,  # noqa: E712
+            )
+        )
+        .filter(User.username.like(f'%{query}%'))
+        .limit(limit)
+    )
+
+
+async def get_profile_validators(
+    user: User, session: AsyncSession
+) -> Validators:
+    """
+    Version of the authenticated user profile. The user columns are the
+    ones of the authenticated (cached) user the profile is built from, the
+    points come from the balance, the only row read.
+    """
+    stmt = select(Balance.updated_at).where(Balance.user_id == user.id)
+    balance_updated_at = (await session.exec(stmt)).first()
+    updated_at = [as_utc(user.updated_at)]
+    if balance_updated_at is not None:
+        updated_at.append(as_utc(balance_updated_at))
+    version = f'{user.id}:{user.updated_at}:{balance_updated_at}'
+    return version, max(updated_at)
+
+
+async def get_public_profile_validators(
+    username: str, session: AsyncSession
+) -> Validators | None:
+    """Version of a public profile, None if the user does not exist"""
+    stmt = (
+        select(User.updated_at, Balance.updated_at)
+        .join(Balance, isouter=True)
+        .where(User.username == username)
+    )
+    row = (await session.exec(stmt)).first()
+    if row is None:
+        return None
+    user_updated_at, balance_updated_at = row
+    updated_at = [as_utc(user_updated_at)]
+    if balance_updated_at is not None:
+        updated_at.append(as_utc(balance_updated_at))
+    return f'{user_updated_at}:{balance_updated_at}', max(updated_at)
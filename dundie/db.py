@@ -1,20 +1,392 @@
 """Database connection"""
 
-from fastapi import Depends
+import asyncio
+import itertools
+import logging
+from contextlib import AsyncExitStack, ExitStack
+from datetime import datetime, timezone
+from typing import Iterable
+
+from fastapi import Depends, Request
+from jose import JWTError, jwt
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool, QueuePool
 from sqlmodel import Session, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from dundie.config import settings
+from dundie.metrics import instrument_engine
+from dundie.pagination import track_table_writes
+from dundie.query_stats import get_current_stats, track_queries
+from dundie.slow_queries import track_slow_queries
+from dundie.utils.cache import TTLCache
+
+logger = logging.getLogger('dundie.db')
+
+# Async drivers used for each sync backend
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def get_pool_options(uri: str) -> dict:
+    """
+    The pool settings of `[db]` accepted by the default pool of the `uri`
+    driver, the sizes only apply to queue pools (not to SQLite in memory
+    or aiosqlite, which use pools without a size).
+    """
+    url = make_url(uri)
+    options = {
+        'pool_pre_ping': settings.db.POOL_PRE_PING,
+        'pool_recycle': settings.db.POOL_RECYCLE,
+    }
+    if issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+        options.update(
+            pool_size=settings.db.POOL_SIZE,
+            max_overflow=settings.db.MAX_OVERFLOW,
+            pool_timeout=settings.db.POOL_TIMEOUT,
+        )
+    return options
+
 
 engine = create_engine(
     settings.db.uri,
     echo=settings.db.echo,
     connect_args=settings.db.connect_args,
+    **get_pool_options(settings.db.uri),
 )
 
 
+def get_async_uri(uri: str) -> str:
+    """
+    Converts a sync database uri into the equivalent async driver uri.
+
+    `postgresql://...` becomes `postgresql+asyncpg://...` and
+    `sqlite://...` becomes `sqlite+aiosqlite://...`, any other backend
+    is returned unchanged.
+    """
+    url = make_url(uri)
+    drivername = ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)
+    return url.set(drivername=drivername).render_as_string(
+        hide_password=False
+    )
+
+
+def create_async_engine_from_settings(uri: str) -> AsyncEngine:
+    return create_async_engine(
+        uri,
+        echo=settings.db.echo,
+        connect_args=settings.db.connect_args,
+        **get_pool_options(uri),
+    )
+
+
+async_uri = settings.db.get('async_uri') or get_async_uri(settings.db.uri)
+async_engine = create_async_engine_from_settings(async_uri)
+
+
+def strip_timezone(conn, cursor, statement, parameters, context, many):
+    """
+    asyncpg refuses aware datetimes for `TIMESTAMP WITHOUT TIME ZONE`
+    columns (psycopg2 silently converts them), so every aware datetime
+    is converted to naive UTC before being sent to the database.
+    """
+
+    def naive(value):
+        if isinstance(value, datetime) and value.tzinfo is not None:
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    if many:
+        parameters = [tuple(map(naive, params)) for params in parameters]
+    else:
+        parameters = tuple(map(naive, parameters))
+
+    return statement, parameters
+
+
+def configure_engine(
+    sync_engine: Engine, name: str, explain_engine: Engine | None = engine
+):
+    """
+    Hooks the metrics, query stats, slow query log and page count
+    invalidation into the engine, pass `sync_engine` for async engines.
+    The slow queries are explained on `explain_engine`, a sync engine of
+    the same database (the primary by default).
+    """
+    instrument_engine(sync_engine, name)
+    track_table_writes(sync_engine)
+    track_queries(sync_engine)
+    track_slow_queries(sync_engine, name, explain_engine=explain_engine)
+    if sync_engine.dialect.driver == 'asyncpg':
+        event.listen(
+            sync_engine, 'before_cursor_execute', strip_timezone, retval=True
+        )
+
+
+configure_engine(engine, 'sync')
+configure_engine(async_engine.sync_engine, 'async')
+
+
+def was_cancelled(error: BaseException) -> bool:
+    """
+    Whether `error` was raised while handling a cancellation, e.g. an async
+    session failing to close after its query was cancelled. Loops catching
+    every `Exception` must still stop when their task is cancelled.
+    """
+    while error is not None:
+        if isinstance(error, asyncio.CancelledError):
+            return True
+        error = error.__context__
+    return False
+
+
+# * Read replicas
+#
+# GET routes opt in to the replicas with the `ReadSession` dependency, the
+# other routes (and the writes) always use the primary `async_engine`.
+
+
+async def get_replication_lag(replica: AsyncEngine) -> float:
+    """
+    Seconds the replica is behind the primary, 0 when it has replayed
+    everything it received or is not a PostgreSQL standby. Raises when the
+    replica can not be reached.
+    """
+    async with replica.connect() as connection:
+        if replica.dialect.name != 'postgresql':
+            await connection.exec_driver_sql('SELECT 1')
+            return 0
+        lag = await connection.exec_driver_sql(
+            'SELECT CASE WHEN pg_last_wal_receive_lsn() = '
+            'pg_last_wal_replay_lsn() THEN 0 ELSE EXTRACT(EPOCH FROM '
+            'now() - pg_last_xact_replay_timestamp()) END'
+        )
+        return float(lag.scalar() or 0)
+
+
+class ReplicaSet:
+    """
+    Async engines of the read replicas, handed out round-robin. Replicas
+    failing the health check, or lagging more than `max_lag` seconds, are
+    skipped until a later check succeeds. With no healthy replica `pick`
+    returns None and the reads go to the primary.
+    """
+
+    def __init__(self, uris: list[str], max_lag: float):
+        self.engines = [
+            create_async_engine_from_settings(get_async_uri(uri))
+            for uri in uris
+        ]
+        self.max_lag = max_lag
+        # Every replica is used until the first check says otherwise
+        self.healthy = list(self.engines)
+        self._counter = itertools.count()
+
+    def pick(self) -> AsyncEngine | None:
+        healthy = self.healthy
+        if not healthy:
+            return None
+        return healthy[next(self._counter) % len(healthy)]
+
+    async def check(self, timeout: float = 5):
+        healthy = []
+        for replica in self.engines:
+            try:
+                lag = await asyncio.wait_for(
+                    get_replication_lag(replica), timeout
+                )
+            except Exception as e:
+                if was_cancelled(e):
+                    raise asyncio.CancelledError from e
+                logger.warning('Replica %r is unavailable: %s', replica.url, e)
+                continue
+            if lag <= self.max_lag:
+                healthy.append(replica)
+            else:
+                logger.warning(
+                    'Replica %r is %.1fs behind', replica.url, lag
+                )
+        self.healthy = healthy
+
+
+def create_explain_engine(uri: str) -> Engine | None:
+    """
+    Sync engine of a replica for the slow query EXPLAINs, without a pool:
+    they run one at a time and rarely. None when they are disabled.
+    """
+    if not settings.db.SLOW_QUERY_EXPLAIN:
+        return None
+    return create_engine(uri, poolclass=NullPool)
+
+
+replicas = ReplicaSet(
+    settings.db.REPLICA_URIS, settings.db.REPLICA_MAX_LAG_SECONDS
+)
+for index, (uri, replica) in enumerate(
+    zip(settings.db.REPLICA_URIS, replicas.engines)
+):
+    configure_engine(
+        replica.sync_engine,
+        f'replica{index}',
+        explain_engine=create_explain_engine(uri),
+    )
+
+
+async def monitor_replicas(interval: float):
+    """Checks the replicas every `interval` seconds, runs forever"""
+    while True:
+        await replicas.check()
+        await asyncio.sleep(interval)
+
+
+# Users whose last write is more recent than READ_YOUR_WRITES_SECONDS, their
+# reads go to the primary so they see their own changes despite the lag
+recent_writers = TTLCache(
+    maxsize=10000, ttl=settings.db.READ_YOUR_WRITES_SECONDS
+)
+
+
+def get_token_subject(headers: Iterable[tuple[bytes, bytes]]) -> str | None:
+    """
+    The username of the bearer token in the ASGI `headers`. The signature
+    is not verified, it only chooses where the reads go.
+    """
+    for name, value in headers:
+        if name == b'authorization':
+            scheme, _, token = value.decode('latin-1').partition(' ')
+            if scheme.lower() != 'bearer':
+                return None
+            try:
+                return jwt.get_unverified_claims(token).get('sub')
+            except JWTError:
+                return None
+    return None
+
+
+@event.listens_for(engine, 'after_cursor_execute')
+@event.listens_for(async_engine.sync_engine, 'after_cursor_execute')
+def collect_request_write(conn, cursor, statement, parameters, context, many):
+    if context.isinsert or context.isupdate or context.isdelete:
+        conn.info['request_wrote'] = True
+
+
+@event.listens_for(engine, 'commit')
+@event.listens_for(async_engine.sync_engine, 'commit')
+def mark_recent_writer(conn):
+    """Sends the reads of the user of the request to the primary for a while"""
+    stats = get_current_stats()
+    if conn.info.pop('request_wrote', False) and stats and stats.scope:
+        subject = get_token_subject(stats.scope.get('headers', ()))
+        if subject is not None:
+            recent_writers.set(subject, True)
+
+
+@event.listens_for(engine, 'rollback')
+@event.listens_for(async_engine.sync_engine, 'rollback')
+def discard_request_write(conn):
+    conn.info.pop('request_wrote', None)
+
+
+def get_dialect_insert(dialect_name: str):
+    """
+    Returns the `insert` construct of the dialect, unlike the generic one
+    it supports `ON CONFLICT` (`on_conflict_do_nothing`/`do_update`).
+    """
+    inserts = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+    try:
+        return inserts[dialect_name]
+    except KeyError:
+        raise NotImplementedError(f'ON CONFLICT not supported: {dialect_name}')
+
+
+def get_pool_stats() -> dict:
+    """The connections of each engine pool, see also the /metrics gauges"""
+    methods = {
+        'size': 'size',
+        'checked_in': 'checkedin',
+        'checked_out': 'checkedout',
+        'overflow': 'overflow',
+    }
+    engines = {'sync': engine, 'async': async_engine.sync_engine} | {
+        f'replica{index}': replica.sync_engine
+        for index, replica in enumerate(replicas.engines)
+    }
+
+    stats = {}
+    for name, sync_engine in engines.items():
+        pool = sync_engine.pool
+        stats[name] = {'pool': type(pool).__name__} | {
+            key: getattr(pool, method)()
+            for key, method in methods.items()
+            if hasattr(pool, method)
+        }
+    for index, replica in enumerate(replicas.engines):
+        stats[f'replica{index}']['healthy'] = replica in replicas.healthy
+    return stats
+
+
+def warm_up_pool(connections: int) -> int:
+    """
+    Opens up to `connections` connections of the sync pool at once and
+    returns them to it, so the first requests do not pay the connection
+    setup. Returns how many were opened.
+    """
+    if not isinstance(engine.pool, QueuePool):
+        return 0
+
+    count = min(connections, engine.pool.size())
+    with ExitStack() as stack:
+        for _ in range(count):
+            stack.enter_context(engine.connect())
+    return count
+
+
+async def warm_up_async_pool(connections: int) -> int:
+    """Same as `warm_up_pool` for the async engine"""
+    pool = async_engine.sync_engine.pool
+    if not isinstance(pool, QueuePool):
+        return 0
+
+    count = min(connections, pool.size())
+    async with AsyncExitStack() as stack:
+        for _ in range(count):
+            await stack.enter_async_context(async_engine.connect())
+    return count
+
+
 def get_session():
     with Session(engine) as session:
         yield session
 
 
+async def get_read_session(request: Request):
+    """
+    Session on a read replica, or on the primary when there is no healthy
+    replica or the user of the request wrote something recently. Only for
+    routes that do not write.
+    """
+    read_engine = None
+    if not recent_writers.get(get_token_subject(request.scope['headers'])):
+        read_engine = replicas.pick()
+
+    async with AsyncSession(
+        read_engine or async_engine, expire_on_commit=False
+    ) as session:
+        yield session
+
+
+async def get_async_session():
+    # expire_on_commit=False avoids implicit (blocking) lazy refreshes
+    # when attributes are accessed after a commit
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
 ActiveSession = Depends(get_session)
+ActiveAsyncSession = Depends(get_async_session)
+ReadSession = Depends(get_read_session)
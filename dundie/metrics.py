@@ -0,0 +1,310 @@
+"""Application metrics in the Prometheus text exposition format
+
+The metrics are plain in-process counters, recording a value is a dict
+update under a lock, and they are only formatted when `/metrics` is
+scraped. Durations are measured with `time.perf_counter` (monotonic).
+
+Each process exposes its own metrics, when running several workers every
+worker must be scraped (or use a single worker per container).
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Latency buckets in seconds, from fast cached reads to slow bcrypt calls
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value: str) -> str:
+    return (
+        str(value)
+        .replace('\\', r'\\')
+        .replace('"', r'\"')
+        .replace('\n', r'\n')
+    )
+
+
+def _format_labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+def _format_number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def samples(self) -> list[tuple[str, str, float]]:
+        """Returns `(suffix, formatted labels, value)` of every sample"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.type}',
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(
+                f'{self.name}{suffix}{labels} {_format_number(value)}'
+            )
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing value, e.g. requests served"""
+
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = (
+                self._values.get(label_values, 0) + amount
+            )
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            ('', _format_labels(self.labels, key), value)
+            for key, value in values
+        ]
+
+
+class Gauge(Metric):
+    """
+    Value that goes up and down, e.g. requests in flight. When `function`
+    is passed the value is read from it on every scrape instead.
+    """
+
+    type = 'gauge'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels=(),
+        function: Callable[[], dict[tuple, float]] | None = None,
+    ):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple, float] = {}
+        self._function = function
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = (
+                self._values.get(label_values, 0) + amount
+            )
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value: float, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def samples(self):
+        if self._function is not None:
+            values = list(self._function().items())
+        else:
+            with self._lock:
+                values = list(self._values.items())
+        return [
+            ('', _format_labels(self.labels, key), value)
+            for key, value in values
+        ]
+
+
+class Histogram(Metric):
+    """Distribution of observed values, e.g. request durations"""
+
+    type = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels=(),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket (+Inf last), sum]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [
+                    [0] * (len(self.buckets) + 1), 0.0
+                ]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = [
+                (key, list(counts), total)
+                for key, (counts, total) in self._values.items()
+            ]
+
+        samples = []
+        names = self.labels + ('le',)
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(
+                    names, key + (_format_number(float(bound)),)
+                )
+                samples.append(('_bucket', labels, cumulative))
+            labels = _format_labels(self.labels, key)
+            samples.append(('_sum', labels, total))
+            samples.append(('_count', labels, cumulative))
+        return samples
+
+
+registry: list[Metric] = []
+
+
+def render() -> str:
+    """Returns every registered metric in the text exposition format"""
+    return '\n'.join(metric.render() for metric in registry) + '\n'
+
+
+# * HTTP
+REQUEST_DURATION = Histogram(
+    'dundie_http_request_duration_seconds',
+    'HTTP request duration by route template',
+    labels=('method', 'route'),
+)
+REQUESTS = Counter(
+    'dundie_http_requests_total',
+    'HTTP requests by route template and status code',
+    labels=('method', 'route', 'status'),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'dundie_http_requests_in_flight',
+    'HTTP requests being served',
+)
+
+# * Password hashing
+HASHING_DURATION = Histogram(
+    'dundie_hashing_duration_seconds',
+    'bcrypt call duration, including the time queued for a worker',
+    labels=('operation',),
+)
+HASHING_REJECTED = Counter(
+    'dundie_hashing_rejected_total',
+    'bcrypt calls refused because the hashing pool was saturated',
+)
+
+# * Database connection pool
+DB_POOL_CHECKOUTS = Counter(
+    'dundie_db_pool_checkouts_total',
+    'Connections checked out from the pool',
+    labels=('engine',),
+)
+DB_POOL_WAIT = Histogram(
+    'dundie_db_pool_wait_seconds',
+    'Time waited to check out a connection from the pool',
+    labels=('engine',),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+
+# Engines whose pool state is reported, see `instrument_engine`
+_engines = {}
+
+
+def _pool_state(method: str) -> Callable[[], dict[tuple, float]]:
+    def read():
+        return {
+            (name,): getattr(engine.pool, method)()
+            for name, engine in _engines.items()
+            if hasattr(engine.pool, method)
+        }
+
+    return read
+
+
+DB_POOL_SIZE = Gauge(
+    'dundie_db_pool_size',
+    'Connections kept by the pool',
+    labels=('engine',),
+    function=_pool_state('size'),
+)
+DB_POOL_CHECKED_IN = Gauge(
+    'dundie_db_pool_checked_in',
+    'Idle connections in the pool',
+    labels=('engine',),
+    function=_pool_state('checkedin'),
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    'dundie_db_pool_checked_out',
+    'Connections currently checked out from the pool',
+    labels=('engine',),
+    function=_pool_state('checkedout'),
+)
+DB_POOL_OVERFLOW = Gauge(
+    'dundie_db_pool_overflow',
+    'Connections opened beyond the pool size (negative while below it)',
+    labels=('engine',),
+    function=_pool_state('overflow'),
+)
+
+
+def instrument_engine(engine: Engine, name: str):
+    """
+    Records the pool checkouts and the time waited for them. `engine` is a
+    sync `Engine`, pass `async_engine.sync_engine` for async engines.
+    """
+    _engines[name] = engine
+
+    @event.listens_for(engine, 'checkout')
+    def count_checkout(dbapi_connection, connection_record, proxy):
+        DB_POOL_CHECKOUTS.inc(name)
+
+    # The pool has no event before waiting, so the wait is measured by
+    # wrapping `Pool.connect`, the method used by the engine to check out
+    pool = engine.pool
+    connect = pool.connect
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - start, name)
+
+    pool.connect = timed_connect
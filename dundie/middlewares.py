@@ -1,5 +1,17 @@
+import logging
+import time
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from dundie.config import settings
+from dundie.metrics import REQUEST_DURATION, REQUESTS, REQUESTS_IN_FLIGHT
+from dundie.query_stats import collect_query_stats
+from dundie.serialization import negotiate_format
+
+logger = logging.getLogger('dundie.query_stats')
 
 
 # !
@@ -31,5 +43,120 @@ def configure_cors_dev(app: FastAPI):
     )
 
 
+class MetricsMiddleware:
+    """
+    Records the duration, status and in-flight count of HTTP requests.
+
+    It is a plain ASGI middleware (no `BaseHTTPMiddleware` task and body
+    streaming overhead). Requests are labelled by the matched route template
+    (`/post/{post_id}/like`), not the raw path, so ids do not create new
+    series, unmatched paths share the `unmatched` label.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec()
+
+            # The router stores the matched route in the (shared) scope
+            route = scope.get('route')
+            template = getattr(route, 'path', 'unmatched')
+            REQUEST_DURATION.observe(duration, scope['method'], template)
+            REQUESTS.inc(scope['method'], template, str(status))
+
+
+class QueryStatsMiddleware:
+    """
+    Counts the SQL statements of each request and the time spent on them.
+
+    With `headers` the counters are sent as `X-DB-Queries` and `X-DB-Time`
+    (milliseconds, up to the response start). Statements executed at least
+    `repeated_threshold` times in one request are logged as a likely N+1.
+    """
+
+    def __init__(
+        self, app: ASGIApp, headers: bool = False, repeated_threshold: int = 5
+    ):
+        self.app = app
+        self.headers = headers
+        self.repeated_threshold = repeated_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        with collect_query_stats(scope) as stats:
+
+            async def send_with_stats(message: Message):
+                if self.headers and message['type'] == 'http.response.start':
+                    headers = MutableHeaders(scope=message)
+                    headers.append('X-DB-Queries', str(stats.count))
+                    duration = f'{stats.duration * 1000:.2f}'
+                    headers.append('X-DB-Time', duration)
+                await send(message)
+
+            await self.app(scope, receive, send_with_stats)
+
+        for statement, count in stats.repeated(self.repeated_threshold):
+            logger.warning(
+                'Possible N+1 on %s: statement executed %s times: %s',
+                stats.route, count, ' '.join(statement.split()),
+            )
+
+
+class ContentNegotiationMiddleware:
+    """
+    Makes the `Accept` header of the request available to the routes
+    returning `serialized_response`, which encode their data as MessagePack
+    when it is asked for. Their responses get `Vary: Accept`, JSON ones
+    included, so HTTP caches keep the formats apart.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        accept = Headers(scope=scope).get('accept', '')
+        with negotiate_format(accept) as negotiation:
+
+            async def send_with_vary(message: Message):
+                if (
+                    negotiation.used
+                    and message['type'] == 'http.response.start'
+                ):
+                    MutableHeaders(scope=message).add_vary_header('Accept')
+                await send(message)
+
+            await self.app(scope, receive, send_with_vary)
+
+
 def configure(app: FastAPI):
     configure_cors_dev(app=app)
+    app.add_middleware(
+        QueryStatsMiddleware,
+        headers=settings.query_stats.HEADERS,
+        repeated_threshold=settings.query_stats.REPEATED_THRESHOLD,
+    )
+    app.add_middleware(ContentNegotiationMiddleware)
+    app.add_middleware(MetricsMiddleware)
@@ -5,6 +5,7 @@ from .user import User
 from .posts import Post, LikedPosts
 from .others import Feedbacks
 from .shop import Products, Orders
+from .job import Job
 
 __all__ = [
     'User',
@@ -16,4 +17,5 @@ __all__ = [
     'Products',
     'Feedbacks',
     'Orders',
+    'Job',
 ]
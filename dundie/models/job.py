@@ -0,0 +1,28 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import JSON, Index
+from sqlmodel import Field, SQLModel
+from dundie.utils.utils import get_utcnow
+
+
+class Job(SQLModel, table=True):
+    """A background job run by `dundie worker`, see `dundie.tasks.queue`"""
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    task: str = Field(max_length=255, nullable=False)
+    # Keyword arguments of the task
+    payload: dict = Field(default_factory=dict, sa_type=JSON, nullable=False)
+    # "queued", "running" or "failed", succeeded jobs are deleted
+    status: str = Field(default="queued", max_length=20, nullable=False)
+    attempts: int = Field(default=0, nullable=False)
+    max_attempts: int = Field(default=5, nullable=False)
+    # Not run before this date, pushed forward by each retry
+    run_at: datetime = Field(default_factory=get_utcnow, nullable=False)
+    locked_by: Optional[str] = Field(default=None, max_length=255)
+    locked_at: Optional[datetime] = Field(default=None)
+    last_error: Optional[str] = Field(default=None)
+    created_at: datetime = Field(default_factory=get_utcnow, nullable=False)
+
+    # Workers claim the oldest due queued job, see `get_due_jobs_stmt`
+    __table_args__ = (Index('ix_job_status_run_at', 'status', 'run_at'),)
@@ -2,7 +2,7 @@ from datetime import datetime
 from typing import TYPE_CHECKING, Optional
 
 from sqlmodel import Field, Relationship, SQLModel
-from sqlalchemy import ForeignKeyConstraint
+from sqlalchemy import ForeignKeyConstraint, Index
 from dundie.utils.utils import get_utcnow
 
 if TYPE_CHECKING:
@@ -26,6 +26,12 @@ class Post(SQLModel, table=True):
         },
     )
 
+    # The feed sorts, see `get_sorted_posts_stmt`
+    __table_args__ = (
+        Index('ix_post_likes_id', 'likes', 'id'),
+        Index('ix_post_date_id', 'date', 'id'),
+    )
+
 
 class LikedPosts(SQLModel, table=True):
     """Represents posts liked by a user."""
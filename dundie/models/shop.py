@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import Optional
 
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 from dundie.utils.utils import get_utcnow
 
@@ -15,7 +16,8 @@ class Products(SQLModel, table=True):
     updated_at: datetime = Field(
         default_factory=get_utcnow,
         nullable=False,
-        sa_column_kwargs={"onupdate": get_utcnow}
+        sa_column_kwargs={"onupdate": get_utcnow},
+        index=True,
     )
 
 
@@ -26,9 +28,12 @@ class Orders(SQLModel, table=True):
     product: str = Field(max_length=255, nullable=False)
     product_img: str = Field(nullable=False)
     name: str = Field(max_length=255, nullable=False)
-    status: str = Field(default="pending", nullable=False, index=True)
+    status: str = Field(default="pending", nullable=False)
     created_at: datetime = Field(
         default_factory=get_utcnow,
         nullable=False,
         index=True
     )
+
+    # Orders are listed by status, `id` makes the order unique for paging
+    __table_args__ = (Index('ix_orders_status_id', 'status', 'id'),)
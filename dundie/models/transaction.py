@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import TYPE_CHECKING, Optional
 
+from sqlalchemy import Index
 from sqlmodel import Field, Relationship, SQLModel
 
 from dundie.utils.utils import get_utcnow
@@ -33,6 +34,13 @@ class Transaction(SQLModel, table=True):
         },
     )
 
+    # A user transactions are `user_id = :id OR from_id = :id` sorted by
+    # date, each side of the OR is served by one of these indexes
+    __table_args__ = (
+        Index('ix_transaction_user_id_date', 'user_id', 'date', 'id'),
+        Index('ix_transaction_from_id_date', 'from_id', 'date', 'id'),
+    )
+
     def transfer_points(self):
         print("TRANSFER_POINTS_CHECK")
 
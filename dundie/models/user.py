@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import TYPE_CHECKING, Optional
 
+from sqlalchemy import DDL, Index, event, text
 from sqlmodel import Field, Relationship, SQLModel
 
 from dundie.security import HashedPassword
@@ -29,6 +30,11 @@ class User(SQLModel, table=True):
     instagram: Optional[str] = None
     currency: str = Field(nullable=False)
     created_at: datetime = Field(default_factory=get_utcnow, nullable=False)
+    updated_at: datetime = Field(
+        default_factory=get_utcnow,
+        nullable=False,
+        sa_column_kwargs={"onupdate": get_utcnow},
+    )
     is_active: bool = Field(default=True, nullable=False)
     private: bool = Field(default=False, nullable=False)
     last_password_change: Optional[datetime] = Field(default=None)
@@ -58,6 +64,25 @@ class User(SQLModel, table=True):
         }
     )
 
+    # Active public users, listed by /user and searched by /user/names.
+    # The search is `username LIKE '%q%'`, postgres serves it with a trigram
+    # index, sqlite scans the listed users partial index instead of the table
+    __table_args__ = (
+        Index(
+            'ix_user_listed',
+            'id',
+            postgresql_where=text('is_active AND NOT private'),
+            sqlite_where=text('is_active = 1 AND private = 0'),
+        ),
+        Index(
+            'ix_user_listed_username_trgm',
+            'username',
+            postgresql_using='gin',
+            postgresql_ops={'username': 'gin_trgm_ops'},
+            postgresql_where=text('is_active AND NOT private'),
+        ).ddl_if(dialect='postgresql'),
+    )
+
     @property
     def balance(self) -> int:
         """Returns the current balance of the user"""
@@ -66,3 +91,13 @@ class User(SQLModel, table=True):
     @property
     def superuser(self):
         return self.dept == 'management'
+
+
+# The trigram index operators come from the pg_trgm extension
+event.listen(
+    User.__table__,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(
+        dialect='postgresql'
+    ),
+)
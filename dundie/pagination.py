@@ -0,0 +1,217 @@
+"""Pagination helpers: keyset (cursor) pagination and cached page totals
+
+The cursor is an opaque token holding the sort values of the last item of a
+page, the next page is selected with `WHERE (sort columns) > (cursor)`
+instead of an OFFSET, so it costs the same at any depth and does not skip or
+repeat items when rows are inserted between requests.
+
+The ORDER BY of a paginated query must end with a unique column (usually
+the primary key) so the cursor points to exactly one row.
+"""
+
+from math import ceil
+from typing import Generic, TypeVar
+
+from fastapi import Depends, Query
+from fastapi_pagination import Page, Params
+from fastapi_pagination.api import pagination_ctx
+from fastapi_pagination.bases import CursorRawParams, RawParams
+from fastapi_pagination.cursor import (
+    CursorPage as BaseCursorPage,
+    CursorParams as BaseCursorParams,
+    decode_cursor,
+)
+from fastapi_pagination.ext.sqlalchemy import create_count_query
+from fastapi_pagination.ext.sqlmodel import paginate
+from sqlalchemy import Table, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.util import find_tables
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import Select
+
+from dundie.config import settings
+from dundie.utils.cache import TTLCache
+
+T = TypeVar('T')
+
+
+class CursorParams(BaseCursorParams):
+    """Cursor params, the total count is only computed when requested"""
+
+    include_total: bool = Query(
+        False, description='Counts the total items (costs a COUNT query)'
+    )
+
+    def to_raw_params(self) -> CursorRawParams:
+        return CursorRawParams(
+            cursor=decode_cursor(self.cursor, to_str=self.str_cursor),
+            size=self.size,
+            include_total=self.include_total,
+        )
+
+
+class CursorPage(BaseCursorPage[T], Generic[T]):
+    """Page of items selected by a cursor, see `CursorParams`"""
+
+    __params_type__ = CursorParams
+
+
+# Cursor params dependency, also makes `paginate` build a `CursorPage`
+CursorPaginated = Depends(pagination_ctx(CursorPage))
+
+
+# * Offset pagination with cached totals
+#
+# `paginate` runs a `COUNT(*)` over the whole filtered query for every page,
+# usually costing more than the page itself. `paginate_counted` caches the
+# total by the normalized count statement and its parameters, the entries of
+# a table are dropped when a transaction inserting or deleting rows of it
+# commits (see `track_table_writes`) and otherwise expire after the TTL.
+#
+# On PostgreSQL, once the largest table of the query has more rows than
+# `pagination.COUNT_ESTIMATE_THRESHOLD`, the planner estimate is returned
+# instead of counting: `pg_class.reltuples` for a whole table, the `EXPLAIN`
+# row estimate for a filtered query.
+
+count_cache = TTLCache(
+    maxsize=settings.pagination.COUNT_CACHE_MAX_SIZE,
+    ttl=settings.pagination.COUNT_CACHE_TTL_SECONDS,
+)
+
+
+class PageParams(Params):
+    """Page params, the total count can be skipped with `include_total`"""
+
+    include_total: bool = Query(
+        True, description='Counts the total items and pages'
+    )
+
+    def to_raw_params(self) -> RawParams:
+        # The total is set by `paginate_counted`, never counted by `paginate`
+        return RawParams(
+            limit=self.size,
+            offset=self.size * (self.page - 1),
+            include_total=False,
+        )
+
+
+def invalidate_counts(*tables: str) -> int:
+    """Drops the cached totals of queries reading any of `tables`"""
+    tables = set(tables)
+    return count_cache.invalidate(lambda key: not tables.isdisjoint(key[0]))
+
+
+def track_table_writes(engine: Engine):
+    """
+    Invalidates the cached totals of the tables receiving inserts or
+    deletes through `engine`, when the transaction commits. `engine` is a
+    sync `Engine`, pass `async_engine.sync_engine` for async engines.
+    """
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def collect_written_table(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        if not (context.isinsert or context.isdelete):
+            return
+        statement = getattr(context.compiled, 'statement', None)
+        table = getattr(statement, 'table', None)
+        if isinstance(table, Table):
+            conn.info.setdefault('written_tables', set()).add(table.name)
+
+    @event.listens_for(engine, 'commit')
+    def invalidate_written_tables(conn):
+        tables = conn.info.pop('written_tables', None)
+        if tables:
+            invalidate_counts(*tables)
+
+    @event.listens_for(engine, 'rollback')
+    def discard_written_tables(conn):
+        conn.info.pop('written_tables', None)
+
+
+def estimate_count(
+    session: Session, query: Select, tables: list[Table]
+) -> int | None:
+    """
+    Returns the PostgreSQL planner estimate of the rows of `query`, or None
+    when not on PostgreSQL or the tables are below the estimate threshold.
+    """
+    if session.bind.dialect.name != 'postgresql':
+        return None
+
+    reltuples = dict(
+        session.exec(
+            text(
+                'SELECT relname, reltuples::bigint FROM pg_class '
+                'WHERE oid = ANY(CAST(:tables AS regclass[]))'
+            ).bindparams(tables=[table.name for table in tables])
+        ).all()
+    )
+    # reltuples is -1 for tables never vacuumed or analyzed
+    if max(reltuples.values(), default=-1) <= (
+        settings.pagination.COUNT_ESTIMATE_THRESHOLD
+    ):
+        return None
+
+    if len(tables) == 1 and query.whereclause is None:
+        return reltuples[tables[0].name]
+
+    compiled = query.order_by(None).compile(
+        dialect=session.bind.dialect,
+        compile_kwargs={'literal_binds': True},
+    )
+    plan = session.connection().exec_driver_sql(
+        f'EXPLAIN (FORMAT JSON) {compiled}'
+    ).scalar()
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_total(session: Session, query: Select) -> int:
+    """Returns the (cached) number of rows selected by `query`"""
+    tables = find_tables(query, include_joins=True)
+    tables = [table for table in tables if isinstance(table, Table)]
+    count_query = create_count_query(query)
+
+    compiled = count_query.compile(dialect=session.bind.dialect)
+    key = (
+        frozenset(table.name for table in tables),
+        str(compiled),
+        tuple(sorted((name, repr(value))
+              for name, value in compiled.params.items())),
+    )
+
+    total = count_cache.get(key)
+    if total is None:
+        total = estimate_count(session, query, tables)
+        if total is None:
+            total = session.scalar(count_query)
+        count_cache.set(key, total)
+    return total
+
+
+def set_page_total(page: Page, total: int) -> Page:
+    page.total = total
+    page.pages = ceil(total / page.size) if page.size else None
+    return page
+
+
+def paginate_counted(
+    session: Session, query: Select, params: PageParams, **kwargs
+) -> Page:
+    """`paginate` counting the total through `count_total`"""
+    page = paginate(session, query, params, **kwargs)
+    if params.include_total:
+        set_page_total(page, count_total(session, query))
+    return page
+
+
+async def paginate_counted_async(
+    session: AsyncSession, query: Select, params: PageParams, **kwargs
+) -> Page:
+    """Same as `paginate_counted` for async sessions"""
+    page = await paginate(session, query, params, **kwargs)
+    if params.include_total:
+        set_page_total(page, await session.run_sync(count_total, query))
+    return page
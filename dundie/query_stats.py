@@ -0,0 +1,100 @@
+"""Per-request SQL statements count and time
+
+`track_queries` hooks the engine cursor events, the statements executed
+while a `collect_query_stats()` block is active (the request in the
+`QueryStatsMiddleware`, or a test) are added to its `QueryStats`.
+
+The stats are held in a context variable, so concurrent requests never mix
+and the sync routes and dependencies running in the threadpool (which gets
+a copy of the request context) still record to the request stats.
+"""
+
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+@dataclass
+class QueryStats:
+    """Statements executed and the time spent on them, in seconds"""
+
+    count: int = 0
+    duration: float = 0.0
+    # Executions of each statement, the SQL text keeps the bind parameters
+    # as placeholders so it is the same for every execution of a query
+    statements: Counter = field(default_factory=Counter)
+    # ASGI scope of the request the statements belong to
+    scope: dict | None = None
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """
+        Statements executed at least `threshold` times, most repeated first.
+        The same query run once per item of a list is the N+1 pattern.
+        """
+        return [
+            (statement, count)
+            for statement, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+    @property
+    def route(self) -> str | None:
+        """`METHOD /route/{template}` of the request, None outside one"""
+        if self.scope is None:
+            return None
+        # The router stores the matched route in the scope
+        route = self.scope.get('route')
+        path = getattr(route, 'path', self.scope.get('path'))
+        return f'{self.scope.get("method")} {path}'
+
+
+_current_stats: ContextVar[QueryStats | None] = ContextVar(
+    'query_stats', default=None
+)
+
+
+def get_current_stats() -> QueryStats | None:
+    return _current_stats.get()
+
+
+@contextmanager
+def collect_query_stats(scope: dict | None = None):
+    """Collects the statements executed inside the block"""
+    stats = QueryStats(scope=scope)
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+def track_queries(engine: Engine):
+    """
+    Records the statements executed through `engine` into the active
+    `QueryStats`. `engine` is a sync `Engine`, pass
+    `async_engine.sync_engine` for async engines.
+    """
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query_timer(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        if _current_stats.get() is not None:
+            context.query_start = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def record_query(conn, cursor, statement, parameters, context, many):
+        stats = _current_stats.get()
+        start = getattr(context, 'query_start', None)
+        if stats is not None and start is not None:
+            stats.record(statement, time.perf_counter() - start)
@@ -0,0 +1,315 @@
+"""Response cache of hot read routes
+
+    @router.get('/shop/products', response_model=list[ProductResponse])
+    @cache_response(ttl=60, tags=('products',))
+    async def get_products(...):
+
+The decorated endpoint runs after its dependencies, so authentication and
+permissions are checked on every request, only the endpoint itself (and
+the serialization of its result) is skipped on a hit. The cached value is
+the serialized body, served as is.
+
+Entries are keyed by the route, the query string and, per route, the user
+(`per_user`) and the `vary` request headers. The write paths drop the
+entries of the data they change with `invalidate_responses(tag)`, or
+`await invalidate_responses_async(tag)` on the event loop. A response
+rendered while one of its tags is invalidated (it may have read the data
+from before the write) is served but not cached, this is only detected
+for the invalidations made by the same process.
+
+When an entry is missing, the concurrent requests for it share a single
+run of the endpoint (see `SingleFlight`) instead of all of them querying
+the database, as happens when a popular entry expires.
+
+The `memory` backend is local to each process, the invalidations made by a
+process (or by the CLI) do not reach the others until the TTL expires. The
+`redis` backend (needs the `redis` package) is shared by every process.
+"""
+
+import functools
+import inspect
+
+from fastapi import Request, Response
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.routing import serialize_response
+from starlette.concurrency import run_in_threadpool
+
+from dundie.config import settings
+from dundie.db import get_token_subject
+from dundie.metrics import Counter
+from dundie.utils.cache import TTLCache
+from dundie.utils.singleflight import SingleFlight
+
+RESPONSE_CACHE = Counter(
+    'dundie_response_cache_total',
+    'Cached routes requests by result (hit or miss)',
+    labels=('route', 'result'),
+)
+
+
+class MemoryBackend:
+    """Least recently used entries of this process"""
+
+    # Calls do not block, they run on the event loop
+    blocking = False
+
+    def __init__(self, maxsize: int):
+        self._cache = TTLCache(maxsize=maxsize)
+
+    def get(self, key: str) -> bytes | None:
+        return self._cache.get(key)
+
+    def set(self, key: str, body: bytes, ttl: float, tags: tuple[str, ...]):
+        self._cache.set(key, body, ttl=ttl)
+
+    def invalidate(self, tag: str) -> int:
+        # The keys start with the tags of the route, see `get_cache_key`
+        return self._cache.invalidate(
+            lambda key: tag in key.split('|', 1)[0].split(',')
+        )
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+class RedisBackend:
+    """Entries shared by every process, each tag is a set of its keys"""
+
+    # Calls are network round trips, they run in the threadpool
+    blocking = True
+
+    def __init__(self, url: str):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> bytes | None:
+        return self._redis.get(f'response:{key}')
+
+    def set(self, key: str, body: bytes, ttl: float, tags: tuple[str, ...]):
+        pipeline = self._redis.pipeline()
+        pipeline.set(f'response:{key}', body, px=int(ttl * 1000))
+        for tag in tags:
+            pipeline.sadd(f'response-tag:{tag}', f'response:{key}')
+        pipeline.execute()
+
+    def invalidate(self, tag: str) -> int:
+        keys = self._redis.smembers(f'response-tag:{tag}')
+        pipeline = self._redis.pipeline()
+        if keys:
+            pipeline.delete(*keys)
+        pipeline.delete(f'response-tag:{tag}')
+        pipeline.execute()
+        return len(keys)
+
+    def clear(self):
+        for pattern in ('response:*', 'response-tag:*'):
+            for key in self._redis.scan_iter(pattern):
+                self._redis.delete(key)
+
+    def stats(self) -> dict:
+        return {'backend': 'redis'}
+
+
+def create_backend():
+    if settings.response_cache.BACKEND == 'redis':
+        return RedisBackend(settings.response_cache.REDIS_URL)
+    return MemoryBackend(settings.response_cache.MAX_SIZE)
+
+
+backend = create_backend()
+# Misses of the same entry running at once, only the first runs the endpoint
+_flights = SingleFlight()
+# Hits and misses by route template, for `get_response_cache_stats`
+_counts: dict[str, dict[str, int]] = {}
+# Invalidations of each tag made by this process
+_generations: dict[str, int] = {}
+
+
+async def _call_backend(method, *args):
+    if backend.blocking:
+        return await run_in_threadpool(method, *args)
+    return method(*args)
+
+
+def get_generation(tags: tuple[str, ...]) -> tuple[int, ...]:
+    return tuple(_generations.get(tag, 0) for tag in tags)
+
+
+def _bump_generations(tags: tuple[str, ...]):
+    for tag in tags:
+        _generations[tag] = _generations.get(tag, 0) + 1
+
+
+def invalidate_responses(*tags: str):
+    """
+    Drops the cached responses of the routes with any of the `tags`. With
+    the redis backend it blocks, use `invalidate_responses_async` on the
+    event loop.
+    """
+    _bump_generations(tags)
+    for tag in tags:
+        backend.invalidate(tag)
+
+
+async def invalidate_responses_async(*tags: str):
+    """Same as `invalidate_responses`, the blocking backends in a thread"""
+    _bump_generations(tags)
+    for tag in tags:
+        await _call_backend(backend.invalidate, tag)
+
+
+def get_response_cache_stats() -> dict:
+    """The backend counters and the hit ratio of each cached route"""
+    routes = {}
+    for route, counts in list(_counts.items()):
+        total = counts['hit'] + counts['miss']
+        routes[route] = counts | {'hit_ratio': round(counts['hit'] / total, 4)}
+    return {
+        'backend': backend.stats(),
+        'flights': _flights.stats(),
+        'routes': routes,
+    }
+
+
+def _record(route: str, result: str):
+    RESPONSE_CACHE.inc(route, result)
+    counts = _counts.setdefault(route, {'hit': 0, 'miss': 0})
+    counts[result] += 1
+
+
+def get_response_class(route) -> type[Response]:
+    response_class = route.response_class
+    if isinstance(response_class, DefaultPlaceholder):
+        return response_class.value
+    return response_class
+
+
+def inject_param(
+    signature: inspect.Signature, name: str, annotation: type
+) -> tuple[inspect.Signature, str, bool]:
+    """
+    Adds a keyword-only `name: annotation` parameter to an endpoint
+    signature, for FastAPI to inject the `Request` or `Response` into a
+    decorator wrapper. FastAPI injects a single parameter of each of these
+    types, so an existing one is reused.
+
+    Returns the signature, the parameter name and whether it was added.
+    """
+    for parameter in signature.parameters.values():
+        if parameter.annotation is annotation:
+            return signature, parameter.name, False
+
+    parameter = inspect.Parameter(
+        name, inspect.Parameter.KEYWORD_ONLY, annotation=annotation
+    )
+    parameters = [*signature.parameters.values(), parameter]
+    return signature.replace(parameters=parameters), name, True
+
+
+def get_cache_key(
+    request: Request,
+    per_user: bool,
+    vary: tuple[str, ...],
+    tags: tuple[str, ...],
+) -> str:
+    route = request.scope['route']
+    parts = [
+        ','.join(tags),
+        route.path,
+        '&'.join(sorted(request.url.query.split('&'))),
+    ]
+    if per_user:
+        parts.append(get_token_subject(request.scope['headers']) or '')
+    parts += [request.headers.get(header, '') for header in vary]
+    # Set by `conditional_response`, each version has its own entry
+    parts.append(getattr(request.state, 'etag', ''))
+    return '|'.join(parts)
+
+
+def cache_response(
+    ttl: float,
+    *,
+    per_user: bool = False,
+    vary: tuple[str, ...] = (),
+    tags: tuple[str, ...] = (),
+):
+    """
+    Caches the successful responses of the decorated endpoint for `ttl`
+    seconds, see the module docstring. Put it below the route decorator.
+
+    per_user: each authenticated user has its own entry
+    vary: request headers whose values select different entries
+    tags: names passed to `invalidate_responses` by the write paths
+    """
+
+    def decorator(endpoint):
+        signature, request_name, added = inject_param(
+            inspect.signature(endpoint), 'cache_request', Request
+        )
+
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            # The added parameter is not one of the endpoint
+            get = kwargs.pop if added else kwargs.get
+            cache_request = get(request_name)
+            route = cache_request.scope['route']
+            response_class = get_response_class(route)
+            key = get_cache_key(cache_request, per_user, vary, tags)
+            headers = {'X-Cache': 'HIT'}
+            if vary:
+                headers['Vary'] = ', '.join(vary)
+
+            body = await _call_backend(backend.get, key)
+            if body is not None:
+                _record(route.path, 'hit')
+                return Response(
+                    body,
+                    media_type=response_class.media_type,
+                    headers=headers,
+                )
+
+            _record(route.path, 'miss')
+            result = await _flights.do(
+                key, render, route, response_class, key, args, kwargs
+            )
+            if isinstance(result, Response):
+                return result
+
+            headers['X-Cache'] = 'MISS'
+            return Response(
+                result, media_type=response_class.media_type, headers=headers
+            )
+
+        async def render(route, response_class, key, args, kwargs):
+            """
+            Runs the endpoint and caches the body it returned, unless its
+            tags were invalidated meanwhile
+            """
+            generation = get_generation(tags)
+            result = await endpoint(*args, **kwargs)
+            if isinstance(result, Response):
+                return result
+
+            content = await serialize_response(
+                field=route.response_field,
+                response_content=result,
+                include=route.response_model_include,
+                exclude=route.response_model_exclude,
+                by_alias=route.response_model_by_alias,
+                exclude_unset=route.response_model_exclude_unset,
+                exclude_defaults=route.response_model_exclude_defaults,
+                exclude_none=route.response_model_exclude_none,
+            )
+            body = response_class(content).body
+            if get_generation(tags) == generation:
+                await _call_backend(backend.set, key, body, ttl, tags)
+            return body
+
+        wrapper.__signature__ = signature
+        return wrapper
+
+    return decorator
@@ -1,25 +1,59 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi_pagination import Page, Params
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi_pagination import Page
 from fastapi_pagination.ext.sqlmodel import paginate
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
 import re
 from dundie.utils.utils import (
     apply_product_patch,
     check_password_complexity,
     get_utcnow,
 )
-from dundie.auth.functions import SuperUser
+from dundie.auth.functions import (
+    SuperUser,
+    invalidate_cached_user,
+    user_cache,
+)
 from dundie.config import settings
 from dundie.utils.utils import apply_user_patch, verify_admin_password_header
 from dundie.controllers import create_user_and_balance
-from dundie.db import ActiveSession
-from dundie.models import User, Orders, Products
-from dundie.security import verify_password
+from dundie.controllers.ranking import update_ranking_profile
+from dundie.controllers.search import update_user_search
+from dundie.controllers.shop import get_orders_stmt
+from dundie.controllers.transaction import bulk_transfer_points
+from dundie.controllers.user import build_admin_user_items
+from dundie.db import ActiveAsyncSession, ActiveSession, get_pool_stats
+from dundie.pagination import (
+    CursorPage,
+    CursorPaginated,
+    CursorParams,
+    PageParams,
+    invalidate_counts,
+    paginate_counted,
+)
+from dundie.models import User, Products
+from dundie.security import (
+    HashedPassword,
+    get_password_hash_async,
+    verify_password_async,
+)
+from dundie.response_cache import (
+    get_response_cache_stats,
+    invalidate_responses_async,
+)
+from dundie.serialization import serialized_response
+from dundie.slow_queries import read_slow_queries
+from dundie.tasks.queue import get_queue_stats
 from dundie.serializers.admin import (
     UserAdminResponse,
     UserChangeVisibilityRequest,
     FullUserPatchRequest,
 )
+from dundie.serializers.transaction import (
+    BulkTransferRequest,
+    BulkTransferResponse,
+)
 from dundie.serializers.user import UserRequest, UserResponse
 from dundie.serializers.shop import (
     ProductRequest,
@@ -39,18 +73,38 @@ router = APIRouter()
 async def list_all_users_in_db(
     *,
     session: Session = ActiveSession,
-    params: Params = Depends(),
+    params: PageParams = Depends(),
 ):
     """Returns a page with a user list"""
 
     query = select(User).order_by(User.name)
     try:
         # Paginates the user list response
-        return paginate(query=query, params=params, session=session)
+        page = paginate_counted(
+            session, query, params, transformer=build_admin_user_items
+        )
     except Exception as e:
         print(e)
+        return {'detail': 'failed to return users'}
+
+    return serialized_response(page)
+
+
+@router.get(
+    '/user/cursor',
+    summary='List all users by cursor [ADMIN]',
+    dependencies=[SuperUser],
+    response_model=CursorPage[UserAdminResponse],
+)
+async def list_all_users_in_db_by_cursor(
+    *,
+    session: Session = ActiveSession,
+    params: CursorParams = CursorPaginated,
+):
+    """Returns a page with a user list using keyset pagination"""
 
-    return {'detail': 'failed to return users'}
+    query = select(User).order_by(User.name, User.id)
+    return paginate(query=query, params=params, session=session)
 
 
 @router.post(
@@ -68,7 +122,7 @@ async def create_new_user_in_db(
 ):
     """Creates a new user in the database"""
 
-    verify_admin_password_header(request, auth_user)
+    await verify_admin_password_header(request, auth_user)
 
     # Checks if there is already a user with that username
     stmt = select(User).where(User.username == new_user_data.username)
@@ -83,7 +137,13 @@ async def create_new_user_in_db(
     if session.exec(stmt).first():
         raise HTTPException(409, 'Email alredy in use')
 
-    db_user = create_user_and_balance(user_data=new_user_data, session=session)
+    # Hashes the password in the hashing pool, the model keeps it as is
+    user_data = new_user_data.model_dump()
+    user_data['password'] = HashedPassword(
+        await get_password_hash_async(new_user_data.password)
+    )
+
+    db_user = create_user_and_balance(user_data=user_data, session=session)
 
     return db_user
 
@@ -101,7 +161,7 @@ async def change_user_visibility_by_username(
     """Changes the visibility of a user by username"""
 
     # check the admin user password
-    is_admin_password_valid = verify_password(
+    is_admin_password_valid = await verify_password_async(
         data.password, current_user.password
     )
 
@@ -118,6 +178,9 @@ async def change_user_visibility_by_username(
         user.is_active = True
         session.add(user)
         session.commit()
+        invalidate_cached_user(data.username)
+        update_user_search(user)
+        invalidate_counts(User.__tablename__)
         return {'detail': f'user {data.username} activated'}
 
     # disable the user if it was enabled
@@ -125,6 +188,9 @@ async def change_user_visibility_by_username(
         user.is_active = False
         session.add(user)
         session.commit()
+        invalidate_cached_user(data.username)
+        update_user_search(user)
+        invalidate_counts(User.__tablename__)
         return {'detail': f'user {data.username} deactivated'}
 
 
@@ -165,7 +231,7 @@ async def update_user_by_username(
     """Updates a user by username"""
 
     # Check if the admin user password is valid
-    is_admin_password_valid = verify_password(
+    is_admin_password_valid = await verify_password_async(
         patch_data.admin_password, admin_user.password
     )
     if not is_admin_password_valid:
@@ -179,13 +245,15 @@ async def update_user_by_username(
 
     if patch_data.new_password:
         # Checks if the new password is the same as the current password
-        if verify_password(patch_data.new_password, user.password):
+        if await verify_password_async(
+            patch_data.new_password, user.password
+        ):
             raise HTTPException(400, 'New password matches the current one')
 
         # Checks if the new password is complex enough
         check_password_complexity(patch_data.new_password)
 
-        user.password = patch_data.hashed_password
+        user.password = await get_password_hash_async(patch_data.new_password)
 
     # ignore passwords from the patch data and apply it to the user
     apply_user_patch(
@@ -200,9 +268,99 @@ async def update_user_by_username(
         print(e)
         raise HTTPException(500, 'An error occurred while updating the user')
 
+    invalidate_cached_user(username)
+    await update_ranking_profile(user)
+    update_user_search(user)
+    invalidate_counts(User.__tablename__)
+
     return {'detail': f'user {username} updated'}
 
 
+@router.post(
+    '/transaction/bulk',
+    summary='Sends points to many users at once [ADMIN]',
+    response_model=BulkTransferResponse,
+)
+async def bulk_transfer_points_to_users(
+    request: Request,
+    data: BulkTransferRequest,
+    *,
+    admin_user: User = SuperUser,
+    session: AsyncSession = ActiveAsyncSession,
+):
+    """
+    Sends points from 'pointsdeliveryman' to every listed user in a single
+    database transaction, requires the admin password in the
+    `X-Admin-Password` header.
+    """
+    await verify_admin_password_header(request, admin_user)
+
+    transfers = {item.username: item.points for item in data.transfers}
+    if len(transfers) != len(data.transfers):
+        raise HTTPException(400, 'Each username must be listed only once')
+
+    return await bulk_transfer_points(transfers, session)
+
+
+@router.get(
+    '/stats/cache',
+    summary='In-process caches statistics [ADMIN]',
+    dependencies=[SuperUser],
+)
+async def get_cache_stats():
+    """Returns the hit/miss counters of the in-process caches"""
+
+    return {
+        'users': user_cache.stats(),
+        'responses': get_response_cache_stats(),
+    }
+
+
+@router.get(
+    '/stats/pool',
+    summary='Database connection pools statistics [ADMIN]',
+    dependencies=[SuperUser],
+)
+async def get_db_pool_stats():
+    """Returns the size and connections in use of each engine pool"""
+
+    return get_pool_stats()
+
+
+@router.get(
+    '/stats/jobs',
+    summary='Background jobs queue statistics [ADMIN]',
+    dependencies=[SuperUser],
+)
+def get_jobs_stats(session: Session = ActiveSession):
+    """
+    Returns the jobs of each task by status and how long the oldest due job
+    has been waiting for `dundie worker`
+    """
+
+    return get_queue_stats(session)
+
+
+@router.get(
+    '/debug/slow-queries',
+    summary='Slow queries log [ADMIN]',
+    dependencies=[SuperUser],
+)
+async def get_slow_queries(
+    limit: int = Query(100, ge=1, le=1000),
+    route: str | None = Query(
+        None, description='Route of the request, e.g. `GET /transaction/list`'
+    ),
+    min_ms: float = Query(0, ge=0, description='Minimum duration'),
+):
+    """
+    Returns the statements slower than `db.SLOW_QUERY_MS` logged by this
+    host, newest first, with the EXPLAIN plan when it was captured.
+    """
+
+    return await run_in_threadpool(read_slow_queries, limit, route, min_ms)
+
+
 @router.get(
     '/shop/orders',
     summary='List all orders [ADMIN]',
@@ -210,14 +368,14 @@ async def update_user_by_username(
 )
 async def get_orders(
     session: Session = ActiveSession,
-    params: Params = Depends(),
+    params: PageParams = Depends(),
 ):
     """Returns all orders"""
 
-    stmt = select(Orders).order_by(Orders.status.desc())
+    stmt = get_orders_stmt()
     try:
         # Paginates the user list response
-        return paginate(query=stmt, params=params, session=session)
+        return paginate_counted(session, stmt, params)
     except Exception as e:
         print(e)
 
@@ -238,7 +396,7 @@ async def create_product(
     """Creates a new product"""
 
     # Check if the admin user password is valid
-    verify_admin_password_header(request, auth_user)
+    await verify_admin_password_header(request, auth_user)
 
     new_product = Products(
         name=product.name,
@@ -256,6 +414,7 @@ async def create_product(
         print(e)
         raise HTTPException(500, 'An error occurred w creating the product')
 
+    await invalidate_responses_async('products')
     return new_product
 
 
@@ -273,7 +432,7 @@ async def update_product(
     """Updates a product"""
 
     # Check if the admin user password is valid
-    verify_admin_password_header(request, auth_user)
+    await verify_admin_password_header(request, auth_user)
 
     stmt = select(Products).where(Products.id == patch_data.id)
     product = session.exec(stmt).first()
@@ -293,6 +452,7 @@ async def update_product(
         print(e)
         raise HTTPException(500, 'An error occurred w updating the product')
 
+    await invalidate_responses_async('products')
     return product
 
 
@@ -309,7 +469,7 @@ async def delete_product(
     """Deletes a product"""
 
     # Check if the admin user password is valid
-    verify_admin_password_header(request, user)
+    await verify_admin_password_header(request, user)
 
     stmt = select(Products).where(Products.id == id)
     product = session.exec(stmt).first()
@@ -324,4 +484,5 @@ async def delete_product(
         print(e)
         raise HTTPException(500, 'An error occurred w deleting the product')
 
+    await invalidate_responses_async('products')
     return {'detail': 'product deleted successfully'}
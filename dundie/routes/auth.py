@@ -1,14 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from dundie.auth.functions import (
     authenticate_user,
     create_both_tokens,
-    get_user,
-    validate_token,
+    get_user_async,
     validate_token_signature,
 )
 from dundie.auth.models import Token
+from dundie.db import ActiveAsyncSession
 from dundie.models.user import User
 from dundie.utils.status import exp401
 
@@ -18,9 +19,12 @@ router = APIRouter()
 @router.post('/token', response_model=Token)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
+    session: AsyncSession = ActiveAsyncSession,
 ):
     """Generate access and refresh tokens for authentication."""
-    user = authenticate_user(get_user, form_data.username, form_data.password)
+    user = await authenticate_user(
+        session, form_data.username, form_data.password
+    )
     if not user or not isinstance(user, User) or not user.is_active:
         raise exp401('Incorrect username or password')
 
@@ -35,7 +39,9 @@ async def login_for_access_token(
 
 
 @router.post('/refresh_token', response_model=Token)
-async def refresh_token(request: Request):
+async def refresh_token(
+    request: Request, session: AsyncSession = ActiveAsyncSession
+):
     """Obtain a new access token using a refresh token."""
 
     token = request.cookies.get('refresh_token') or request.headers.get(
@@ -45,7 +51,10 @@ async def refresh_token(request: Request):
     if not token:
         raise HTTPException(403, 'No refresh token')
 
-    user = await validate_token(token=token)
+    payload = await validate_token_signature(token) or {}
+    user = await get_user_async(payload.get('sub'), session=session)
+    if not user:
+        raise exp401('User not found')
 
     # Generating both access and refresh tokens for the user session
     access_token, refresh_token = create_both_tokens(user)
@@ -1,9 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi_pagination import Page, Params
 from fastapi_pagination.ext.sqlmodel import paginate
 from sqlmodel import Session, select
 from dundie.auth.functions import AuthenticatedUser
 from dundie.db import ActiveSession
+from dundie import metrics
+from dundie.pagination import (
+    CursorPage,
+    CursorPaginated,
+    CursorParams,
+    PageParams,
+    paginate_counted,
+)
 from dundie.models import Feedbacks, User
 from dundie.serializers.others import (
     FeedbackRequest,
@@ -19,19 +28,34 @@ router = APIRouter()
 )
 async def list_feedbacks(
     session: Session = ActiveSession,
-    params: Params = Depends(),
+    params: PageParams = Depends(),
 ):
     """Returns all feedbacks"""
     query = select(Feedbacks).order_by(Feedbacks.created_at.desc())
     try:
         # Paginates the user list response
-        return paginate(query=query, params=params, session=session)
+        return paginate_counted(session, query, params)
     except Exception as e:
         print(e)
 
     raise HTTPException(404, 'failed to return feedbacks')
 
 
+@router.get(
+    '/feedback/all/cursor',
+    response_model=CursorPage[FeedbackResponse],
+)
+async def list_feedbacks_by_cursor(
+    session: Session = ActiveSession,
+    params: CursorParams = CursorPaginated,
+):
+    """Returns all feedbacks using keyset pagination"""
+    query = select(Feedbacks).order_by(
+        Feedbacks.created_at.desc(), Feedbacks.id.desc()
+    )
+    return paginate(query=query, params=params, session=session)
+
+
 @router.post(
     '/feedback/send',
     response_model=FeedbackResponse,
@@ -58,3 +82,16 @@ async def send_feedback(
         print(e)
 
     return new_feedback
+
+
+@router.get(
+    '/metrics',
+    summary='Application metrics in the Prometheus text format',
+    response_class=PlainTextResponse,
+    include_in_schema=False,
+)
+def get_metrics():
+    # The job queue gauges query the database, runs in the threadpool
+    return PlainTextResponse(
+        metrics.render(), media_type=metrics.CONTENT_TYPE
+    )
@@ -1,14 +1,27 @@
 from fastapi import APIRouter, HTTPException, Depends
 from dundie.models import Post
-from dundie.models import User, LikedPosts
-from typing import Literal
-from dundie.serializers.post import PagePostResponse, PostRequest, PostResponse
-from dundie.db import ActiveSession, Session
+from dundie.models import User
+from dundie.serializers.post import (
+    CursorPagePostResponse,
+    PagePostResponse,
+    PostRequest,
+    PostResponse,
+)
+from dundie.db import ActiveAsyncSession, ReadSession
+from dundie.pagination import CursorPaginated, CursorParams, PageParams
+from dundie.serialization import serialized_response
 from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from dundie.auth.functions import AuthenticatedUser
-from dundie.controllers.post import check_post_is_liked
-from fastapi_pagination import Params
+from dundie.controllers.post import (
+    PostSort,
+    add_post_like,
+    build_post_items,
+    get_posts_page,
+    get_sorted_posts_stmt,
+    remove_post_like,
+)
 from fastapi_pagination.ext.sqlmodel import paginate
 
 router = APIRouter()
@@ -19,56 +32,47 @@ router = APIRouter()
     response_model=PagePostResponse
 )
 async def get_posts(
-    sort: Literal[
-        'date_asc',
-        'date_desc',
-        'like_asc',
-        'like_desc'
-    ] = 'date_desc',
+    sort: PostSort = 'date_desc',
     user: User = AuthenticatedUser,
-    session: Session = ActiveSession,
-    params: Params = Depends(),
+    session: AsyncSession = ReadSession,
+    params: PageParams = Depends(),
 ):
     """Get posts from database"""
 
-    # Base statement to get all posts
-    stmt_base = select(Post)
-
-    # Define the sort order and add it to the statement
-    match sort:
-        case 'date_asc':
-            stmt = stmt_base.order_by(Post.date.asc())
-        case 'date_desc':
-            stmt = stmt_base.order_by(Post.date.desc())
-        case 'like_asc':
-            stmt = stmt_base.order_by(Post.likes.asc(), Post.id.asc())
-        case 'like_desc':
-            stmt = stmt_base.order_by(Post.likes.desc(), Post.id.asc())
-
-    result = paginate(
-        query=stmt,
+    result = await get_posts_page(session, sort, params)
+
+    # Adjust the data to be returned
+    result.items = await build_post_items(result.items, user, session)
+
+    posts = result.__dict__
+    posts.update({'sort': sort})
+
+    return serialized_response(posts)
+
+
+@router.get(
+    '/post/cursor',
+    response_model=CursorPagePostResponse
+)
+async def get_posts_by_cursor(
+    sort: PostSort = 'date_desc',
+    user: User = AuthenticatedUser,
+    session: AsyncSession = ReadSession,
+    params: CursorParams = CursorPaginated,
+):
+    """
+    Get posts from database using keyset pagination, pass the `next_page`
+    cursor of a response to get the following page.
+    """
+
+    result = await paginate(
+        query=get_sorted_posts_stmt(sort),
         params=params,
         session=session,
     )
 
     # Adjust the data to be returned
-    result.items = [
-        {
-            "id": post.id,
-            "date": post.date,
-            "content": post.content,
-            "user": {
-                "id": post.user.id,
-                "name": post.user.name,
-                "username": post.user.username,
-                "dept": post.user.dept,
-                "avatar": post.user.avatar
-            },
-            "likes": post.likes,
-            "liked": check_post_is_liked(user, post.id, session)
-        }
-        for post in result.items
-    ]
+    result.items = await build_post_items(result.items, user, session)
 
     posts = result.__dict__
     posts.update({'sort': sort})
@@ -80,7 +84,7 @@ async def get_posts(
 async def create_new_post(
     post_data: PostRequest,
     user: User = AuthenticatedUser,
-    session: Session = ActiveSession
+    session: AsyncSession = ActiveAsyncSession
 ):
     """Creates a new post in the database """
 
@@ -88,38 +92,45 @@ async def create_new_post(
 
     session.add(new_post)
     try:
-        session.commit()
-        session.refresh(new_post)
+        await session.commit()
+        await session.refresh(new_post)
     except IntegrityError:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(500, 'Database IntegrityError')
 
-    return new_post
+    # The author is the authenticated user, no need to load `post.user`
+    return {
+        "id": new_post.id,
+        "date": new_post.date,
+        "content": new_post.content,
+        "user": user,
+        "likes": new_post.likes,
+    }
 
 
 @router.delete('/post/{post_id}')
 async def delete_post(
     post_id: int,
     user: User = AuthenticatedUser,
-    session: Session = ActiveSession
+    session: AsyncSession = ActiveAsyncSession
 ):
     """Deletes a post from the database """
 
     # Checks if there is a post with that id
     stmt = select(Post).where(Post.id == post_id)
-    post = session.exec(stmt).first()
+    post = (await session.exec(stmt)).first()
     if not post:
         raise HTTPException(404, 'Post not found')
 
     if post.user_id != user.id and not user.superuser:
         raise HTTPException(403, 'You are not allowed to delete this post')
 
-    session.delete(post)
+    await session.delete(post)
     try:
-        session.commit()
-    except IntegrityError as e:
-        session.rollback()
-        raise HTTPException(500, e.orig.diag.message_detail)
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(500, 'Database IntegrityError')
 
     return {"detail": "post deleted successfully"}
 
@@ -128,67 +139,30 @@ async def delete_post(
 async def like_post(
     post_id: int,
     user: User = AuthenticatedUser,
-    session: Session = ActiveSession
+    session: AsyncSession = ActiveAsyncSession
 ):
-    """Creates a new post in the database """
+    """Likes a post, returns the new likes count"""
 
-    # Checks if there is already a post with that id
-    stmt = select(Post).where(Post.id == post_id)
-    post = session.exec(stmt).first()
-    if not post:
-        raise HTTPException(404, 'Post not found')
-
-    # Checks if the user has already liked the post
-    if check_post_is_liked(post_id=post_id, user=user, session=session):
+    likes = await add_post_like(user, post_id, session)
+    if likes is None:
         raise HTTPException(409, 'Post already liked')
 
-    post_liked = LikedPosts(post_id=post_id, user_id=user.id)
-    post.likes += 1
-    session.add(post_liked)
-    session.add(post)
-
-    try:
-        session.commit()
-    except IntegrityError as e:
-        session.rollback()
-        raise HTTPException(500, e.orig.diag.message_detail)
-
-    return {"detail": "post liked successfully"}
+    return {"detail": "post liked successfully", "likes": likes}
 
 
 @router.delete('/post/{post_id}/like')
 async def unlike_post(
     post_id: int,
     user: User = AuthenticatedUser,
-    session: Session = ActiveSession
+    session: AsyncSession = ActiveAsyncSession
 ):
-    """Deletes a post from the database """
-
-    # Checks if there is already a post with that id
-    stmt = select(Post).where(Post.id == post_id)
-    post = session.exec(stmt).first()
-    if not post:
-        raise HTTPException(404, 'Post not found')
+    """Unlikes a post, returns the new likes count"""
 
-    # Checks if the user has already liked the post
-    liked_post = check_post_is_liked(
-        post_id=post_id,
-        user=user,
-        session=session,
-        notbool=True
-    )
-    if not liked_post:
+    likes = await remove_post_like(user, post_id, session)
+    if likes is None:
+        # Only the error path checks which one is missing
+        if not await session.get(Post, post_id):
+            raise HTTPException(404, 'Post not found')
         raise HTTPException(404, 'Post not liked')
 
-    post.likes -= 1
-
-    session.add(post)
-    session.delete(liked_post)
-
-    try:
-        session.commit()
-    except IntegrityError as e:
-        session.rollback()
-        raise HTTPException(500, e.orig.diag.message_detail)
-
-    return {"detail": "post unliked successfully"}
+    return {"detail": "post unliked successfully", "likes": likes}
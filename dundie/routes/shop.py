@@ -1,10 +1,21 @@
 from fastapi import APIRouter, HTTPException
 from dundie.models import Products, User, Orders, Balance
 from dundie.serializers.shop import ProductResponse
-from dundie.db import ActiveSession, Session
+from dundie.db import ActiveAsyncSession, ReadSession
 from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from dundie.auth.functions import AuthenticatedUser
+from dundie.conditional import conditional_response
+from dundie.controllers.ranking import leaderboard
+from dundie.controllers.shop import (
+    get_product_validators,
+    get_products_validators,
+)
+from dundie.response_cache import (
+    cache_response,
+    invalidate_responses_async,
+)
 
 router = APIRouter()
 
@@ -13,27 +24,47 @@ router = APIRouter()
     '/shop/products',
     response_model=list[ProductResponse],
 )
+@conditional_response(get_products_validators)
+@cache_response(ttl=300, tags=('products',))
 async def get_products(
-    session: Session = ActiveSession,
+    session: AsyncSession = ReadSession,
     user: User = AuthenticatedUser
 ):
     """Get products from database"""
 
     stmt = select(Products)
-    result = session.exec(stmt).all()
+    result = (await session.exec(stmt)).all()
     return result
 
 
+@router.get(
+    '/shop/products/{product_id}',
+    response_model=ProductResponse,
+    dependencies=[AuthenticatedUser],
+)
+@conditional_response(get_product_validators)
+async def get_product(
+    product_id: int,
+    session: AsyncSession = ReadSession,
+):
+    """Get a product from database"""
+
+    product = await session.get(Products, product_id)
+    if not product:
+        raise HTTPException(404, 'Product not found')
+    return product
+
+
 @router.post(
     '/shop/{product_id}/buy',
 )
 async def buy_product(
     product_id: int,
     user: User = AuthenticatedUser,
-    session: Session = ActiveSession
+    session: AsyncSession = ActiveAsyncSession
 ):
-    product = session.get(Products, product_id)
-    balance = session.get(Balance, user.id)
+    product = await session.get(Products, product_id)
+    balance = await session.get(Balance, user.id)
 
     if not product:
         raise HTTPException(404, 'Product not found')
@@ -53,9 +84,12 @@ async def buy_product(
     session.add(order)
 
     try:
-        session.commit()
-    except IntegrityError as e:
-        session.rollback()
-        raise HTTPException(500, e.orig.diag.message_detail)
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(500, 'Database IntegrityError')
+
+    leaderboard.add_points(user.id, -product.price)
+    await invalidate_responses_async('ranking')
 
     return {"detail": "product bought successfully"}
@@ -1,15 +1,34 @@
+from datetime import datetime
 from typing import List
 from dundie.utils.utils import verify_admin_password_header
-from fastapi import APIRouter, HTTPException, Request
-from sqlalchemy import or_
-from sqlmodel import Session, select
-from dundie.auth.functions import AuthenticatedUser, get_user
-from dundie.controllers.transaction import check_and_transfer_points
-from dundie.db import ActiveSession
-from dundie.models import Balance, Transaction, User
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from fastapi_pagination.ext.sqlmodel import paginate
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from dundie.auth.functions import AuthenticatedUser, get_user_async
+from dundie.config import settings
+from dundie.controllers.ranking import ensure_leaderboard, leaderboard
+from dundie.controllers.transaction import (
+    ExportFormat,
+    build_transaction_items,
+    check_and_transfer_points,
+    format_export_header,
+    format_export_rows,
+    get_export_transactions_stmt,
+    get_transactions_owner_id,
+    get_user_transactions_stmt,
+)
+from dundie.db import ActiveAsyncSession, ReadSession, async_engine
+from dundie.pagination import CursorPage, CursorPaginated, CursorParams
+from dundie.response_cache import cache_response, invalidate_responses_async
+from dundie.serialization import serialized_response
+from dundie.models import Transaction, User
 from dundie.serializers.transaction import (
     RankingResponse,
     RecentTransactionsResponse,
+    UserRankResponse,
     UserTransactionsResponse,
 )
 
@@ -26,7 +45,7 @@ async def transfer_points_to_another_user(
     points: int,
     usepdm: bool = False,
     auth_user: User = AuthenticatedUser,
-    session: Session = ActiveSession,
+    session: AsyncSession = ActiveAsyncSession,
 ):
     """A function to transfer points from one user to another."""
 
@@ -37,15 +56,23 @@ async def transfer_points_to_another_user(
 
     # use 'pointsdeliveryman' if user is superuser and usepdm is True
     if auth_user.superuser and usepdm:
-        verify_admin_password_header(request, auth_user)
-        from_user = get_user('pointsdeliveryman', session=session)
+        await verify_admin_password_header(request, auth_user)
+        from_user = await get_user_async('pointsdeliveryman', session=session)
     else:
-        from_user = get_user(auth_user.username, session=session)
-
-    # Checks whether the transaction can be carried out and transfers points
-    transaction = check_and_transfer_points(
-        from_user=from_user, points=points, session=session, username=username
+        from_user = await get_user_async(auth_user.username, session=session)
+
+    # Checks whether the transaction can be carried out and transfers points.
+    # The controller is shared with the CLI, so it runs on the sync facade of
+    # the async session (lazy loads included) without blocking the event loop
+    transaction = await session.run_sync(
+        lambda sync_session: check_and_transfer_points(
+            from_user=from_user,
+            points=points,
+            session=sync_session,
+            username=username,
+        )
     )
+    await invalidate_responses_async('ranking', 'transactions')
 
     return transaction
 
@@ -56,25 +83,46 @@ async def transfer_points_to_another_user(
     dependencies=[AuthenticatedUser],
     response_model=List[RankingResponse],
 )
-async def get_points_ranking(*, session: Session = ActiveSession):
+@cache_response(ttl=60, tags=('ranking',))
+async def get_points_ranking(
+    *, session: AsyncSession = ReadSession
+):
     """
-    A function to get the points ranking from the database.
+    A function to get the points ranking.
 
-    Parameters:
-        - session (Session): The database session to use for the query.
+    The ranking is served from the in-memory leaderboard without querying
+    the database, the session is only used to load it the first time.
 
     Returns:
         list: A list of dictionaries containing user information and their
         points ranking.
     """
-    stmt = select(User).join(Balance).order_by(Balance.value.desc()).limit(10)
-    result = session.exec(stmt).all()
+    await ensure_leaderboard(session)
 
-    ranking = [user.model_dump() for user in result]
+    return leaderboard.top(settings.ranking.SIZE)
+
+
+@router.get(
+    '/ranking/me',
+    summary='get the authenticated user position in the ranking',
+    response_model=UserRankResponse,
+)
+async def get_my_rank(
+    *,
+    user: User = AuthenticatedUser,
+    session: AsyncSession = ReadSession,
+):
+    """
+    Returns the rank of the authenticated user, users with the same points
+    share the same rank.
+    """
+    await ensure_leaderboard(session)
 
-    for rank_idx, user in enumerate(result):
-        ranking[rank_idx].update({'points': user.balance})
-    return ranking
+    return {
+        'rank': leaderboard.rank(user.id),
+        'points': leaderboard.points(user.id),
+        'users': len(leaderboard),
+    }
 
 
 @router.get(
@@ -82,29 +130,26 @@ async def get_points_ranking(*, session: Session = ActiveSession):
     response_model=List[RecentTransactionsResponse],
     dependencies=[AuthenticatedUser],
 )
-async def get_recent_transactions(session: Session = ActiveSession):
+@cache_response(ttl=60, tags=('transactions',))
+async def get_recent_transactions(
+    session: AsyncSession = ReadSession,
+):
     """
     A function that returns the 5 most recent transactions in the database
     """
 
-    stmt = select(Transaction).order_by(Transaction.date.desc()).limit(5)
-    recent_transactions = session.exec(stmt).all()
-
-    # ! I know this is not the best way to do this
-    transactions_dict_list = [
-        {
-            "id": transaction.id,
-            "from_id": transaction.from_id,
-            "to_id": transaction.user_id,
-            "from_user": transaction.from_user,
-            "to_user": transaction.user,
-            "points": transaction.value,
-            "date": transaction.date,
-        }
-        for transaction in recent_transactions
-    ]
+    stmt = (
+        select(Transaction)
+        .options(
+            selectinload(Transaction.user),
+            selectinload(Transaction.from_user),
+        )
+        .order_by(Transaction.date.desc())
+        .limit(5)
+    )
+    recent_transactions = (await session.exec(stmt)).all()
 
-    return transactions_dict_list
+    return build_transaction_items(recent_transactions)
 
 
 @router.get(
@@ -115,7 +160,7 @@ async def get_user_transactions(
     username: str = None,
     *,
     user: User = AuthenticatedUser,
-    session: Session = ActiveSession,
+    session: AsyncSession = ActiveAsyncSession,
 ):
     """
     A function that returns all the authenticated user transactions if no
@@ -123,34 +168,86 @@ async def get_user_transactions(
     transactions of the user with the specified username. The transactions
     are sorted by date in descending order.
     """
-    # TODO: add pagination to this endpoint to avoid loading all data
+    # ! loads all data, clients should move to /transaction/list/cursor
+    uid = await get_transactions_owner_id(username, user, session)
 
-    # Defines the user ID to be used in the query
-    if username:
-        uid = get_user(username=username, session=session).id
-    else:
-        uid = user.id
+    stmt = get_user_transactions_stmt(uid)
+    user_transactions = (await session.exec(stmt)).all()
 
-    # Selects the transactions the user is involved in
-    stmt = (
-        select(Transaction)
-        .where(or_(Transaction.user_id == uid, Transaction.from_id == uid))
-        .order_by(Transaction.date.desc())
+    return serialized_response(build_transaction_items(user_transactions))
+
+
+@router.get(
+    '/transaction/list/cursor',
+    response_model=CursorPage[UserTransactionsResponse],
+)
+async def get_user_transactions_by_cursor(
+    username: str = None,
+    *,
+    user: User = AuthenticatedUser,
+    session: AsyncSession = ActiveAsyncSession,
+    params: CursorParams = CursorPaginated,
+):
+    """
+    Same as `/transaction/list` using keyset pagination, pass the
+    `next_page` cursor of a response to get the following page.
+    """
+    uid = await get_transactions_owner_id(username, user, session)
+
+    return await paginate(
+        query=get_user_transactions_stmt(uid),
+        params=params,
+        session=session,
+        transformer=build_transaction_items,
+    )
+
+
+@router.get(
+    '/transaction/export',
+    summary='Export transactions as CSV or NDJSON',
+)
+async def export_transactions(
+    fmt: ExportFormat = Query('csv', alias='format'),
+    username: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    *,
+    user: User = AuthenticatedUser,
+    session: AsyncSession = ActiveAsyncSession,
+):
+    """
+    Streams the transactions in the `[start, end)` date range, oldest first.
+
+    Users export their own transactions, admins export the transactions of
+    `username` or the whole ledger if no username is passed. The rows are
+    read from a database cursor in batches while the response is sent, so
+    exports of any size run in constant memory.
+    """
+    if username and username != user.username and not user.superuser:
+        raise HTTPException(403, 'Only admins can export other users')
+
+    user_id = None if user.superuser else user.id
+    if username:
+        user_id = await get_transactions_owner_id(username, user, session)
+
+    stmt = get_export_transactions_stmt(user_id, start, end)
+
+    async def stream_export():
+        # The request session is closed before the response is streamed,
+        # so the export reads with its own session
+        async with AsyncSession(async_engine) as export_session:
+            yield format_export_header(fmt)
+            result = await export_session.stream(stmt)
+            async for rows in result.partitions():
+                yield format_export_rows(rows, fmt)
+
+    media_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return StreamingResponse(
+        stream_export(),
+        media_type=media_type,
+        headers={
+            'Content-Disposition': (
+                f'attachment; filename="transactions.{fmt}"'
+            )
+        },
     )
-    user_transactions = session.exec(stmt).all()
-
-    # ! I know this is not the best way to do this
-    transactions_dict_list = [
-        {
-            "id": transaction.id,
-            "from_id": transaction.from_id,
-            "to_id": transaction.user_id,
-            "from_user": transaction.from_user,
-            "to_user": transaction.user,
-            "points": transaction.value,
-            "date": transaction.date,
-        }
-        for transaction in user_transactions
-    ]
-
-    return transactions_dict_list
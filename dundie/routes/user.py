@@ -1,23 +1,38 @@
 import re
 from typing import List
 
-from fastapi import APIRouter, BackgroundTasks, Depends, Request
+from fastapi import APIRouter, Depends, Request
 from fastapi.exceptions import HTTPException
-from fastapi_pagination import Page, Params
-from fastapi_pagination.ext.sqlmodel import paginate
-from sqlalchemy import and_
+from fastapi_pagination import Page
 from sqlalchemy.exc import IntegrityError
-from sqlmodel import Session, select
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from dundie.auth.functions import (
     AuthenticatedUser,
     CanChangeUserPassword,
     create_both_tokens,
-    get_user,
+    get_user_async,
+    invalidate_cached_user,
 )
-from dundie.db import ActiveSession
+from dundie.conditional import conditional_response
+from dundie.controllers import get_listed_users_stmt
+from dundie.controllers.ranking import update_ranking_profile
+from dundie.controllers.search import (
+    load_user_search,
+    update_user_search,
+    user_search,
+)
+from dundie.controllers.user import (
+    build_user_items,
+    get_profile_validators,
+    get_public_profile_validators,
+)
+from dundie.db import ActiveAsyncSession, ActiveSession, ReadSession
+from dundie.pagination import PageParams, invalidate_counts, paginate_counted
 from dundie.models import User
-from dundie.security import verify_password
+from dundie.security import get_password_hash_async, verify_password_async
+from dundie.serialization import serialized_response
 from dundie.serializers import (
     EmailRequest,
     UserAvatarPatchRequest,
@@ -29,6 +44,7 @@ from dundie.serializers import (
     UserPublicProfileResponse,
     UserResponse,
 )
+from dundie.tasks.queue import enqueue
 from dundie.tasks.user import try_to_send_password_reset_email
 from dundie.utils.utils import (
     apply_user_links_patch,
@@ -66,6 +82,8 @@ async def patch_user_profile_links(
         session.rollback()
         raise HTTPException(500, str(e))
 
+    invalidate_cached_user(current_user.username)
+
     return {'detail': 'profile updated!'}
 
 
@@ -76,7 +94,10 @@ async def patch_user_profile_links(
     response_model=UserPrivateProfileResponse,
     tags=['Profile'],
 )
-async def get_private_user_profile_data(*, user: User = AuthenticatedUser):
+@conditional_response(get_profile_validators)
+async def get_private_user_profile_data(
+    *, user: User = AuthenticatedUser, session: AsyncSession = ReadSession
+):
     """
     This function handles the GET request to retrieve the profile data of the
     authenticated user. It checks if the user making the request exists and
@@ -115,6 +136,9 @@ async def upload_avatar_image_link(
             400, 'Something went wrong while updating the avatar link'
         )
 
+    invalidate_cached_user(user.username)
+    await update_ranking_profile(user)
+
     return {'detail': 'avatar updated!'}
 
 
@@ -126,8 +150,9 @@ async def upload_avatar_image_link(
     dependencies=[AuthenticatedUser],
     tags=['Profile'],
 )
+@conditional_response(get_public_profile_validators)
 async def get_public_user_profile_data(
-    username: str, *, session: Session = ActiveSession
+    username: str, *, session: AsyncSession = ReadSession
 ):
     """
     This function handles the GET request to retrieve the profile data of the
@@ -135,7 +160,9 @@ async def get_public_user_profile_data(
     correct credentials. If the user exists and has the correct credentials,
     it returns the target user data as a UserPublicProfileResponse object.
     """
-    target_user = get_user(username=username, session=session)
+    target_user = await get_user_async(username=username, session=session)
+    if not target_user:
+        raise HTTPException(404, 'User not found')
     return target_user.model_dump()
 
 
@@ -170,6 +197,11 @@ async def patch_user_profile_data(
         session.rollback()
         raise HTTPException(500, str(e))
 
+    invalidate_cached_user(old_username)
+    await update_ranking_profile(current_user)
+    update_user_search(current_user)
+    invalidate_counts(User.__tablename__)
+
     if user_data.username != old_username:
         session.refresh(current_user)
         # Generating both access and refresh tokens for the user session
@@ -195,7 +227,7 @@ async def list_all_users_in_db(
     *,
     session: Session = ActiveSession,
     current_user: User = AuthenticatedUser,
-    params: Params = Depends(),
+    params: PageParams = Depends(),
 ):
     """
     This function handles the GET request to retrieve a list of all users
@@ -207,46 +239,43 @@ async def list_all_users_in_db(
     """
 
     # Query users who are not private or disabled
-    stmt = select(User).where(
-        and_(User.is_active == True, User.private == False)  # noqa: E712
-    )
+    stmt = get_listed_users_stmt()
 
     try:
         # Paginates the user list response
-        return paginate(query=stmt, params=params, session=session)
+        page = paginate_counted(
+            session, stmt, params, transformer=build_user_items
+        )
     except Exception as e:
         print(e)
+        return {'detail': 'failed'}
 
-    return {'detail': 'failed'}
+    return serialized_response(page)
 
 
 # * GET /user/names ~ Gets a list of all usernames
 @router.get(
     '/names',
-    summary='List all users',
-    dependencies=[],
+    summary='Search active users by username or name',
+    dependencies=[AuthenticatedUser],
     response_model=List[UsernamesResponse],
 )
 async def get_names_and_usernames(
     query: str | None = None,
-    session: Session = ActiveSession,
+    session: AsyncSession = ActiveAsyncSession,
 ):
+    """
+    Typeahead over the active public users, answered by the in-memory
+    search index, prefix matches come before substring matches. The
+    session is only used to load the index the first time.
+    """
     if not query:
         return []
 
-    stmt = (
-        select(User.username, User.name)
-        .where(
-            and_(
-                User.is_active == True,  # noqa: E712 E501
-                User.private == False,  # noqa: E712 E501
-            )
-        )
-        .filter(User.username.like(f'%{query}%'))
-        .limit(10)
-    )
-    users = session.exec(stmt).all()
-    return users
+    if not user_search.loaded:
+        await load_user_search(session)
+
+    return user_search.search(query, limit=10)
 
 
 # * POST /{username}/password ~ Changes the specified user password
@@ -270,14 +299,14 @@ async def change_user_password(
     """
 
     # Checks if the new password is the same as the current password
-    if verify_password(patch_data.password, user.password):
+    if await verify_password_async(patch_data.password, user.password):
         raise HTTPException(400, 'New password matches the current one')
 
     # checks password complexity
     check_password_complexity(patch_data.password)
 
     # Change the password
-    user.password = patch_data.hashed_password
+    user.password = await get_password_hash_async(patch_data.password)
     session.add(user)
 
     try:
@@ -289,6 +318,8 @@ async def change_user_password(
         print(e)
         raise HTTPException(500, 'Database IntegrityError')
 
+    invalidate_cached_user(user.username)
+
     return user
 
 
@@ -299,19 +330,22 @@ async def change_user_password(
 )
 async def send_password_reset_token(
     email_request: EmailRequest,
-    background_task: BackgroundTasks,
+    session: AsyncSession = ActiveAsyncSession,
 ):
     """
     This function handles the POST request to send a password reset token to
     the specified email address. It triggers the sending of an email
     containing the token required for resetting the password.
+
+    The email is sent by `dundie worker`, the request only queues the job.
     TODO:
         create a SMTP server.
     """
 
-    background_task.add_task(
-        try_to_send_password_reset_email, email=email_request.email
+    enqueue(
+        session, try_to_send_password_reset_email, email=email_request.email
     )
+    await session.commit()
 
     return {
         'detail': 'If we have found a user with that email, '
@@ -1,5 +1,17 @@
+import asyncio
+import time
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+
+from fastapi import HTTPException
 from passlib.context import CryptContext
 
+from dundie.config import settings
+from dundie.metrics import HASHING_DURATION, HASHING_REJECTED
+
 pass_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 
 
@@ -31,6 +43,96 @@ def get_password_hash(plain_pass: str) -> str:
     return pass_context.hash(plain_pass)
 
 
+class PasswordHasher:
+    """
+    Runs the bcrypt operations in a bounded worker pool.
+
+    bcrypt costs hundreds of milliseconds of CPU per call, running it inside
+    an async handler freezes the event loop for every other request. The
+    hasher sends the work to a thread or process pool and refuses new work
+    with a 503 when `max_pending` operations are already in flight, so a
+    login burst fails fast instead of piling up.
+
+    Usage:
+        is_valid = await hasher.verify('password123', user.password)
+        hashed = await hasher.hash('password123')
+    """
+
+    def __init__(
+        self, kind: str = 'thread', workers: int = 4, max_pending: int = 32
+    ):
+        if kind not in ('thread', 'process'):
+            raise ValueError("hashing pool must be 'thread' or 'process'")
+
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: Executor | None = None
+
+    @property
+    def executor(self) -> Executor:
+        """Creates the pool on first use"""
+        if self._executor is None:
+            pool_class = (
+                ThreadPoolExecutor
+                if self.kind == 'thread'
+                else ProcessPoolExecutor
+            )
+            self._executor = pool_class(max_workers=self.workers)
+        return self._executor
+
+    async def run(self, func, *args):
+        """Runs `func(*args)` in the pool, raises 503 when it is saturated"""
+        if self.pending >= self.max_pending:
+            HASHING_REJECTED.inc()
+            raise HTTPException(
+                503,
+                'Server is busy, try again later',
+                headers={'Retry-After': '1'},
+            )
+
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+            HASHING_DURATION.observe(
+                time.perf_counter() - start, func.__name__
+            )
+
+    async def verify(self, plain_pass: str, hashed_pass: str) -> bool:
+        return await self.run(verify_password, plain_pass, hashed_pass)
+
+    async def hash(self, plain_pass: str) -> str:
+        return await self.run(get_password_hash, plain_pass)
+
+    def shutdown(self):
+        """Stops the workers, a new pool is created if used again"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hasher = PasswordHasher(
+    kind=settings.security.HASHING_POOL,
+    workers=settings.security.HASHING_POOL_WORKERS,
+    max_pending=settings.security.HASHING_MAX_PENDING,
+)
+
+
+async def verify_password_async(plain_pass: str, hashed_pass: str) -> bool:
+    """Same as `verify_password` without blocking the event loop."""
+    return await hasher.verify(plain_pass, hashed_pass)
+
+
+async def get_password_hash_async(plain_pass: str) -> str:
+    """Same as `get_password_hash` without blocking the event loop."""
+    return await hasher.hash(plain_pass)
+
+
 class HashedPassword(str):
     """
     Represents a hashed password.
@@ -68,12 +170,19 @@ class HashedPassword(str):
         Class method to validate the input and return a new instance with
         the hashed password.
 
+        A `HashedPassword` instance is returned as is, so async handlers can
+        hash the password with `get_password_hash_async` beforehand instead
+        of hashing it here, inside the event loop.
+
         Parameters:
             v (str): The input string to be validated and hashed.
 
         Returns:
             Instance: A new instance with the hashed password.
         """
+        if isinstance(v, HashedPassword):
+            return v
+
         if not isinstance(v, str):
             raise TypeError('string required')
 
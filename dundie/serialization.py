@@ -0,0 +1,162 @@
+"""Fast serialization of large list responses
+
+FastAPI validates the data returned by a route against its
+`response_model`, converts it to JSON compatible values and then encodes
+them with the stdlib `json`. The list routes already build their items in
+the response format from typed columns (`build_transaction_items`,
+`build_post_items`...), so for them the validation is done twice.
+
+Those routes return `serialized_response(content)` instead, which picks
+the encoding of the data as is:
+
+- MessagePack when the request `Accept` header asks for
+  `application/msgpack`, with the datetimes as MessagePack timestamps
+  (the -1 extension type, 4 to 12 bytes, decoded as datetimes by
+  `msgpack.unpackb(data, timestamp=3)`).
+  The format is negotiated by the `ContentNegotiationMiddleware`.
+- With `serialization.FAST_JSON`, JSON encoded by orjson, the other
+  responses are encoded with orjson too (`FastJSONResponse`). The output
+  is the same JSON as FastAPI's: UTC datetimes end in `Z` and models are
+  dumped in the JSON mode.
+- Otherwise the content is returned to FastAPI, as any route does.
+
+Only data already in the response format can be passed, nothing is
+validated or left out.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+import msgpack
+import orjson
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+from dundie.conditional import as_utc
+from dundie.config import settings
+
+JSON_MEDIA_TYPES = ('application/json', 'application/*', '*/*')
+MSGPACK_MEDIA_TYPES = (
+    'application/msgpack',
+    'application/x-msgpack',
+    'application/vnd.msgpack',
+)
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode='json')
+    raise TypeError(f'Type is not JSON serializable: {type(value).__name__}')
+
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return msgpack.Timestamp.from_datetime(as_utc(value))
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    raise TypeError(
+        f'Type is not MessagePack serializable: {type(value).__name__}'
+    )
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with orjson"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_default,
+            option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS,
+        )
+
+
+class MsgPackResponse(Response):
+    """MessagePack response, datetimes are encoded as timestamps"""
+
+    media_type = 'application/msgpack'
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content, default=_msgpack_default)
+
+
+@dataclass
+class Negotiation:
+    """Response format accepted by the request"""
+
+    msgpack: bool = False
+    # Whether the route chose the format by the Accept header, the
+    # response must then be sent with `Vary: Accept`
+    used: bool = False
+
+
+_current_negotiation: ContextVar[Negotiation | None] = ContextVar(
+    'negotiation', default=None
+)
+
+
+def get_quality(accept: str, media_types: tuple[str, ...]) -> float:
+    """Highest `q` given by the `accept` header to any of `media_types`"""
+    quality = 0.0
+    for media_range in accept.split(','):
+        media_type, *params = media_range.split(';')
+        if media_type.strip().lower() not in media_types:
+            continue
+        value = 1.0
+        for param in params:
+            name, _, number = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    value = float(number)
+                except ValueError:
+                    value = 0.0
+        quality = max(quality, value)
+    return quality
+
+
+def accepts_msgpack(accept: str) -> bool:
+    """
+    MessagePack must be named by the header (`*/*` means JSON) and be
+    preferred at least as much as JSON
+    """
+    quality = get_quality(accept, MSGPACK_MEDIA_TYPES)
+    return quality > 0 and quality >= get_quality(accept, JSON_MEDIA_TYPES)
+
+
+@contextmanager
+def negotiate_format(accept: str):
+    """The `serialized_response` inside the block use the `accept` header"""
+    negotiation = Negotiation(msgpack=accepts_msgpack(accept))
+    token = _current_negotiation.set(negotiation)
+    try:
+        yield negotiation
+    finally:
+        _current_negotiation.reset(token)
+
+
+def fast_json_enabled() -> bool:
+    return settings.serialization.FAST_JSON
+
+
+def get_default_response_class() -> type[JSONResponse]:
+    """The response class of the app routes"""
+    return FastJSONResponse if fast_json_enabled() else JSONResponse
+
+
+def serialized_response(content: Any) -> Any:
+    """
+    Returns `content`, already in the route `response_model` format, as a
+    response encoded in the format negotiated for the request, skipping
+    FastAPI's validation, see the module docstring.
+    """
+    negotiation = _current_negotiation.get()
+    if negotiation is not None:
+        negotiation.used = True
+        if negotiation.msgpack:
+            return MsgPackResponse(content)
+
+    if not fast_json_enabled():
+        return content
+    return FastJSONResponse(content)
@@ -3,6 +3,8 @@ from fastapi import HTTPException
 from pydantic import BaseModel, root_validator
 from fastapi_pagination import Page
 
+from dundie.pagination import CursorPage
+
 
 class PostUserResponse(BaseModel):
     """User response serializer containing basic information about a user."""
@@ -44,3 +46,8 @@ class PostRequest(BaseModel):
 class PagePostResponse(Page[PostResponse]):
     """Page post response serializer"""
     sort: str
+
+
+class CursorPagePostResponse(CursorPage[PostResponse]):
+    """Cursor page post response serializer"""
+    sort: str
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from .user import UserResponse
 
@@ -13,6 +13,12 @@ class RankingResponse(BaseModel):
     points: int
 
 
+class UserRankResponse(BaseModel):
+    rank: int | None
+    points: int | None
+    users: int
+
+
 class RecentTransactionsResponse(BaseModel):
     id: int
     from_id: int
@@ -31,3 +37,21 @@ class UserTransactionsResponse(BaseModel):
     to_user: UserResponse
     points: int
     date: datetime
+
+
+class BulkTransferItem(BaseModel):
+    username: str
+    points: int = Field(ge=10)
+
+
+class BulkTransferRequest(BaseModel):
+    # Each recipient takes 3 bind parameters in the balances UPDATE, the
+    # limit keeps it below the 32767 parameters supported by the drivers
+    transfers: list[BulkTransferItem] = Field(min_length=1, max_length=5000)
+
+
+class BulkTransferResponse(BaseModel):
+    from_username: str = Field(serialization_alias='from')
+    recipients: int
+    points: int
+    date: datetime
@@ -0,0 +1,231 @@
+"""Slow query log
+
+Statements taking longer than `db.SLOW_QUERY_MS` are written as JSON lines
+to the rotating `db.SLOW_QUERY_LOG` file with their duration, the shape of
+the bound parameters (types and sizes, never the values) and the request
+route that executed them. `/admin/debug/slow-queries` reads them back.
+
+On PostgreSQL, with `db.SLOW_QUERY_EXPLAIN`, the plan of slow SELECTs is
+captured with `EXPLAIN (ANALYZE, BUFFERS)` by a background thread, on its
+own connection to the database that ran the query (the primary or the
+replica), so the request that was already slow does not wait for it. The
+plan is logged as a separate entry with the same `id` as the query.
+
+The log file is written by every process of the app, each rotating it on
+its own, so with several workers the rotation may lose a few entries.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from dundie.config import settings
+from dundie.query_stats import get_current_stats
+from dundie.utils.cache import TTLCache
+
+logger = logging.getLogger('dundie.slow_queries')
+logger.propagate = False
+# File handler of the log, created under the lock by the first entry as
+# the requests log concurrently
+_handler: RotatingFileHandler | None = None
+_logger_lock = threading.Lock()
+
+# A single thread runs the EXPLAINs, one slow query at a time
+_explain_executor = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix='slow-query-explain'
+)
+# Statements explained recently, each plan is captured once per TTL
+_explained = TTLCache(maxsize=1024, ttl=600)
+
+# asyncpg numbered placeholders ($1), explained through psycopg2 (%s)
+_NUMBERED_PARAM = re.compile(r'\$(\d+)')
+
+
+def get_log_path() -> Path:
+    return Path(settings.db.SLOW_QUERY_LOG)
+
+
+def _get_logger() -> logging.Logger:
+    """The file handler is only opened when the first entry is written"""
+    global _handler
+    if _handler is not None:
+        return logger
+
+    with _logger_lock:
+        if _handler is None:
+            path = get_log_path()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(
+                path,
+                maxBytes=settings.db.SLOW_QUERY_LOG_MAX_BYTES,
+                backupCount=settings.db.SLOW_QUERY_LOG_BACKUPS,
+                encoding='utf-8',
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.setLevel(logging.INFO)
+            logger.addHandler(handler)
+            _handler = handler
+    return logger
+
+
+def write_entry(entry: dict):
+    entry = {'time': datetime.now(timezone.utc).isoformat(), **entry}
+    _get_logger().info(json.dumps(entry, default=str))
+
+
+def get_statement_id(statement: str) -> str:
+    return hashlib.sha1(statement.encode()).hexdigest()[:12]
+
+
+def get_value_shape(value) -> str:
+    """`int`, `str`, `list[3]`... the type and size of a bound value"""
+    name = type(value).__name__
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return f'{name}[{len(value)}]'
+    return name
+
+
+def get_params_shape(parameters, executemany: bool):
+    """The shape of the bound parameters, without their values"""
+    if executemany:
+        rows = list(parameters)
+        first = rows[0] if rows else ()
+        return {'rows': len(rows), 'row': get_params_shape(first, False)}
+    if isinstance(parameters, dict):
+        return {
+            key: get_value_shape(value) for key, value in parameters.items()
+        }
+    return [get_value_shape(value) for value in parameters or ()]
+
+
+def to_pyformat(statement: str, parameters) -> tuple[str, tuple]:
+    """Converts an asyncpg `$1` statement to the psycopg2 `%s` style"""
+    order = []
+
+    def replace(match: re.Match) -> str:
+        order.append(int(match.group(1)) - 1)
+        return '%s'
+
+    statement = _NUMBERED_PARAM.sub(replace, statement.replace('%', '%%'))
+    return statement, tuple(parameters[index] for index in order)
+
+
+def explain(engine: Engine, statement_id: str, statement: str, parameters):
+    """
+    Logs the `EXPLAIN (ANALYZE, BUFFERS)` plan of a SELECT. ANALYZE runs
+    the statement, the transaction is always rolled back.
+    """
+    try:
+        with engine.connect() as connection:
+            plan = connection.exec_driver_sql(
+                f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}',
+                parameters,
+                execution_options={'slow_query_log': False},
+            ).scalar()
+            connection.rollback()
+    except Exception as e:
+        write_entry({'id': statement_id, 'kind': 'explain', 'error': str(e)})
+        return
+
+    write_entry({'id': statement_id, 'kind': 'explain', 'plan': plan})
+
+
+def track_slow_queries(
+    engine: Engine, name: str, explain_engine: Engine | None
+):
+    """
+    Logs the statements executed through `engine` slower than the threshold.
+    `engine` is a sync `Engine`, pass `async_engine.sync_engine` for async
+    engines. The EXPLAINs run on `explain_engine`, a sync engine of the same
+    database, and are skipped when it is None.
+    """
+    threshold = settings.db.SLOW_QUERY_MS / 1000
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_slow_query_timer(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        context.slow_query_start = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def log_slow_query(conn, cursor, statement, parameters, context, many):
+        duration = time.perf_counter() - context.slow_query_start
+        if duration < threshold or not context.execution_options.get(
+            'slow_query_log', True
+        ):
+            return
+
+        stats = get_current_stats()
+        statement_id = get_statement_id(statement)
+        write_entry({
+            'id': statement_id,
+            'kind': 'query',
+            'engine': name,
+            'duration_ms': round(duration * 1000, 2),
+            'route': stats.route if stats is not None else None,
+            'statement': statement,
+            'params': get_params_shape(parameters, many),
+        })
+
+        if (
+            settings.db.SLOW_QUERY_EXPLAIN
+            and explain_engine is not None
+            and conn.dialect.name == 'postgresql'
+            and not many
+            and re.match(r'\s*(SELECT|WITH)\b', statement, re.IGNORECASE)
+            and _explained.get(statement_id) is None
+        ):
+            _explained.set(statement_id, True)
+            if conn.dialect.driver == 'asyncpg':
+                statement, parameters = to_pyformat(statement, parameters)
+            _explain_executor.submit(
+                explain, explain_engine, statement_id, statement, parameters
+            )
+
+
+def read_slow_queries(
+    limit: int = 100, route: str | None = None, min_ms: float = 0
+) -> list[dict]:
+    """
+    Returns the logged slow queries, newest first, with the captured plan
+    of each statement. Reads the rotated files too.
+    """
+    path = get_log_path()
+    files = [path] + [
+        path.with_name(f'{path.name}.{index}')
+        for index in range(1, settings.db.SLOW_QUERY_LOG_BACKUPS + 1)
+    ]
+
+    queries, plans = [], {}
+    for file in files:
+        if not file.exists():
+            continue
+        lines = file.read_text(encoding='utf-8').splitlines()
+        for line in reversed(lines):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get('kind') == 'explain':
+                plans.setdefault(entry['id'], entry)
+            elif (
+                entry.get('duration_ms', 0) >= min_ms
+                and (route is None or entry.get('route') == route)
+            ):
+                queries.append(entry)
+
+    for entry in queries[:limit]:
+        plan = plans.get(entry['id'])
+        if plan is not None:
+            entry['plan'] = plan.get('plan') or plan.get('error')
+    return queries[:limit]
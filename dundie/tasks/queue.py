@@ -0,0 +1,351 @@
+"""Durable background jobs
+
+Routes add jobs to the `job` table with `enqueue`, in the same database
+transaction as their other writes, and `dundie worker` runs them in its
+own process. Slow work (sending emails) never holds an API worker thread
+and the jobs not run yet survive restarts.
+
+Each worker thread claims the oldest due job. On PostgreSQL the job is
+selected `FOR UPDATE SKIP LOCKED`, concurrent workers skip the rows locked
+by the others instead of waiting for them. SQLite has no row locks, there
+the claim is only an UPDATE guarded by `status = 'queued'`: SQLite runs one
+write at a time, so when two threads select the same job only one of them
+updates it and the other looks for another one.
+
+Failed jobs are retried up to `jobs.MAX_ATTEMPTS` times with an
+exponential backoff, then kept as "failed" with their last error. The
+worker renews the lease (`locked_at`) of its running jobs every third of
+`jobs.LEASE_SECONDS`. Jobs not renewed for `jobs.LEASE_SECONDS` (their
+worker died) are queued again, or failed when it was their last attempt,
+so a job killing its worker is not run forever. A job may then run twice,
+tasks must be idempotent.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+from importlib import import_module
+from typing import Any, Callable
+
+from sqlalchemy import case, func, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session, delete, select
+from sqlmodel.sql.expression import SelectOfScalar
+
+from dundie.config import settings
+from dundie.db import engine
+from dundie.metrics import Gauge
+from dundie.models import Job
+from dundie.utils.utils import get_utcnow
+
+logger = logging.getLogger('dundie.jobs')
+
+# Modules registering tasks, imported by the worker
+TASK_MODULES = ('dundie.tasks.user', 'dundie.tasks.transaction')
+
+tasks: dict[str, Callable[..., Any]] = {}
+
+
+def task(name: str):
+    """
+    Registers the decorated function as the task `name`, the name is saved
+    in the jobs so it must not change while they are queued.
+    """
+
+    def register(function):
+        tasks[name] = function
+        function.task_name = name
+        return function
+
+    return register
+
+
+def load_tasks():
+    for module in TASK_MODULES:
+        import_module(module)
+
+
+def enqueue(session, function: Callable[..., Any], **payload) -> Job:
+    """
+    Adds a job calling the task `function` with the `payload` keyword
+    arguments (JSON values), saved by the next commit of `session` (sync or
+    async).
+    """
+    name = getattr(function, 'task_name', None)
+    if tasks.get(name) is not function:
+        raise ValueError(f'Not a registered task: {function!r}')
+
+    job = Job(
+        task=name,
+        payload=payload,
+        max_attempts=settings.jobs.MAX_ATTEMPTS,
+    )
+    session.add(job)
+    return job
+
+
+def get_retry_delay(attempts: int) -> float:
+    """Seconds before retrying a job that failed `attempts` times"""
+    delay = settings.jobs.RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+    return min(delay, settings.jobs.RETRY_MAX_SECONDS)
+
+
+def get_due_jobs_stmt() -> SelectOfScalar[Job]:
+    return (
+        select(Job)
+        .where(Job.status == 'queued', Job.run_at <= get_utcnow())
+        .order_by(Job.run_at)
+    )
+
+
+def claim_job(session: Session, worker: str) -> Job | None:
+    """Marks the oldest due job as run by `worker` and returns it"""
+    stmt = get_due_jobs_stmt().limit(1).with_for_update(skip_locked=True)
+    job = session.exec(stmt).first()
+    if job is None:
+        session.rollback()
+        return None
+
+    now = get_utcnow()
+    claimed = session.exec(
+        update(Job)
+        .where(Job.id == job.id, Job.status == 'queued')
+        .values(
+            status='running',
+            locked_by=worker,
+            locked_at=now,
+            attempts=Job.attempts + 1,
+        )
+    )
+    if claimed.rowcount != 1:
+        # Claimed by another worker since it was selected (SQLite)
+        session.rollback()
+        return claim_job(session, worker)
+
+    session.commit()
+    session.refresh(job)
+    return job
+
+
+def run_job(session: Session, job: Job) -> bool:
+    """
+    Runs the claimed `job`, deleting it when it succeeds. Otherwise it is
+    queued for a retry or, after its last attempt, marked as failed.
+    """
+    start = time.perf_counter()
+    try:
+        tasks[job.task](**job.payload)
+    except Exception as e:
+        job.last_error = ''.join(traceback.format_exception_only(e)).strip()
+        job.locked_by = job.locked_at = None
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            logger.error(
+                'job %s (%s) failed after %s attempts: %s',
+                job.id, job.task, job.attempts, job.last_error,
+            )
+        else:
+            delay = get_retry_delay(job.attempts)
+            job.status = 'queued'
+            job.run_at = get_utcnow() + timedelta(seconds=delay)
+            logger.warning(
+                'job %s (%s) failed, retrying in %ss: %s',
+                job.id, job.task, delay, job.last_error,
+            )
+        session.add(job)
+        session.commit()
+        return False
+
+    logger.info(
+        'job %s (%s) done in %.3fs',
+        job.id, job.task, time.perf_counter() - start,
+    )
+    session.exec(delete(Job).where(Job.id == job.id))
+    session.commit()
+    return True
+
+
+def renew_leases(session: Session, prefix: str) -> int:
+    """Renews the lease of the running jobs of the workers `prefix:*`"""
+    result = session.exec(
+        update(Job)
+        .where(
+            Job.status == 'running',
+            Job.locked_by.startswith(f'{prefix}:', autoescape=True),
+        )
+        .values(locked_at=get_utcnow())
+    )
+    session.commit()
+    return result.rowcount
+
+
+def requeue_stale_jobs(session: Session) -> int:
+    """
+    Queues again the running jobs whose lease was not renewed for
+    `jobs.LEASE_SECONDS`, or marks them as failed after their last attempt
+    """
+    lease = timedelta(seconds=settings.jobs.LEASE_SECONDS)
+    exhausted = Job.attempts >= Job.max_attempts
+    result = session.exec(
+        update(Job)
+        .where(Job.status == 'running', Job.locked_at < get_utcnow() - lease)
+        .values(
+            status=case((exhausted, 'failed'), else_='queued'),
+            last_error=case(
+                (exhausted, 'Lease expired, the worker stopped'),
+                else_=Job.last_error,
+            ),
+            locked_by=None,
+            locked_at=None,
+        )
+    )
+    session.commit()
+    if result.rowcount:
+        logger.warning(
+            '%s stale jobs queued again or failed', result.rowcount
+        )
+    return result.rowcount
+
+
+def get_queue_stats(session: Session) -> dict:
+    """
+    Jobs by task and status, and for the due queued jobs how long the
+    oldest one has been waiting, e.g.
+    `{'send_password_reset_email': {'queued': 3, 'wait_seconds': 1.2}}`
+    """
+    now = get_utcnow()
+    rows = session.exec(
+        select(Job.task, Job.status, func.count(), func.min(Job.run_at))
+        .group_by(Job.task, Job.status)
+    ).all()
+
+    stats = {}
+    for name, status, count, oldest in rows:
+        entry = stats.setdefault(name, {'wait_seconds': 0.0})
+        entry[status] = count
+        if status == 'queued':
+            wait = (now.replace(tzinfo=None) - oldest).total_seconds()
+            entry['wait_seconds'] = max(wait, 0.0)
+    return stats
+
+
+def _read_queue_stats() -> dict:
+    # Read on every scrape by the API, the queue is shared by the processes
+    try:
+        with Session(engine) as session:
+            return get_queue_stats(session)
+    except SQLAlchemyError:
+        return {}
+
+
+# Stats of the last scrape, read once for both gauges
+_scraped_stats: dict = {}
+
+
+def _queue_depth():
+    global _scraped_stats
+    _scraped_stats = _read_queue_stats()
+    return {
+        (name, status): entry.get(status, 0)
+        for name, entry in _scraped_stats.items()
+        for status in ('queued', 'running', 'failed')
+    }
+
+
+def _queue_wait():
+    # Rendered right after JOBS_DEPTH (registry order), reuses its stats
+    return {
+        (name,): entry['wait_seconds']
+        for name, entry in _scraped_stats.items()
+    }
+
+
+JOBS_DEPTH = Gauge(
+    'dundie_jobs',
+    'Background jobs by task and status',
+    labels=('task', 'status'),
+    function=_queue_depth,
+)
+JOBS_WAIT = Gauge(
+    'dundie_jobs_wait_seconds',
+    'Time the oldest due job has been waiting for a worker',
+    labels=('task',),
+    function=_queue_wait,
+)
+
+
+def consume(worker: str, stop: threading.Event, burst: bool = False):
+    """Runs due jobs until `stop` is set, or the queue is empty on `burst`"""
+    while not stop.is_set():
+        try:
+            with Session(engine) as session:
+                job = claim_job(session, worker)
+                if job is not None:
+                    run_job(session, job)
+                    continue
+        except SQLAlchemyError:
+            logger.exception('worker %s could not claim or save a job', worker)
+
+        if burst:
+            return
+        stop.wait(settings.jobs.POLL_SECONDS)
+
+
+def run_worker(
+    concurrency: int | None = None,
+    burst: bool = False,
+    stop: threading.Event | None = None,
+):
+    """
+    Runs the jobs with `concurrency` threads until `stop` is set, or until
+    the queue has no due jobs on `burst`. The leases of the running jobs
+    are renewed every third of `jobs.LEASE_SECONDS` and the stale jobs are
+    requeued every `jobs.LEASE_SECONDS`.
+    """
+    load_tasks()
+    concurrency = concurrency or settings.jobs.CONCURRENCY
+    stop = stop or threading.Event()
+    prefix = f'{socket.gethostname()}:{os.getpid()}'
+
+    with Session(engine) as session:
+        requeue_stale_jobs(session)
+    last_requeue = last_renewal = time.monotonic()
+
+    threads = [
+        threading.Thread(
+            target=consume,
+            args=(f'{prefix}:{index}', stop, burst),
+            name=f'dundie-worker-{index}',
+        )
+        for index in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    logger.info('worker %s started %s consumers', prefix, concurrency)
+
+    while not stop.is_set():
+        alive = [thread for thread in threads if thread.is_alive()]
+        if not alive:
+            break
+        alive[0].join(settings.jobs.POLL_SECONDS)
+        try:
+            lease = settings.jobs.LEASE_SECONDS
+            if time.monotonic() - last_renewal >= lease / 3:
+                with Session(engine) as session:
+                    renew_leases(session, prefix)
+                last_renewal = time.monotonic()
+            if time.monotonic() - last_requeue >= lease:
+                with Session(engine) as session:
+                    requeue_stale_jobs(session)
+                last_requeue = time.monotonic()
+        except SQLAlchemyError:
+            logger.exception(
+                'worker %s could not renew or requeue the jobs', prefix
+            )
+
+    for thread in threads:
+        thread.join()
@@ -9,6 +9,7 @@ from dundie.auth.functions import create_access_token
 from dundie.config import settings
 from dundie.db import engine
 from dundie.models.user import User
+from dundie.tasks.queue import task
 from dundie.templates import env
 
 
@@ -69,6 +70,7 @@ def send_email(email: str, message: str):
         send_email_smtp(email, message)
 
 
+@task('send_password_reset_email')
 def try_to_send_password_reset_email(email: str):
     """
     Try to send password reset email.
@@ -82,6 +84,7 @@ def try_to_send_password_reset_email(email: str):
     >>> try_to_send_password_reset_email('example@email.com')
 
     Notes:
+        - Runs on `dundie worker`, see `dundie.tasks.queue.enqueue`.
         - Retrieves user by email from database.
         - Generates password reset token with expiry.
         - Constructs email template with reset URL and token.
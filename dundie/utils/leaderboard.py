@@ -0,0 +1,155 @@
+import threading
+from bisect import bisect_left, insort
+from typing import Any, Iterable
+
+
+class Leaderboard:
+    """
+    Thread safe in-memory ranking of users by points.
+
+    The users are kept in a list sorted by `(-points, user_id)`, so the top
+    `k` is a slice of the list and the rank of an user is a binary search.
+    Points changes move a single entry instead of sorting everything again,
+    moving it is O(n) (the list items after it are shifted), about 5 us
+    with 1000 users, 10 us with 10000 and 50 us with 100000, far below the
+    database commit of the transfer.
+
+    The points loaded from the database and the deltas of `add_points` can
+    overlap, see `track`.
+
+    Usage:
+        board = Leaderboard()
+        board.load([(1, {'username': 'jim'}, 100)])
+        board.add_points(1, 20)
+        board.top(10)  # [{'id': 1, 'username': 'jim', 'points': 120}]
+        board.rank(1)  # 1
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._keys: list[tuple[int, int]] = []
+        self._points: dict[int, int] = {}
+        self._profiles: dict[int, dict[str, Any]] = {}
+        self._trackers: list[set[int]] = []
+        self._lock = threading.Lock()
+
+    def track(self) -> set[int]:
+        """
+        Starts recording the users passed to `add_points`, returns the set
+        they are added to, pass it to `load` and `set_points`.
+
+        Points read from the database while a transfer commits may or may
+        not include it, and its delta may be applied before or after they
+        are loaded, so the points of the users changed while reading are
+        not known. Those users must be read again (`set_points`).
+        """
+        changed = set()
+        with self._lock:
+            self._trackers.append(changed)
+        return changed
+
+    def untrack(self, changed: set[int]):
+        with self._lock:
+            self._trackers.remove(changed)
+
+    def load(
+        self,
+        entries: Iterable[tuple[int, dict[str, Any], int]],
+        changed: set[int] | None = None,
+    ) -> set[int]:
+        """
+        Replaces the whole ranking with `(user_id, profile, points)`.
+        Returns the users `changed` since the tracking started, whose points
+        must be read again, and restarts the tracking.
+        """
+        points, profiles = {}, {}
+        for user_id, profile, value in entries:
+            points[user_id] = value
+            profiles[user_id] = profile
+        keys = sorted((-value, user_id) for user_id, value in points.items())
+
+        with self._lock:
+            self._keys, self._points, self._profiles = keys, points, profiles
+            self.loaded = True
+            return self._restart(changed, points)
+
+    def set_points(
+        self, points: dict[int, int], changed: set[int]
+    ) -> set[int]:
+        """
+        Sets the `points` read from the database, except for the users
+        `changed` while they were read. Returns those users and restarts
+        the tracking.
+        """
+        with self._lock:
+            for user_id, value in points.items():
+                if user_id in changed or user_id not in self._points:
+                    continue
+                self._remove_key(user_id)
+                self._points[user_id] = value
+                insort(self._keys, (-value, user_id))
+            return self._restart(changed, points)
+
+    def add_user(self, user_id: int, profile: dict[str, Any], points: int):
+        with self._lock:
+            if user_id in self._points:
+                self._remove_key(user_id)
+            self._points[user_id] = points
+            self._profiles[user_id] = profile
+            insort(self._keys, (-points, user_id))
+
+    def set_profile(self, user_id: int, profile: dict[str, Any]):
+        """Updates the profile data of an user returned by `top`"""
+        with self._lock:
+            if user_id in self._profiles:
+                self._profiles[user_id].update(profile)
+
+    def add_points(self, user_id: int, amount: int):
+        """
+        Adds `amount` (may be negative) to the user points. Deltas are
+        applied instead of absolute values, so concurrent changes commute.
+        Unknown users are ignored, they show up on the next `load`.
+        """
+        with self._lock:
+            for changed in self._trackers:
+                changed.add(user_id)
+            if user_id not in self._points:
+                return
+            self._remove_key(user_id)
+            self._points[user_id] += amount
+            insort(self._keys, (-self._points[user_id], user_id))
+
+    def top(self, k: int) -> list[dict[str, Any]]:
+        """Returns the `k` users with more points, best first"""
+        with self._lock:
+            return [
+                {'id': user_id, **self._profiles[user_id], 'points': -points}
+                for points, user_id in self._keys[:k]
+            ]
+
+    def rank(self, user_id: int) -> int | None:
+        """
+        Returns the 1-based position of the user, users with the same points
+        share the same rank. None if the user is not ranked.
+        """
+        with self._lock:
+            if user_id not in self._points:
+                return None
+            return bisect_left(self._keys, (-self._points[user_id],)) + 1
+
+    def points(self, user_id: int) -> int | None:
+        return self._points.get(user_id)
+
+    def _restart(self, changed: set[int] | None, read) -> set[int]:
+        if changed is None:
+            return set()
+        result = changed & read.keys()
+        changed.clear()
+        return result
+
+    def _remove_key(self, user_id: int):
+        key = (-self._points[user_id], user_id)
+        del self._keys[bisect_left(self._keys, key)]
+
+    def __len__(self) -> int:
+        return len(self._keys)
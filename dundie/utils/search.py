@@ -0,0 +1,131 @@
+import heapq
+import threading
+from typing import Callable
+
+# Length of the substrings indexed, queries up to this size are a single
+# lookup, longer queries intersect the lookups of their substrings
+GRAM_SIZE = 3
+
+
+def iter_grams(text: str):
+    """Yields every substring of `text` with 1 to `GRAM_SIZE` chars"""
+    for size in range(1, GRAM_SIZE + 1):
+        for start in range(len(text) - size + 1):
+            yield text[start:start + size]
+
+
+class UserSearchIndex:
+    """
+    Thread safe in-memory typeahead over usernames and names.
+
+    The texts are normalized by `normalize` and every 1 to 3 chars
+    substring points to the users containing it, so a search only looks
+    at users that can match. Results are ranked by how they match:
+
+        0. the username is the query
+        1. the username starts with the query
+        2. the name starts with the query
+        3. the username contains the query
+        4. the name contains the query
+
+    Usage:
+        index = UserSearchIndex(normalize=str.lower)
+        index.load([(1, 'jim', 'Jim Halpert')])
+        index.search('hal')  # [{'username': 'jim', 'name': 'Jim Halpert'}]
+    """
+
+    def __init__(self, normalize: Callable[[str], str]):
+        self.normalize = normalize
+        self.loaded = False
+        # user_id -> (username, name, normalized username, normalized name)
+        self._users: dict[int, tuple[str, str, str, str]] = {}
+        self._grams: dict[str, set[int]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, users):
+        """Replaces the whole index with `(user_id, username, name)`"""
+        index = UserSearchIndex(self.normalize)
+        for user_id, username, name in users:
+            index._add(user_id, username, name)
+
+        with self._lock:
+            self._users, self._grams = index._users, index._grams
+            self.loaded = True
+
+    def upsert(self, user_id: int, username: str, name: str):
+        """Adds the user or updates its username and name"""
+        with self._lock:
+            self._remove(user_id)
+            self._add(user_id, username, name)
+
+    def remove(self, user_id: int):
+        with self._lock:
+            self._remove(user_id)
+
+    def search(self, query: str, limit: int = 10) -> list[dict[str, str]]:
+        """Returns up to `limit` users matching `query`, best first"""
+        query = self.normalize(query)
+        if not query:
+            return []
+
+        with self._lock:
+            candidates = self._candidates(query)
+            ranked = []
+            for user_id in candidates:
+                username, name, norm_username, norm_name = self._users[
+                    user_id
+                ]
+                if norm_username == query:
+                    rank = 0
+                elif norm_username.startswith(query):
+                    rank = 1
+                elif norm_name.startswith(query):
+                    rank = 2
+                elif query in norm_username:
+                    rank = 3
+                elif query in norm_name:
+                    rank = 4
+                else:
+                    continue
+                ranked.append((rank, len(username), username, name))
+
+        return [
+            {'username': username, 'name': name}
+            for _, _, username, name in heapq.nsmallest(limit, ranked)
+        ]
+
+    def _candidates(self, query: str) -> set[int]:
+        if len(query) <= GRAM_SIZE:
+            return self._grams.get(query, set())
+
+        # Users containing every 3 chars piece of the query, the smallest
+        # sets first so the intersection shrinks fast
+        pieces = sorted(
+            (
+                self._grams.get(query[start:start + GRAM_SIZE], set())
+                for start in range(len(query) - GRAM_SIZE + 1)
+            ),
+            key=len,
+        )
+        return set.intersection(*pieces)
+
+    def _add(self, user_id: int, username: str, name: str):
+        norm_username = self.normalize(username)
+        norm_name = self.normalize(name)
+        self._users[user_id] = (username, name, norm_username, norm_name)
+        for gram in {*iter_grams(norm_username), *iter_grams(norm_name)}:
+            self._grams.setdefault(gram, set()).add(user_id)
+
+    def _remove(self, user_id: int):
+        entry = self._users.pop(user_id, None)
+        if entry is None:
+            return
+        for gram in {*iter_grams(entry[2]), *iter_grams(entry[3])}:
+            users = self._grams.get(gram)
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del self._grams[gram]
+
+    def __len__(self) -> int:
+        return len(self._users)
@@ -0,0 +1,58 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share a single execution.
+
+    The first caller of a key starts `func` as a task, the callers arriving
+    while it runs await the same task instead of running it again, and all
+    of them get its result or its exception. Once it finishes the key is
+    free, the next call runs `func` again (nothing is cached).
+
+    The task runs with the context of the first caller, its session and
+    query stats included, and is shielded from the cancellation of any of
+    the callers.
+
+    Usage:
+        flights = SingleFlight()
+        rows = await flights.do(('ranking', size), load_ranking, session)
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+
+    async def do(
+        self,
+        key: Hashable,
+        func: Callable[..., Awaitable[Any]],
+        *args,
+        **kwargs,
+    ) -> Any:
+        task = self._tasks.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+    def stats(self) -> dict:
+        """Returns the counters used for monitoring"""
+        return {
+            'in_flight': len(self._tasks),
+            'calls': self.calls,
+            'shared': self.shared,
+        }
+
+    def __len__(self) -> int:
+        return len(self._tasks)
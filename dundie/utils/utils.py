@@ -5,7 +5,7 @@ from typing import TYPE_CHECKING
 
 from fastapi import HTTPException, Request
 from sqlmodel import Session, select
-from dundie.security import verify_password
+from dundie.security import verify_password_async
 from dundie.config import settings
 from dundie.db import engine
 
@@ -183,12 +183,15 @@ def validate_user_links(links: dict):
     return links
 
 
-def verify_admin_password_header(request: Request, auth_user: "User"):
+async def verify_admin_password_header(
+    request: Request, auth_user: "User"
+):
     request_password = request.headers.get('X-Admin-Password')
-    print(request_password, auth_user.password)
     if not request_password:
         raise HTTPException(400, 'Missing X-Admin-Password header')
-    is_valid = verify_password(request_password, auth_user.password)
+    is_valid = await verify_password_async(
+        request_password, auth_user.password
+    )
     if not is_valid:
         raise HTTPException(401, 'Invalid admin password')
 
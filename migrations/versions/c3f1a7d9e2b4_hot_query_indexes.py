@@ -0,0 +1,78 @@
+"""hot query indexes
+
+Revision ID: c3f1a7d9e2b4
+Revises: 99e3d2e2cb55
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f1a7d9e2b4'
+down_revision: Union[str, None] = '99e3d2e2cb55'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Active public users, the filter of /user and /user/names
+LISTED_USERS = {
+    'postgresql': 'is_active AND NOT private',
+    'sqlite': 'is_active = 1 AND private = 0',
+}
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    listed_users = sa.text(LISTED_USERS.get(dialect, 'true'))
+
+    # ! TRANSACTION TABLE
+    # `user_id = :id OR from_id = :id ORDER BY date`, one index per side
+    op.create_index('ix_transaction_user_id_date', 'transaction', ['user_id', 'date', 'id'], unique=False)
+    op.create_index('ix_transaction_from_id_date', 'transaction', ['from_id', 'date', 'id'], unique=False)
+    # prefixes of the indexes above
+    op.drop_index('ix_transaction_user_id', table_name='transaction')
+    op.drop_index('ix_transaction_from_id', table_name='transaction')
+
+    # ! POST TABLE
+    # feed sorts, `id` is the tiebreaker used by the cursor pagination
+    op.create_index('ix_post_likes_id', 'post', ['likes', 'id'], unique=False)
+    op.create_index('ix_post_date_id', 'post', ['date', 'id'], unique=False)
+    op.drop_index('ix_post_likes', table_name='post')
+    op.drop_index('ix_post_date', table_name='post')
+
+    # ! ORDERS TABLE
+    op.create_index('ix_orders_status_id', 'orders', ['status', 'id'], unique=False)
+    op.drop_index('ix_orders_status', table_name='orders')
+
+    # ! USERS TABLE
+    op.create_index('ix_user_listed', 'user', ['id'], unique=False, postgresql_where=listed_users, sqlite_where=listed_users)
+    if dialect == 'postgresql':
+        # `username LIKE '%q%'` can only use a trigram index
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index('ix_user_listed_username_trgm', 'user', ['username'], unique=False, postgresql_using='gin', postgresql_ops={'username': 'gin_trgm_ops'}, postgresql_where=listed_users)
+    # sqlite has no trigram indexes, the search scans ix_user_listed instead
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        op.drop_index('ix_user_listed_username_trgm', table_name='user')
+    op.drop_index('ix_user_listed', table_name='user')
+
+    op.create_index('ix_orders_status', 'orders', ['status'], unique=False)
+    op.drop_index('ix_orders_status_id', table_name='orders')
+
+    op.create_index('ix_post_date', 'post', ['date'], unique=False)
+    op.create_index('ix_post_likes', 'post', ['likes'], unique=False)
+    op.drop_index('ix_post_date_id', table_name='post')
+    op.drop_index('ix_post_likes_id', table_name='post')
+
+    op.create_index('ix_transaction_from_id', 'transaction', ['from_id'], unique=False)
+    op.create_index('ix_transaction_user_id', 'transaction', ['user_id'], unique=False)
+    op.drop_index('ix_transaction_from_id_date', table_name='transaction')
+    op.drop_index('ix_transaction_user_id_date', table_name='transaction')
@@ -0,0 +1,40 @@
+"""updated_at validators
+
+Revision ID: d7a2c5e9f1b3
+Revises: c3f1a7d9e2b4
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a2c5e9f1b3'
+down_revision: Union[str, None] = 'c3f1a7d9e2b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ! USERS TABLE
+    # the ETag of the profiles, existing users start at their creation.
+    # sqlite cannot add a column with a non constant default
+    op.add_column('user', sa.Column('updated_at', sa.DateTime(), nullable=False, server_default='1970-01-01 00:00:00'))
+    user = sa.table('user', sa.column('created_at'), sa.column('updated_at'))
+    op.execute(user.update().values(updated_at=user.c.created_at))
+    # the default was only for the existing rows, the app sets the column.
+    # sqlite cannot alter a column, the batch recreates the table there
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.alter_column('updated_at', existing_type=sa.DateTime(), existing_nullable=False, server_default=None)
+
+    # ! PRODUCTS TABLE
+    # `max(updated_at)`, the ETag of the products list
+    op.create_index(op.f('ix_products_updated_at'), 'products', ['updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_products_updated_at'), table_name='products')
+    op.drop_column('user', 'updated_at')
@@ -0,0 +1,44 @@
+"""job queue
+
+Revision ID: e4b8d1f6a2c7
+Revises: d7a2c5e9f1b3
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b8d1f6a2c7'
+down_revision: Union[str, None] = 'd7a2c5e9f1b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ! JOBS TABLE
+    # background jobs run by `dundie worker`
+    op.create_table('job',
+    sa.Column('id', sa.Integer(), nullable=False, autoincrement=True),
+    sa.Column('task', sa.String(length=255), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('run_at', sa.DateTime(), nullable=False),
+    sa.Column('locked_by', sa.String(length=255), nullable=True),
+    sa.Column('locked_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # the workers claim the oldest due queued job
+    op.create_index('ix_job_status_run_at', 'job', ['status', 'run_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_job_status_run_at', table_name='job')
+    op.drop_table('job')
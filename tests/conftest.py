@@ -0,0 +1,132 @@
+import os
+import tempfile
+from pathlib import Path
+
+# Settings are read when `dundie` is imported, so the test database must be
+# set before it. Export DUNDIE_DB__uri (and DUNDIE_DB__connect_args='{}') to
+# run the tests against postgres, as the CI does.
+os.environ.setdefault('DUNDIE_SECURITY__SECRET_KEY', 'testing')
+os.environ.setdefault(
+    'DUNDIE_DB__uri',
+    'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'dundie.db'),
+)
+# The query budgets are checked through the X-DB-Queries response header
+os.environ['DUNDIE_QUERY_STATS__HEADERS'] = 'true'
+
+import pytest  # noqa: E402
+from alembic import command  # noqa: E402
+from alembic.config import Config  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlmodel import Session, SQLModel, text  # noqa: E402
+
+from dundie.app import app  # noqa: E402
+from dundie.auth.functions import (  # noqa: E402
+    create_access_token,
+    user_cache,
+)
+from dundie.db import engine  # noqa: E402
+from dundie.models import Balance, User  # noqa: E402
+from dundie.response_cache import backend  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    """Responses cached by a test must not be served to the next one"""
+    yield
+    backend.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_user_cache():
+    """
+    The ids change between tests, a token issued in the same second as one
+    of a previous test must not get its cached user
+    """
+    yield
+    user_cache.clear()
+
+
+@pytest.fixture
+def session():
+    """Session on a freshly created database"""
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def migrated_session():
+    """Session on a database created by the alembic migrations"""
+    root = Path(__file__).parent.parent
+    config = Config(root / 'alembic.ini')
+    config.set_main_option('script_location', str(root / 'migrations'))
+
+    command.upgrade(config, 'head')
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text('DROP TABLE IF EXISTS alembic_version'))
+
+
+@pytest.fixture
+def create_user(session):
+    """Creates an user with `balance` points, skipping password hashing"""
+
+    def factory(username: str, balance: int = 0, dept: str = 'sales'):
+        user = User(
+            name=username.title(),
+            username=username,
+            dept=dept,
+            email=f'{username}@dm.com',
+            password='!',
+            currency='USD',
+        )
+        session.add(user)
+        session.commit()
+        session.refresh(user)
+        session.add(Balance(user_id=user.id, value=balance))
+        session.commit()
+        return user
+
+    return factory
+
+
+@pytest.fixture
+def client():
+    """API client, the lifespan is not run (no background sync tasks)"""
+    return TestClient(app)
+
+
+@pytest.fixture
+def auth_headers():
+    """Authorization headers of an user, skipping the login"""
+
+    def factory(user: User) -> dict[str, str]:
+        token = create_access_token(data={'sub': user.username})
+        return {'Authorization': f'Bearer {token}'}
+
+    return factory
+
+
+@pytest.fixture
+def query_budget():
+    """
+    Fails when a response executed more SQL statements than `budget`, the
+    statements repeated by the request are logged by the middleware.
+
+    Usage:
+        response = client.get('/post', headers=headers)
+        query_budget(response, 3)
+    """
+
+    def check(response, budget: int):
+        assert response.status_code < 400, response.text
+        queries = int(response.headers['X-DB-Queries'])
+        assert queries <= budget, (
+            f'{response.request.method} {response.request.url.path} '
+            f'executed {queries} queries, the budget is {budget}'
+        )
+
+    return check
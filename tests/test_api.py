@@ -0,0 +1,127 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+from sqlalchemy import event
+from sqlmodel import Session, func, select
+
+from dundie.controllers.transaction import check_and_transfer_points
+from dundie.db import engine
+from dundie.models import Balance, Transaction, User
+
+
+def test_concurrent_transfers_never_overdraw(session, create_user):
+    """
+    Many parallel transfers, in both directions between the same users, must
+    never leave a negative balance, lose points or miss ledger entries.
+    """
+    initial = 100
+    usernames = ['jim', 'pam', 'dwight', 'angela']
+    for username in usernames:
+        create_user(username, balance=initial)
+
+    def transfer(_):
+        sender, receiver = random.sample(usernames, 2)
+        with Session(engine) as thread_session:
+            from_user = thread_session.exec(
+                select(User).where(User.username == sender)
+            ).one()
+            try:
+                check_and_transfer_points(
+                    receiver, 30, from_user=from_user, session=thread_session
+                )
+            except HTTPException as e:
+                assert e.status_code == 403
+                return False
+            return True
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(transfer, range(200)))
+
+    balances = session.exec(select(Balance.value)).all()
+    transfers = session.exec(select(func.count(Transaction.id))).one()
+
+    assert min(balances) >= 0
+    assert sum(balances) == initial * len(usernames)
+    assert transfers == results.count(True)
+
+
+def test_transfer_locks_both_balances_in_user_id_order(
+    session, create_user
+):
+    jim = create_user('jim', balance=100)
+    pam = create_user('pam', balance=100)
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(' '.join(statement.split()))
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        # From the larger id, jim's row is still locked first
+        check_and_transfer_points('jim', 10, from_user=pam, session=session)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    lock = next(
+        index for index, statement in enumerate(statements)
+        if statement.startswith('SELECT balance.user_id FROM balance')
+    )
+    update = next(
+        index for index, statement in enumerate(statements)
+        if statement.startswith('UPDATE balance')
+    )
+    assert lock < update
+    assert statements[lock].endswith(
+        'ORDER BY balance.user_id FOR UPDATE'
+        if engine.dialect.name == 'postgresql'
+        else 'ORDER BY balance.user_id'
+    )
+    assert jim.id < pam.id
+
+
+def test_transfer_with_insufficient_funds_changes_nothing(
+    session, create_user
+):
+    jim = create_user('jim', balance=10)
+    create_user('pam', balance=0)
+
+    try:
+        check_and_transfer_points('pam', 20, from_user=jim, session=session)
+    except HTTPException as e:
+        assert e.status_code == 403
+    else:
+        raise AssertionError('transfer should have failed')
+
+    balances = dict(session.exec(select(User.username, Balance.value).join(
+        Balance, Balance.user_id == User.id
+    )).all())
+    assert balances == {'jim': 10, 'pam': 0}
+    assert session.exec(select(func.count(Transaction.id))).one() == 0
+
+
+def test_transfer_to_self_is_refused(session, create_user):
+    jim = create_user('jim', balance=100)
+
+    try:
+        check_and_transfer_points('jim', 50, from_user=jim, session=session)
+    except HTTPException as e:
+        assert e.status_code == 400
+    else:
+        raise AssertionError('transfer should have failed')
+
+    session.expire_all()
+    assert session.exec(select(Balance.value)).one() == 100
+    assert session.exec(select(func.count(Transaction.id))).one() == 0
+
+
+def test_superuser_transfer_credits_without_debit(session, create_user):
+    michael = create_user('michael', balance=0, dept='management')
+    create_user('pam', balance=0)
+
+    check_and_transfer_points('pam', 50, from_user=michael, session=session)
+
+    balances = dict(session.exec(select(User.username, Balance.value).join(
+        Balance, Balance.user_id == User.id
+    )).all())
+    assert balances == {'michael': 0, 'pam': 50}
@@ -0,0 +1,30 @@
+from sqlmodel import Session, update
+
+from dundie.auth.functions import get_cached_user
+from dundie.config import settings
+from dundie.db import engine
+from dundie.models import User
+from dundie.utils.utils import get_utcnow
+
+
+def disable_in_other_process(username: str):
+    """Changes the user without touching the cache, as the CLI does"""
+    with Session(engine) as session:
+        session.exec(
+            update(User)
+            .where(User.username == username)
+            .values(is_active=False, updated_at=get_utcnow())
+        )
+        session.commit()
+
+
+def test_cached_users_are_revalidated(create_user, monkeypatch):
+    create_user('jim')
+    assert get_cached_user('jim', 1).is_active
+    disable_in_other_process('jim')
+
+    # Still fresh, served from the cache
+    assert get_cached_user('jim', 1).is_active
+
+    monkeypatch.setitem(settings.security, 'USER_CACHE_REVALIDATE_SECONDS', 0)
+    assert not get_cached_user('jim', 1).is_active
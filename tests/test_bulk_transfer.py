@@ -0,0 +1,162 @@
+import pytest
+from sqlmodel import select
+
+from dundie.controllers.ranking import leaderboard
+from dundie.models import Balance, Transaction
+from dundie.security import get_password_hash
+
+ADMIN_PASSWORD = 'Scranton123'
+
+
+@pytest.fixture
+def staff(session, create_user):
+    """michael (admin), pointsdeliveryman and the recipients"""
+    michael = create_user('michael', dept='management')
+    michael.password = get_password_hash(ADMIN_PASSWORD)
+    session.add(michael)
+    session.commit()
+    users = {
+        'michael': michael,
+        'pointsdeliveryman': create_user(
+            'pointsdeliveryman', dept='management'
+        ),
+        'jim': create_user('jim', balance=100),
+        'pam': create_user('pam', balance=50),
+        'dwight': create_user('dwight'),
+    }
+    # The in-memory ranking is loaded again by the first request
+    leaderboard.loaded = False
+    return users
+
+
+@pytest.fixture
+def bulk_transfer(client, auth_headers, staff):
+    """Posts `transfers` ({username: points}) as michael"""
+    # One token for every request, the authenticated user stays cached
+    token = auth_headers(staff['michael'])
+
+    def post(transfers: dict[str, int], password: str = ADMIN_PASSWORD):
+        headers = {**token, 'X-Admin-Password': password}
+        return client.post(
+            '/admin/transaction/bulk',
+            json={
+                'transfers': [
+                    {'username': username, 'points': points}
+                    for username, points in transfers.items()
+                ]
+            },
+            headers=headers,
+        )
+
+    return post
+
+
+def get_balances(session) -> dict[int, int]:
+    session.expire_all()
+    return dict(session.exec(select(Balance.user_id, Balance.value)).all())
+
+
+def test_every_recipient_is_credited(session, staff, bulk_transfer):
+    response = bulk_transfer({'jim': 10, 'pam': 20, 'dwight': 30})
+
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data['from'] == 'pointsdeliveryman'
+    assert (data['recipients'], data['points']) == (3, 60)
+
+    balances = get_balances(session)
+    assert balances[staff['jim'].id] == 110
+    assert balances[staff['pam'].id] == 70
+    assert balances[staff['dwight'].id] == 30
+    # Points are issued by pointsdeliveryman, its balance is not debited
+    assert balances[staff['pointsdeliveryman'].id] == 0
+
+    ledger = session.exec(select(Transaction)).all()
+    assert {
+        (item.from_id, item.user_id, item.value) for item in ledger
+    } == {
+        (staff['pointsdeliveryman'].id, staff['jim'].id, 10),
+        (staff['pointsdeliveryman'].id, staff['pam'].id, 20),
+        (staff['pointsdeliveryman'].id, staff['dwight'].id, 30),
+    }
+    assert len({item.date for item in ledger}) == 1
+
+
+def test_leaderboard_is_updated(client, auth_headers, staff, bulk_transfer):
+    # Loads the ranking before the transfer
+    client.get('/ranking', headers=auth_headers(staff['jim']))
+    assert leaderboard.points(staff['dwight'].id) == 0
+
+    bulk_transfer({'jim': 10, 'dwight': 300})
+
+    assert leaderboard.points(staff['jim'].id) == 110
+    assert leaderboard.points(staff['dwight'].id) == 300
+    top = client.get('/ranking', headers=auth_headers(staff['jim'])).json()
+    assert top[0]['username'] == 'dwight'
+
+
+def test_unknown_recipients_change_nothing(session, staff, bulk_transfer):
+    session.add(staff['pam'])
+    staff['pam'].private = True
+    session.commit()
+
+    response = bulk_transfer({'jim': 10, 'pam': 20, 'toby': 30})
+
+    assert response.status_code == 404
+    assert response.json()['detail'].endswith(': pam, toby')
+    balances = get_balances(session)
+    assert balances[staff['jim'].id] == 100
+    assert session.exec(select(Transaction)).all() == []
+
+
+@pytest.mark.parametrize(
+    'transfers',
+    [
+        {},
+        {'jim': 9},
+        {f'user{index}': 10 for index in range(5001)},
+    ],
+    ids=['empty', 'below-minimum', 'above-limit'],
+)
+def test_invalid_requests_are_refused(session, bulk_transfer, transfers):
+    response = bulk_transfer(transfers)
+
+    assert response.status_code == 422
+    assert session.exec(select(Transaction)).all() == []
+
+
+def test_duplicated_recipients_are_refused(client, auth_headers, staff):
+    headers = auth_headers(staff['michael'])
+    headers['X-Admin-Password'] = ADMIN_PASSWORD
+    item = {'username': 'jim', 'points': 10}
+
+    response = client.post(
+        '/admin/transaction/bulk',
+        json={'transfers': [item, item]},
+        headers=headers,
+    )
+
+    assert response.status_code == 400
+
+
+def test_admin_password_is_required(session, bulk_transfer):
+    response = bulk_transfer({'jim': 10}, password='wrong')
+
+    assert response.status_code == 401
+    assert session.exec(select(Transaction)).all() == []
+
+
+def test_statements_do_not_grow_with_the_recipients(
+    create_user, staff, bulk_transfer
+):
+    for index in range(50):
+        create_user(f'user{index}')
+    # The first request caches the authenticated user
+    bulk_transfer({'jim': 10})
+
+    few = bulk_transfer({'jim': 10, 'pam': 10})
+
+    many = bulk_transfer({f'user{index}': 10 for index in range(50)})
+
+    assert many.status_code == 200, many.text
+    assert many.headers['X-DB-Queries'] == few.headers['X-DB-Queries']
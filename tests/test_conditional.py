@@ -0,0 +1,108 @@
+import pytest
+
+from dundie.models import Balance, Products
+
+
+@pytest.fixture
+def product(session):
+    product = Products(name='Mug', price=10, description='A mug', image='-')
+    session.add(product)
+    session.commit()
+    session.refresh(product)
+    return product
+
+
+def test_products_not_modified_until_a_product_changes(
+    client, session, create_user, auth_headers, product
+):
+    headers = auth_headers(create_user('jim'))
+    response = client.get('/shop/products', headers=headers)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert etag.startswith('W/"')
+
+    response = client.get(
+        '/shop/products', headers=headers | {'If-None-Match': etag}
+    )
+    assert response.status_code == 304
+    assert response.content == b''
+    assert response.headers['ETag'] == etag
+
+    since = {'If-Modified-Since': response.headers['Last-Modified']}
+    response = client.get('/shop/products', headers=headers | since)
+    assert response.status_code == 304
+
+    # Changed without invalidating the cached response, the new version
+    # has its own cache entry
+    product.name = 'Cup'
+    session.add(product)
+    session.commit()
+
+    response = client.get(
+        '/shop/products', headers=headers | {'If-None-Match': etag}
+    )
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.json()[0]['name'] == 'Cup'
+
+
+def test_deleting_a_product_changes_the_etag(
+    client, session, create_user, auth_headers, product
+):
+    headers = auth_headers(create_user('jim'))
+    etag = client.get('/shop/products', headers=headers).headers['ETag']
+
+    session.delete(product)
+    session.commit()
+
+    response = client.get(
+        '/shop/products', headers=headers | {'If-None-Match': etag}
+    )
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+def test_product_detail(client, create_user, auth_headers, product):
+    headers = auth_headers(create_user('jim'))
+    response = client.get(f'/shop/products/{product.id}', headers=headers)
+    assert response.status_code == 200
+    assert response.json()['name'] == 'Mug'
+
+    response = client.get(
+        f'/shop/products/{product.id}',
+        headers=headers | {'If-None-Match': response.headers['ETag']},
+    )
+    assert response.status_code == 304
+
+    response = client.get('/shop/products/404', headers=headers)
+    assert response.status_code == 404
+    assert 'ETag' not in response.headers
+
+
+def test_profiles_change_with_the_balance(
+    client, session, create_user, auth_headers
+):
+    jim = create_user('jim')
+    pam = create_user('pam')
+    headers = auth_headers(jim)
+
+    etags = {}
+    for url in ('/user/profile', '/user/public/pam'):
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        etags[url] = response.headers['ETag']
+        response = client.get(
+            url, headers=headers | {'If-None-Match': etags[url]}
+        )
+        assert response.status_code == 304
+
+    for user in (jim, pam):
+        balance = session.get(Balance, user.id)
+        balance.value += 10
+        session.add(balance)
+    session.commit()
+
+    for url, etag in etags.items():
+        response = client.get(url, headers=headers | {'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.json()['points'] == 10
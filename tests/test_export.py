@@ -0,0 +1,176 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import timedelta
+
+import pytest
+from sqlmodel import select
+
+from dundie.app import app
+from dundie.controllers import transaction
+from dundie.controllers.transaction import (
+    check_and_transfer_points,
+    get_export_transactions_stmt,
+    iter_export_lines,
+)
+from dundie.models import Transaction
+from dundie.utils.utils import get_utcnow
+
+
+@pytest.fixture
+def ledger(session, create_user):
+    """jim sends 10, 20 and 30 points to pam and pam 40 to dwight"""
+    users = {
+        'jim': create_user('jim', balance=1000),
+        'pam': create_user('pam', balance=1000),
+        'dwight': create_user('dwight'),
+        'michael': create_user('michael', dept='management'),
+    }
+    for points in (10, 20, 30):
+        check_and_transfer_points(
+            'pam', points, from_user=users['jim'], session=session
+        )
+    check_and_transfer_points(
+        'dwight', 40, from_user=users['pam'], session=session
+    )
+    return users
+
+
+def read_csv(text: str) -> list[dict]:
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+def test_csv_export_of_own_transactions(client, auth_headers, ledger):
+    response = client.get(
+        '/transaction/export', headers=auth_headers(ledger['jim'])
+    )
+
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/csv')
+    assert 'transactions.csv' in response.headers['Content-Disposition']
+    rows = read_csv(response.text)
+    assert list(rows[0]) == list(transaction.EXPORT_FIELDS)
+    assert [(row['from_username'], row['to_username'], row['points'])
+            for row in rows] == [
+        ('jim', 'pam', '10'), ('jim', 'pam', '20'), ('jim', 'pam', '30')
+    ]
+
+
+def test_ndjson_export(client, auth_headers, ledger):
+    response = client.get(
+        '/transaction/export?format=ndjson',
+        headers=auth_headers(ledger['pam']),
+    )
+
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line['points'] for line in lines] == [10, 20, 30, 40]
+    assert set(lines[0]) == set(transaction.EXPORT_FIELDS)
+
+
+def test_users_cannot_export_other_users(client, auth_headers, ledger):
+    response = client.get(
+        '/transaction/export?username=pam',
+        headers=auth_headers(ledger['jim']),
+    )
+
+    assert response.status_code == 403
+
+
+def test_admins_export_any_user_or_everything(client, auth_headers, ledger):
+    headers = auth_headers(ledger['michael'])
+
+    dwight = client.get('/transaction/export?username=dwight', headers=headers)
+    everything = client.get('/transaction/export', headers=headers)
+    missing = client.get(
+        '/transaction/export?username=nobody', headers=headers
+    )
+
+    assert [row['points'] for row in read_csv(dwight.text)] == ['40']
+    assert len(read_csv(everything.text)) == 4
+    assert missing.status_code == 404
+
+
+def test_export_date_range(client, auth_headers, session, ledger):
+    now = get_utcnow()
+    transactions = session.exec(
+        select(Transaction).order_by(Transaction.id)
+    ).all()
+    for days, item in zip((3, 2, 1, 0), transactions):
+        item.date = now - timedelta(days=days)
+        session.add(item)
+    session.commit()
+
+    response = client.get(
+        '/transaction/export',
+        params={
+            'start': (now - timedelta(days=2, hours=1)).isoformat(),
+            'end': (now - timedelta(hours=1)).isoformat(),
+        },
+        headers=auth_headers(ledger['michael']),
+    )
+
+    assert [row['points'] for row in read_csv(response.text)] == ['20', '30']
+
+
+def test_export_is_streamed_in_batches(session, ledger, monkeypatch):
+    """The CLI path, rows are fetched and formatted a batch at a time"""
+    monkeypatch.setattr(transaction, 'EXPORT_BATCH_SIZE', 3)
+    stmt = get_export_transactions_stmt()
+
+    chunks = list(
+        iter_export_lines(session.exec(stmt).partitions(), 'ndjson')
+    )
+
+    # No header, then one chunk per batch of rows
+    assert chunks[0] == ''
+    assert [chunk.count('\n') for chunk in chunks[1:]] == [3, 1]
+
+
+def get_body_messages(url: str, headers: dict) -> list[bytes]:
+    """Bodies sent by the app, the test client joins them in one"""
+    messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    bodies = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # Never disconnects
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.body' and message['body']:
+            bodies.append(message['body'])
+
+    scope = {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': url,
+        'raw_path': url.encode(),
+        'root_path': '',
+        'query_string': b'',
+        'headers': [
+            (name.lower().encode(), value.encode())
+            for name, value in headers.items()
+        ],
+        'client': ('testclient', 50000),
+        'server': ('testserver', 80),
+    }
+    asyncio.run(app(scope, receive, send))
+    return bodies
+
+
+def test_export_route_streams_batches(auth_headers, ledger, monkeypatch):
+    monkeypatch.setattr(transaction, 'EXPORT_BATCH_SIZE', 3)
+
+    bodies = get_body_messages(
+        '/transaction/export', auth_headers(ledger['michael'])
+    )
+
+    header = ','.join(transaction.EXPORT_FIELDS) + '\r\n'
+    assert bodies[0].decode() == header
+    assert [body.count(b'\n') for body in bodies[1:]] == [3, 1]
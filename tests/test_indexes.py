@@ -0,0 +1,78 @@
+import pytest
+from sqlmodel import Session, text
+
+from dundie.controllers import get_listed_users_stmt, get_user_names_stmt
+from dundie.controllers.post import get_sorted_posts_stmt
+from dundie.controllers.shop import get_orders_stmt
+from dundie.controllers.transaction import get_user_transactions_stmt
+from dundie.tasks.queue import get_due_jobs_stmt
+
+
+def explain(session: Session, stmt) -> str:
+    """
+    Returns the query plan of `stmt`. On postgres sequential scans are
+    disabled, so the plan shows whether an index *can* serve the query even
+    on the tiny test tables.
+    """
+    dialect = session.bind.dialect
+    sql = str(
+        stmt.compile(dialect=dialect, compile_kwargs={'literal_binds': True})
+    )
+
+    if dialect.name == 'sqlite':
+        rows = session.exec(text(f'EXPLAIN QUERY PLAN {sql}')).all()
+        return '\n'.join(row[-1] for row in rows)
+
+    session.exec(text('SET LOCAL enable_seqscan = off'))
+    rows = session.exec(text(f'EXPLAIN {sql}')).all()
+    return '\n'.join(row[0] for row in rows)
+
+
+def assert_no_table_scan(plan: str, table: str):
+    # sqlite shows table scans as `SCAN table`, postgres as `Seq Scan`
+    assert f'SCAN {table}\n' not in plan + '\n', plan
+    assert 'Seq Scan' not in plan, plan
+
+
+def assert_uses_index(plan: str, table: str, index: str):
+    assert index in plan, plan
+    assert_no_table_scan(plan, table)
+
+
+@pytest.mark.parametrize(
+    'stmt, table, indexes',
+    [
+        (
+            get_user_transactions_stmt(1),
+            'transaction',
+            ['ix_transaction_user_id_date', 'ix_transaction_from_id_date'],
+        ),
+        (get_sorted_posts_stmt('like_desc'), 'post', ['ix_post_likes_id']),
+        (get_sorted_posts_stmt('like_asc'), 'post', ['ix_post_likes_id']),
+        (get_sorted_posts_stmt('date_desc'), 'post', ['ix_post_date_id']),
+        (get_sorted_posts_stmt('date_asc'), 'post', ['ix_post_date_id']),
+        (get_orders_stmt(), 'orders', ['ix_orders_status_id']),
+        (get_listed_users_stmt(), 'user', ['ix_user_listed']),
+        (get_due_jobs_stmt(), 'job', ['ix_job_status_run_at']),
+    ],
+    ids=[
+        'transactions', 'posts-like-desc', 'posts-like-asc',
+        'posts-date-desc', 'posts-date-asc', 'orders', 'listed-users',
+        'due-jobs',
+    ],
+)
+def test_hot_queries_use_indexes(migrated_session, stmt, table, indexes):
+    plan = explain(migrated_session, stmt.limit(50))
+    for index in indexes:
+        assert_uses_index(plan, table, index)
+
+
+def test_username_search_uses_index(migrated_session):
+    plan = explain(migrated_session, get_user_names_stmt('jim'))
+
+    if migrated_session.bind.dialect.name == 'postgresql':
+        assert_uses_index(plan, 'user', 'ix_user_listed_username_trgm')
+    else:
+        # infix LIKE can't seek a b-tree, a listed users partial index is
+        # scanned instead of the table, whichever the planner picks
+        assert_no_table_scan(plan, 'user')
@@ -0,0 +1,208 @@
+import threading
+from datetime import timedelta
+
+import pytest
+from sqlmodel import select
+
+from dundie import metrics
+from dundie.config import settings
+from dundie.models import Job
+from dundie.serializers import user as user_serializers
+from dundie.tasks import queue, user
+from dundie.tasks.queue import (
+    claim_job,
+    enqueue,
+    get_retry_delay,
+    renew_leases,
+    requeue_stale_jobs,
+    run_worker,
+    task,
+)
+from dundie.utils.utils import get_utcnow
+
+
+@pytest.fixture
+def record(monkeypatch):
+    """Registers the `record` task, its values are appended to `.calls`"""
+    monkeypatch.setattr(queue, 'tasks', dict(queue.tasks))
+    called = []
+    lock = threading.Lock()
+
+    @task('record')
+    def record(value, fail=False):
+        with lock:
+            called.append(value)
+        if fail:
+            raise RuntimeError('boom')
+
+    record.calls = called
+    return record
+
+
+def expire_lease(session, job: Job):
+    job.locked_at = get_utcnow() - timedelta(
+        seconds=settings.jobs.LEASE_SECONDS + 1
+    )
+    session.add(job)
+    session.commit()
+
+
+def test_password_reset_email_is_sent_by_the_worker(
+    client, session, create_user, monkeypatch
+):
+    create_user('jim')
+    # The deliverability check resolves the domain
+    monkeypatch.setattr(user_serializers, 'validate_email', lambda email: None)
+    sent = []
+    monkeypatch.setattr(
+        user, 'send_email', lambda email, message: sent.append(email)
+    )
+
+    response = client.post(
+        '/user/pwd_reset_token', json={'email': 'jim@dm.com'}
+    )
+
+    assert response.status_code == 200
+    assert sent == []
+    job = session.exec(select(Job)).one()
+    assert job.task == 'send_password_reset_email'
+    assert job.payload == {'email': 'jim@dm.com'}
+
+    run_worker(concurrency=1, burst=True)
+
+    assert sent == ['jim@dm.com']
+    session.expire_all()
+    assert session.exec(select(Job)).all() == []
+
+
+def test_concurrent_consumers_run_each_job_once(session, record):
+    for value in range(30):
+        enqueue(session, record, value=value)
+    session.commit()
+
+    run_worker(concurrency=4, burst=True)
+
+    assert sorted(record.calls) == list(range(30))
+    assert session.exec(select(Job)).all() == []
+
+
+def test_failed_jobs_are_retried_with_backoff(session, record, monkeypatch):
+    monkeypatch.setitem(settings.jobs, 'MAX_ATTEMPTS', 2)
+    job = enqueue(session, record, value=1, fail=True)
+    session.commit()
+
+    run_worker(concurrency=1, burst=True)
+
+    session.refresh(job)
+    assert record.calls == [1]
+    assert (job.status, job.attempts) == ('queued', 1)
+    assert job.last_error == 'RuntimeError: boom'
+    delay = (job.run_at - get_utcnow().replace(tzinfo=None)).total_seconds()
+    assert 0 < delay <= get_retry_delay(1)
+
+    job.run_at = get_utcnow()
+    session.add(job)
+    session.commit()
+    run_worker(concurrency=1, burst=True)
+
+    session.refresh(job)
+    assert record.calls == [1, 1]
+    assert (job.status, job.attempts) == ('failed', 2)
+
+
+def test_retry_delay_doubles_up_to_the_maximum(monkeypatch):
+    monkeypatch.setitem(settings.jobs, 'RETRY_BASE_SECONDS', 10)
+    monkeypatch.setitem(settings.jobs, 'RETRY_MAX_SECONDS', 60)
+
+    delays = [get_retry_delay(attempts) for attempts in range(1, 6)]
+
+    assert delays == [10, 20, 40, 60, 60]
+
+
+def test_stale_jobs_are_queued_again(session, record):
+    job = enqueue(session, record, value=1)
+    session.commit()
+    claimed = claim_job(session, 'dead-worker')
+    assert claimed.id == job.id
+    assert claim_job(session, 'other-worker') is None
+
+    assert requeue_stale_jobs(session) == 0
+    expire_lease(session, claimed)
+    assert requeue_stale_jobs(session) == 1
+
+    run_worker(concurrency=1, burst=True)
+    assert record.calls == [1]
+
+
+def test_stale_jobs_fail_after_their_last_attempt(
+    session, record, monkeypatch
+):
+    # A job whose worker dies (killed by the job) every time it runs
+    monkeypatch.setitem(settings.jobs, 'MAX_ATTEMPTS', 2)
+    job = enqueue(session, record, value=1)
+    session.commit()
+
+    for attempt in (1, 2):
+        claimed = claim_job(session, 'dead-worker')
+        assert (claimed.id, claimed.attempts) == (job.id, attempt)
+        expire_lease(session, claimed)
+        assert requeue_stale_jobs(session) == 1
+
+    session.refresh(job)
+    assert (job.status, job.attempts) == ('failed', 2)
+    assert job.last_error == 'Lease expired, the worker stopped'
+    assert job.locked_by is None
+    assert claim_job(session, 'other-worker') is None
+
+
+def test_leases_of_running_jobs_are_renewed(session, record):
+    for value in (1, 2):
+        enqueue(session, record, value=value)
+    session.commit()
+    alive = claim_job(session, 'host:1:0')
+    dead = claim_job(session, 'host:2:0')
+    expire_lease(session, alive)
+    expire_lease(session, dead)
+
+    assert renew_leases(session, 'host:1') == 1
+    assert requeue_stale_jobs(session) == 1
+
+    session.refresh(alive)
+    session.refresh(dead)
+    assert (alive.status, alive.locked_by) == ('running', 'host:1:0')
+    assert dead.status == 'queued'
+
+
+def test_unregistered_functions_are_refused(session):
+    with pytest.raises(ValueError):
+        enqueue(session, print, value=1)
+
+
+def test_queue_depth_metrics(client, session, record):
+    enqueue(session, record, value=1)
+    enqueue(session, record, value=2)
+    session.commit()
+
+    response = client.get('/metrics')
+
+    assert 'dundie_jobs{task="record",status="queued"} 2' in response.text
+    assert 'dundie_jobs_wait_seconds{task="record"}' in response.text
+
+
+def test_queue_stats_are_read_once_per_scrape(session, record, monkeypatch):
+    enqueue(session, record, value=1)
+    session.commit()
+    reads = []
+    get_queue_stats = queue.get_queue_stats
+
+    def counted(session):
+        reads.append(1)
+        return get_queue_stats(session)
+
+    monkeypatch.setattr(queue, 'get_queue_stats', counted)
+
+    text = metrics.render()
+
+    assert len(reads) == 1
+    assert 'dundie_jobs{task="record",status="queued"} 1' in text
+    assert 'dundie_jobs_wait_seconds{task="record"}' in text
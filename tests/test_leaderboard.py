@@ -0,0 +1,154 @@
+import asyncio
+import logging
+
+import pytest
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from dundie.controllers import ranking
+from dundie.controllers.ranking import (
+    leaderboard,
+    load_leaderboard,
+    sync_leaderboard,
+)
+from dundie.controllers.transaction import check_and_transfer_points
+from dundie.db import async_engine, engine
+from dundie.models import Balance, User
+from dundie.utils.leaderboard import Leaderboard
+
+
+def create_board(points: dict[int, int]) -> Leaderboard:
+    board = Leaderboard()
+    board.load(
+        (user_id, {'username': f'user{user_id}'}, value)
+        for user_id, value in points.items()
+    )
+    return board
+
+
+def test_top_is_sorted_by_points_then_id():
+    board = create_board({1: 10, 2: 30, 3: 20, 4: 30})
+
+    top = board.top(3)
+
+    assert [(item['id'], item['points']) for item in top] == [
+        (2, 30), (4, 30), (3, 20)
+    ]
+    assert top[0]['username'] == 'user2'
+
+
+def test_ties_share_the_rank():
+    board = create_board({1: 10, 2: 30, 3: 20, 4: 30})
+
+    assert [board.rank(user_id) for user_id in (2, 4, 3, 1)] == [1, 1, 3, 4]
+    assert board.rank(5) is None
+
+
+def test_add_points_moves_the_user():
+    board = create_board({1: 10, 2: 30, 3: 20})
+
+    board.add_points(1, 25)
+    board.add_points(2, -30)
+    board.add_points(5, 100)
+
+    assert [item['id'] for item in board.top(3)] == [1, 3, 2]
+    assert (board.points(1), board.rank(1)) == (35, 1)
+    assert (board.points(2), board.rank(2)) == (0, 3)
+    assert board.points(5) is None
+    assert len(board) == 3
+
+
+def test_users_changed_while_loading_are_read_again():
+    board = create_board({1: 10, 2: 20})
+    changed = board.track()
+
+    # A transfer of 5 points from 1 to 2 commits while the points are read
+    board.add_points(1, -5)
+    board.add_points(2, 5)
+    stale = board.load(
+        [(1, {}, 10), (2, {}, 20), (3, {}, 0)], changed
+    )
+    assert stale == {1, 2}
+
+    # Read again, 2 changed once more meanwhile and stays stale
+    board.add_points(2, 1)
+    stale = board.set_points({1: 5, 2: 25}, changed)
+    assert stale == {2}
+    assert board.points(1) == 5
+
+    stale = board.set_points({2: 26}, changed)
+    board.untrack(changed)
+    assert stale == set()
+    assert board.points(2) == 26
+    board.add_points(3, 1)
+    assert changed == set()
+
+
+def test_transfer_during_load_is_not_lost(session, create_user, monkeypatch):
+    jim = create_user('jim', balance=100)
+    pam = create_user('pam', balance=0)
+    load = leaderboard.load
+
+    def transfer_then_load(entries, changed=None):
+        # The balances were read, the transfer commits before the swap
+        with Session(engine) as other:
+            sender = other.exec(select(User).where(User.id == jim.id)).one()
+            check_and_transfer_points(
+                'pam', 30, from_user=sender, session=other
+            )
+        return load(entries, changed)
+
+    async def main():
+        async with AsyncSession(async_engine) as async_session:
+            await load_leaderboard(async_session)
+
+    asyncio.run(main())
+    monkeypatch.setattr(leaderboard, 'load', transfer_then_load)
+    asyncio.run(main())
+
+    balances = dict(
+        session.exec(select(Balance.user_id, Balance.value)).all()
+    )
+    assert balances == {jim.id: 70, pam.id: 30}
+    assert leaderboard.points(jim.id) == 70
+    assert leaderboard.points(pam.id) == 30
+    assert leaderboard._trackers == []
+    leaderboard.loaded = False
+
+
+def test_failed_reloads_are_logged(monkeypatch, caplog):
+    async def load_leaderboard(session):
+        raise ConnectionError('database is down')
+
+    monkeypatch.setattr(ranking, 'load_leaderboard', load_leaderboard)
+    # The logging config of the migrations disables the existing loggers
+    monkeypatch.setattr(ranking.logger, 'disabled', False)
+
+    with caplog.at_level(logging.ERROR, logger='dundie.ranking'):
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(asyncio.wait_for(sync_leaderboard(0.01), 0.05))
+
+    assert caplog.records
+    record = caplog.records[0]
+    assert record.getMessage() == 'Failed to load the leaderboard'
+    assert record.exc_info[0] is ConnectionError
+
+
+def test_cancelled_reloads_stop_the_sync(monkeypatch):
+    async def load_leaderboard(session):
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            # As the session of a query cancelled by the shutdown
+            raise ConnectionError('cannot close the session')
+
+    monkeypatch.setattr(ranking, 'load_leaderboard', load_leaderboard)
+
+    async def main():
+        task = asyncio.create_task(sync_leaderboard(60))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        done, _ = await asyncio.wait([task], timeout=1)
+        return task in done and task.cancelled()
+
+    assert asyncio.run(main())
@@ -0,0 +1,78 @@
+import re
+
+from dundie.metrics import REQUESTS_IN_FLIGHT
+from dundie.models import Post
+from dundie.security import get_password_hash
+
+
+def get_sample(text: str, sample: str) -> float:
+    """Value of the `sample` line (name and labels) of a scrape, or 0"""
+    match = re.search(rf'^{re.escape(sample)} (\S+)$', text, re.M)
+    return float(match.group(1)) if match else 0
+
+
+def test_requests_are_labelled_by_route_template(
+    client, session, create_user, auth_headers
+):
+    jim = create_user('jim')
+    post = Post(content='Bears. Beets.', user_id=jim.id)
+    session.add(post)
+    session.commit()
+    sample = (
+        'dundie_http_requests_total'
+        '{method="POST",route="/post/{post_id}/like",status="200"}'
+    )
+    before = get_sample(client.get('/metrics').text, sample)
+
+    response = client.post(
+        f'/post/{post.id}/like', headers=auth_headers(jim)
+    )
+    assert response.status_code == 200
+
+    text = client.get('/metrics').text
+    assert get_sample(text, sample) == before + 1
+    assert f'route="/post/{post.id}/like"' not in text
+    assert get_sample(
+        text,
+        'dundie_http_request_duration_seconds_count'
+        '{method="POST",route="/post/{post_id}/like"}',
+    ) >= 1
+
+
+def test_in_flight_requests_go_back_to_zero(client):
+    text = client.get('/metrics').text
+
+    # Only the scrape itself was in flight
+    assert get_sample(text, 'dundie_http_requests_in_flight') == 1
+    assert REQUESTS_IN_FLIGHT.samples() == [('', '', 0)]
+    assert client.get('/unknown').status_code == 404
+    assert REQUESTS_IN_FLIGHT.samples() == [('', '', 0)]
+    assert get_sample(
+        client.get('/metrics').text,
+        'dundie_http_requests_total'
+        '{method="GET",route="unmatched",status="404"}',
+    ) >= 1
+
+
+def test_pool_and_hashing_series(client, session, create_user):
+    jim = create_user('jim')
+    jim.password = get_password_hash('Bears123')
+    session.add(jim)
+    session.commit()
+
+    response = client.post(
+        '/token', data={'username': 'jim', 'password': 'Bears123'}
+    )
+    assert response.status_code == 200
+
+    text = client.get('/metrics').text
+    assert get_sample(
+        text,
+        'dundie_hashing_duration_seconds_count{operation="verify_password"}',
+    ) >= 1
+    assert '# TYPE dundie_hashing_rejected_total counter' in text
+    assert get_sample(text, 'dundie_db_pool_size{engine="sync"}') > 0
+    assert get_sample(
+        text, 'dundie_db_pool_checkouts_total{engine="async"}'
+    ) >= 1
+    assert 'dundie_db_pool_wait_seconds_count{engine="async"}' in text
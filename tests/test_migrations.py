@@ -0,0 +1,28 @@
+from sqlalchemy import inspect
+from sqlmodel import text
+
+
+def test_updated_at_has_no_server_default(migrated_session):
+    columns = {
+        column['name']: column
+        for column in inspect(migrated_session.bind).get_columns('user')
+    }
+
+    assert columns['updated_at']['default'] is None
+    assert columns['updated_at']['nullable'] is False
+
+
+def test_user_indexes_survive_the_table_rebuild(migrated_session):
+    # sqlite recreates the user table to drop the updated_at default
+    indexes = inspect(migrated_session.bind).get_indexes('user')
+
+    assert {'ix_user_email', 'ix_user_username', 'ix_user_listed'} <= {
+        index['name'] for index in indexes
+    }
+    if migrated_session.bind.dialect.name == 'sqlite':
+        sql = migrated_session.exec(
+            text(
+                "SELECT sql FROM sqlite_master WHERE name = 'ix_user_listed'"
+            )
+        ).one()[0]
+        assert 'WHERE is_active = 1 AND private = 0' in sql
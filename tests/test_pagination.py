@@ -0,0 +1,173 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session
+
+from dundie.controllers import get_listed_users_stmt
+from dundie.db import async_engine, engine
+from dundie.models import Feedbacks, Post, Transaction
+from dundie.pagination import count_cache, count_total
+
+CURSOR_URLS = [
+    '/post/cursor',
+    '/transaction/list/cursor',
+    '/feedback/all/cursor',
+    '/admin/user/cursor',
+]
+BASE_DATE = datetime(2024, 1, 1)
+
+
+def test_count_total_is_cached_until_the_table_changes(
+    session, create_user
+):
+    create_user('jim')
+    count_cache.clear()
+
+    counts = []
+
+    def record_count(conn, cursor, statement, *args):
+        if 'count(' in statement.lower():
+            counts.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record_count)
+    try:
+        assert count_total(session, get_listed_users_stmt()) == 1
+        assert count_total(session, get_listed_users_stmt()) == 1
+        assert len(counts) == 1
+
+        # Committing an insert drops the cached total of the table
+        create_user('pam')
+        with Session(engine) as other_session:
+            assert count_total(other_session, get_listed_users_stmt()) == 2
+        assert len(counts) == 2
+    finally:
+        event.remove(engine, 'before_cursor_execute', record_count)
+
+
+@contextmanager
+def record_counts():
+    """Collects the COUNT statements executed by both engines"""
+    counts = []
+
+    def record_count(conn, cursor, statement, *args):
+        if 'count(' in statement.lower():
+            counts.append(statement)
+
+    engines = engine, async_engine.sync_engine
+    for item in engines:
+        event.listen(item, 'before_cursor_execute', record_count)
+    try:
+        yield counts
+    finally:
+        for item in engines:
+            event.remove(item, 'before_cursor_execute', record_count)
+
+
+@pytest.fixture
+def cursor_routes(session, create_user):
+    """
+    The cursor routes and a function adding their nth row, the rows with a
+    larger n are listed first
+    """
+    michael = create_user('michael', dept='management')
+    pam = create_user('pam')
+
+    def add_post(n):
+        session.add(Post(
+            content=f'post {n}',
+            user_id=pam.id,
+            date=BASE_DATE + timedelta(minutes=n),
+        ))
+
+    def add_transaction(n):
+        session.add(Transaction(
+            user_id=michael.id,
+            from_id=pam.id,
+            value=n,
+            date=BASE_DATE + timedelta(minutes=n),
+        ))
+
+    def add_feedback(n):
+        session.add(Feedbacks(
+            email='pam@dm.com',
+            name='Pam',
+            feedback=f'feedback {n}',
+            created_at=BASE_DATE + timedelta(minutes=n),
+        ))
+
+    def add_user(n):
+        # Sorted by name, "A79" comes after "A68"
+        create_user(f'a{99 - n}')
+
+    return michael, {
+        '/post/cursor': add_post,
+        '/transaction/list/cursor': add_transaction,
+        '/feedback/all/cursor': add_feedback,
+        '/admin/user/cursor': add_user,
+    }
+
+
+def get_ids(response) -> list[int]:
+    assert response.status_code == 200, response.text
+    return [item['id'] for item in response.json()['items']]
+
+
+@pytest.mark.parametrize('url', CURSOR_URLS)
+def test_cursor_pages_are_stable_while_rows_are_inserted(
+    client, auth_headers, session, cursor_routes, url
+):
+    michael, routes = cursor_routes
+    add_row = routes[url]
+    for n in range(20, 25):
+        add_row(n)
+    session.commit()
+    headers = auth_headers(michael)
+    expected = get_ids(client.get(url, params={'size': 100}, headers=headers))
+
+    ids = []
+    params = {'size': 2}
+    for n in range(1, 10):
+        response = client.get(url, params=params, headers=headers)
+        ids.extend(get_ids(response))
+        next_page = response.json()['next_page']
+        if next_page is None:
+            break
+        # Sorted before the rows already returned, so never listed by the
+        # following pages
+        add_row(30 + n)
+        session.commit()
+        params = {'size': 2, 'cursor': next_page}
+
+    assert ids == expected
+    # The inserted rows are listed from the first page
+    listed = get_ids(client.get(url, params={'size': 100}, headers=headers))
+    assert listed[len(listed) - len(expected):] == expected
+    assert len(listed) > len(expected)
+
+
+@pytest.mark.parametrize('url', CURSOR_URLS)
+def test_cursor_total_is_only_counted_when_requested(
+    client, auth_headers, session, cursor_routes, url
+):
+    michael, routes = cursor_routes
+    for n in range(20, 23):
+        routes[url](n)
+    session.commit()
+    headers = auth_headers(michael)
+    expected = len(get_ids(client.get(url, headers=headers)))
+
+    with record_counts() as counts:
+        response = client.get(url, params={'size': 1}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()['total'] is None
+    assert counts == []
+
+    with record_counts() as counts:
+        response = client.get(
+            url, params={'size': 1, 'include_total': True}, headers=headers
+        )
+    assert response.status_code == 200
+    assert response.json()['total'] == expected
+    assert len(counts) == 1
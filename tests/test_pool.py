@@ -0,0 +1,143 @@
+import asyncio
+import logging
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+from sqlmodel import create_engine
+
+import dundie.app
+from dundie import db
+from dundie.app import app, lifespan
+from dundie.config import settings
+from dundie.db import get_pool_options, warm_up_async_pool, warm_up_pool
+
+
+def test_failed_warm_up_is_logged(monkeypatch, caplog):
+    def warm_up_pool(connections):
+        raise ConnectionError('database is down')
+
+    async def sync_forever(interval):
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(dundie.app, 'warm_up_pool', warm_up_pool)
+    for name in ('sync_leaderboard', 'sync_user_search', 'monitor_replicas'):
+        monkeypatch.setattr(dundie.app, name, sync_forever)
+    # The logging config of the migrations disables the existing loggers
+    monkeypatch.setattr(dundie.app.logger, 'disabled', False)
+
+    async def main():
+        # The app still starts
+        async with lifespan(app):
+            pass
+
+    with caplog.at_level(logging.ERROR, logger='dundie.app'):
+        asyncio.run(main())
+
+    record, = caplog.records
+    assert record.getMessage() == 'Failed to warm up the connection pools'
+    assert record.exc_info[0] is ConnectionError
+
+
+@pytest.fixture
+def pool_settings(monkeypatch):
+    monkeypatch.setitem(settings.db, 'POOL_SIZE', 3)
+    monkeypatch.setitem(settings.db, 'MAX_OVERFLOW', 2)
+    monkeypatch.setitem(settings.db, 'POOL_TIMEOUT', 7)
+
+
+def test_pool_settings_are_applied_to_queue_pools(pool_settings, tmp_path):
+    uri = f'sqlite:///{tmp_path}/dundie.db'
+    engine = create_engine(uri, **get_pool_options(uri))
+
+    assert isinstance(engine.pool, QueuePool)
+    assert engine.pool.size() == 3
+    assert engine.pool._max_overflow == 2
+    assert engine.pool.timeout() == 7
+    assert engine.pool._pre_ping is settings.db.POOL_PRE_PING
+    assert engine.pool._recycle == settings.db.POOL_RECYCLE
+
+
+@pytest.mark.parametrize(
+    'uri',
+    [
+        'postgresql://dundie:dundie@db:5432/dundie',
+        'postgresql+asyncpg://dundie:dundie@db:5432/dundie',
+    ],
+)
+def test_postgres_pools_get_the_size_options(pool_settings, uri):
+    assert get_pool_options(uri) == {
+        'pool_pre_ping': settings.db.POOL_PRE_PING,
+        'pool_recycle': settings.db.POOL_RECYCLE,
+        'pool_size': 3,
+        'max_overflow': 2,
+        'pool_timeout': 7,
+    }
+
+
+@pytest.mark.parametrize('uri', ['sqlite://', 'sqlite+aiosqlite:///dundie.db'])
+def test_pools_without_a_size_get_no_size_options(pool_settings, uri):
+    assert get_pool_options(uri) == {
+        'pool_pre_ping': settings.db.POOL_PRE_PING,
+        'pool_recycle': settings.db.POOL_RECYCLE,
+    }
+
+
+def test_warm_up_opens_up_to_the_pool_size(tmp_path, monkeypatch):
+    engine = create_engine(f'sqlite:///{tmp_path}/dundie.db', pool_size=3)
+    monkeypatch.setattr(db, 'engine', engine)
+
+    assert warm_up_pool(2) == 2
+    assert engine.pool.checkedin() == 2
+    assert warm_up_pool(5) == 3
+    assert engine.pool.checkedin() == 3
+    assert engine.pool.checkedout() == 0
+    engine.dispose()
+
+    monkeypatch.setattr(db, 'engine', create_engine('sqlite://'))
+    assert warm_up_pool(5) == 0
+
+
+def test_async_warm_up_opens_up_to_the_pool_size(tmp_path, monkeypatch):
+    uri = f'sqlite+aiosqlite:///{tmp_path}/dundie.db'
+
+    async def warm_up(**options):
+        engine = create_async_engine(uri, **options)
+        monkeypatch.setattr(db, 'async_engine', engine)
+        try:
+            opened = await warm_up_async_pool(5)
+            return opened, engine.sync_engine.pool.status()
+        finally:
+            await engine.dispose()
+
+    opened, status = asyncio.run(
+        warm_up(poolclass=AsyncAdaptedQueuePool, pool_size=2)
+    )
+    assert opened == 2
+    assert 'Connections in pool: 2' in status
+    opened, _ = asyncio.run(warm_up(poolclass=NullPool))
+    assert opened == 0
+
+
+def test_pool_stats_route(client, auth_headers, create_user):
+    michael = create_user('michael', dept='management')
+    jim = create_user('jim')
+
+    response = client.get('/admin/stats/pool', headers=auth_headers(michael))
+
+    assert response.status_code == 200
+    stats = response.json()
+    pool = db.engine.pool
+    assert stats['sync'] == {
+        'pool': 'QueuePool',
+        'size': settings.db.POOL_SIZE,
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+    }
+    # Only the queue pools report their size, aiosqlite uses a NullPool
+    async_pool = type(db.async_engine.sync_engine.pool).__name__
+    assert stats['async']['pool'] == async_pool
+    assert client.get(
+        '/admin/stats/pool', headers=auth_headers(jim)
+    ).status_code == 401
@@ -0,0 +1,114 @@
+import asyncio
+
+import httpx
+
+from dundie.app import app
+from dundie.models import Post
+
+REQUESTS = 10
+
+
+def like_concurrently(post_id: int, headers: list[dict]) -> list[int]:
+    """Sends every like at once, returns the status codes"""
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url='http://test'
+        ) as client:
+            responses = await asyncio.gather(
+                *(
+                    client.post(f'/post/{post_id}/like', headers=item)
+                    for item in headers
+                )
+            )
+        return [response.status_code for response in responses]
+
+    return asyncio.run(main())
+
+
+def get_likes(session, post_id: int) -> int:
+    session.expire_all()
+    return session.get(Post, post_id).likes
+
+
+def create_post(session, user) -> int:
+    post = Post(content='Bears. Beets.', user_id=user.id)
+    session.add(post)
+    session.commit()
+    return post.id
+
+
+def test_double_like_counts_once(client, session, create_user, auth_headers):
+    jim = create_user('jim')
+    post_id = create_post(session, jim)
+    headers = auth_headers(jim)
+
+    first = client.post(f'/post/{post_id}/like', headers=headers)
+    second = client.post(f'/post/{post_id}/like', headers=headers)
+
+    assert first.status_code == 200
+    assert first.json()['likes'] == 1
+    assert second.status_code == 409
+    assert get_likes(session, post_id) == 1
+
+
+def test_concurrent_likes_are_all_counted(
+    session, create_user, auth_headers
+):
+    users = [create_user(f'user{index}') for index in range(REQUESTS)]
+    post_id = create_post(session, users[0])
+
+    statuses = like_concurrently(post_id, [auth_headers(u) for u in users])
+
+    assert statuses == [200] * REQUESTS
+    assert get_likes(session, post_id) == REQUESTS
+
+
+def test_concurrent_likes_of_an_user_count_once(
+    session, create_user, auth_headers
+):
+    jim = create_user('jim')
+    post_id = create_post(session, jim)
+
+    statuses = like_concurrently(post_id, [auth_headers(jim)] * REQUESTS)
+
+    assert sorted(statuses) == [200] + [409] * (REQUESTS - 1)
+    assert get_likes(session, post_id) == 1
+
+
+def test_unlike_without_like_changes_nothing(
+    client, session, create_user, auth_headers
+):
+    jim = create_user('jim')
+    pam = create_user('pam')
+    post_id = create_post(session, jim)
+    client.post(f'/post/{post_id}/like', headers=auth_headers(pam))
+
+    response = client.delete(
+        f'/post/{post_id}/like', headers=auth_headers(jim)
+    )
+
+    assert response.status_code == 404
+    assert get_likes(session, post_id) == 1
+
+
+def test_like_and_unlike(client, session, create_user, auth_headers):
+    jim = create_user('jim')
+    post_id = create_post(session, jim)
+    headers = auth_headers(jim)
+
+    client.post(f'/post/{post_id}/like', headers=headers)
+    response = client.delete(f'/post/{post_id}/like', headers=headers)
+
+    assert response.status_code == 200
+    assert response.json()['likes'] == 0
+    assert get_likes(session, post_id) == 0
+
+
+def test_like_missing_post(client, session, create_user, auth_headers):
+    jim = create_user('jim')
+
+    response = client.post('/post/404/like', headers=auth_headers(jim))
+
+    assert response.status_code == 404
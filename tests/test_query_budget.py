@@ -0,0 +1,84 @@
+import logging
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlmodel import text
+
+from dundie import middlewares
+from dundie.controllers.ranking import leaderboard
+from dundie.controllers.search import user_search
+from dundie.controllers.transaction import check_and_transfer_points
+from dundie.db import engine
+from dundie.middlewares import QueryStatsMiddleware
+from dundie.models import Post
+from dundie.response_cache import backend
+
+# Statements allowed per route once the authenticated user, the page totals
+# and the in-memory indexes are cached (the responses are not). They must
+# not grow with the number of items returned.
+BUDGETS = {
+    '/post': 2,
+    '/post/cursor': 2,
+    '/transaction/list': 3,
+    '/transaction/recent': 3,
+    '/user': 1,
+    '/user/profile': 2,
+    '/user/public/pam': 3,
+    '/user/names?query=pa': 0,
+    '/ranking': 0,
+    '/ranking/me': 0,
+}
+
+
+@pytest.fixture
+def populated(session, create_user):
+    """Users with posts and transactions, enough to expose an N+1"""
+    jim = create_user('jim', balance=1000)
+    for index in range(10):
+        user = create_user(f'user{index}', balance=100)
+        session.add(Post(content=f'post {index}', user_id=user.id))
+        check_and_transfer_points(
+            user.username, 10, from_user=jim, session=session
+        )
+    create_user('pam')
+    session.commit()
+
+    # The in-memory indexes are loaded on the first request
+    leaderboard.loaded = user_search.loaded = False
+    return jim
+
+
+@pytest.mark.parametrize('url, budget', BUDGETS.items())
+def test_route_query_budget(
+    client, auth_headers, query_budget, populated, url, budget
+):
+    headers = auth_headers(populated)
+    # The first request warms the caches, the cached responses are dropped
+    # to measure the route itself
+    client.get(url, headers=headers)
+    backend.clear()
+    query_budget(client.get(url, headers=headers), budget)
+
+
+def test_repeated_statements_are_logged(caplog, monkeypatch):
+    app = FastAPI()
+    app.add_middleware(QueryStatsMiddleware, repeated_threshold=3)
+
+    @app.get('/user/{user_id}')
+    def get_user(user_id: int):
+        with engine.connect() as connection:
+            for _ in range(3):
+                connection.execute(text('SELECT :id'), {'id': user_id})
+
+    # The logging config of the migrations disables the existing loggers
+    monkeypatch.setattr(middlewares.logger, 'disabled', False)
+    with caplog.at_level(logging.WARNING, logger='dundie.query_stats'):
+        assert TestClient(app).get('/user/1').status_code == 200
+
+    record, = caplog.records
+    assert record.name == 'dundie.query_stats'
+    assert record.getMessage().startswith(
+        'Possible N+1 on GET /user/{user_id}: statement executed 3 times: '
+        'SELECT '
+    )
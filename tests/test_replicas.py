@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+import tempfile
+
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+
+from dundie import db
+from dundie.models import Post, User
+
+
+@pytest.fixture
+def replica(session, create_user, monkeypatch):
+    """
+    A second SQLite database used as the only replica. It does not
+    replicate anything, the rows it has tell where a read was served from.
+    """
+    jim = create_user('jim')
+    session.add(Post(content='from the primary', user_id=jim.id))
+    session.commit()
+
+    uri = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'replica.db')
+    replica_engine = create_engine(uri)
+    SQLModel.metadata.create_all(replica_engine)
+    with Session(replica_engine) as replica_session:
+        replica_session.add(
+            User(
+                id=jim.id, name='Jim', username='jim', dept='sales',
+                email='jim@dm.com', password='!', currency='USD',
+            )
+        )
+        replica_session.add(Post(content='from the replica', user_id=jim.id))
+        replica_session.commit()
+
+    replicas = db.ReplicaSet([uri], max_lag=5)
+    monkeypatch.setattr(db, 'replicas', replicas)
+    db.recent_writers.clear()
+    yield jim, replicas
+    replica_engine.dispose()
+
+
+def get_contents(client, headers) -> list[str]:
+    response = client.get('/post', headers=headers)
+    assert response.status_code == 200, response.text
+    return [post['content'] for post in response.json()['items']]
+
+
+def test_reads_go_to_the_replica_until_the_user_writes(
+    client, auth_headers, replica
+):
+    jim, _ = replica
+    headers = auth_headers(jim)
+    assert get_contents(client, headers) == ['from the replica']
+
+    response = client.post('/post', headers=headers, json={'content': 'new'})
+    assert response.status_code == 200, response.text
+
+    # Read-your-writes: the primary serves the user for a while
+    assert get_contents(client, headers) == ['new', 'from the primary']
+
+
+def test_unhealthy_replicas_fall_back_to_the_primary(
+    client, auth_headers, replica, monkeypatch, caplog
+):
+    jim, replicas = replica
+    lagging, down = (
+        db.create_async_engine_from_settings('sqlite+aiosqlite://')
+        for _ in range(2)
+    )
+    replicas.engines += [lagging, down]
+
+    async def get_replication_lag(engine):
+        if engine is down:
+            raise ConnectionError('replica is down')
+        return 60 if engine is lagging else 0
+
+    monkeypatch.setattr(db, 'get_replication_lag', get_replication_lag)
+    # The logging config of the migrations disables the existing loggers
+    monkeypatch.setattr(db.logger, 'disabled', False)
+    with caplog.at_level(logging.WARNING, logger='dundie.db'):
+        asyncio.run(replicas.check())
+    assert replicas.healthy == replicas.engines[:1]
+    assert [record.getMessage() for record in caplog.records] == [
+        f'Replica {lagging.url!r} is 60.0s behind',
+        f'Replica {down.url!r} is unavailable: replica is down',
+    ]
+
+    replicas.healthy = []
+    assert get_contents(client, auth_headers(jim)) == ['from the primary']
+
+
+def test_cancelled_checks_stop_the_monitor(replica, monkeypatch):
+    async def get_replication_lag(engine):
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            # As the session of a query cancelled by the shutdown
+            raise ConnectionError('cannot close the connection')
+
+    monkeypatch.setattr(db, 'get_replication_lag', get_replication_lag)
+
+    async def main():
+        task = asyncio.create_task(db.monitor_replicas(60))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        done, _ = await asyncio.wait([task], timeout=1)
+        return task in done and task.cancelled()
+
+    assert asyncio.run(main())
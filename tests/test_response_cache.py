@@ -0,0 +1,158 @@
+import asyncio
+import threading
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from dundie import response_cache
+from dundie.controllers.ranking import leaderboard
+from dundie.response_cache import (
+    MemoryBackend,
+    cache_response,
+    invalidate_responses,
+    invalidate_responses_async,
+)
+
+
+class ItemsApp:
+    """
+    App with a cached `/items` route returning `items`, its endpoint waits
+    for `release` when `gated` and counts its runs in `calls`
+    """
+
+    def __init__(self):
+        self.items = ['mug']
+        self.calls = 0
+        self.gated = False
+        self.entered = asyncio.Event()
+        self.release = asyncio.Event()
+        self.app = FastAPI()
+
+        @self.app.get('/items')
+        @cache_response(ttl=60, tags=('items',))
+        async def get_items():
+            self.calls += 1
+            items = list(self.items)
+            if self.gated:
+                self.entered.set()
+                await self.release.wait()
+            return items
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=self.app),
+            base_url='http://test',
+        )
+
+
+def test_hits_are_served_without_running_the_endpoint():
+    items = ItemsApp()
+
+    async def main():
+        async with items.client() as client:
+            return [await client.get('/items') for _ in range(3)]
+
+    responses = asyncio.run(main())
+
+    assert [r.headers['X-Cache'] for r in responses] == [
+        'MISS', 'HIT', 'HIT'
+    ]
+    assert {r.text for r in responses} == {'["mug"]'}
+    assert items.calls == 1
+
+
+def test_invalidated_responses_are_rendered_again():
+    items = ItemsApp()
+
+    async def main():
+        async with items.client() as client:
+            await client.get('/items')
+            items.items.append('stapler')
+            invalidate_responses('items')
+            first = await client.get('/items')
+            second = await client.get('/items')
+            return first, second
+
+    first, second = asyncio.run(main())
+
+    assert first.headers['X-Cache'] == 'MISS'
+    assert first.json() == ['mug', 'stapler']
+    assert second.headers['X-Cache'] == 'HIT'
+    assert items.calls == 2
+
+
+def test_response_rendered_during_an_invalidation_is_not_cached():
+    items = ItemsApp()
+    items.gated = True
+
+    async def main():
+        async with items.client() as client:
+            # Reads the items, then the write happens before it is cached
+            pending = asyncio.create_task(client.get('/items'))
+            await items.entered.wait()
+            items.items.append('stapler')
+            await invalidate_responses_async('items')
+            items.release.set()
+            stale = await pending
+
+            items.gated = False
+            return stale, await client.get('/items')
+
+    stale, fresh = asyncio.run(main())
+
+    assert stale.json() == ['mug']
+    assert fresh.headers['X-Cache'] == 'MISS'
+    assert fresh.json() == ['mug', 'stapler']
+    assert items.calls == 2
+
+
+def test_blocking_backends_are_invalidated_in_a_thread(monkeypatch):
+    threads = []
+
+    class BlockingBackend(MemoryBackend):
+        blocking = True
+
+        def invalidate(self, tag: str) -> int:
+            threads.append(threading.get_ident())
+            return super().invalidate(tag)
+
+    monkeypatch.setattr(response_cache, 'backend', BlockingBackend(16))
+
+    async def main():
+        await invalidate_responses_async('ranking', 'transactions')
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(main())
+
+    assert len(threads) == 2
+    assert loop_thread not in threads
+
+
+@pytest.fixture
+def ranking_users(session, create_user):
+    users = create_user('jim', balance=100), create_user('pam', balance=50)
+    leaderboard.loaded = False
+    return users
+
+
+def test_transfers_invalidate_the_ranking(
+    client, auth_headers, ranking_users
+):
+    jim, pam = ranking_users
+    headers = auth_headers(jim)
+    # Loading the leaderboard invalidates the ranking, the first response
+    # is not cached
+    for _ in range(2):
+        ranking = client.get('/ranking', headers=headers)
+    assert ranking.json()[0]['id'] == jim.id
+    assert client.get('/ranking', headers=headers).headers['X-Cache'] == 'HIT'
+
+    response = client.post(
+        '/transaction/pam', params={'points': 60}, headers=headers
+    )
+    assert response.status_code == 200, response.text
+
+    ranking = client.get('/ranking', headers=headers)
+    assert ranking.headers['X-Cache'] == 'MISS'
+    assert [item['id'] for item in ranking.json()] == [pam.id, jim.id]
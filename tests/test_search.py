@@ -0,0 +1,175 @@
+import asyncio
+import logging
+
+import pytest
+
+from dundie.controllers import search
+from dundie.controllers.search import (
+    sync_user_search,
+    update_user_search,
+    user_search,
+)
+from dundie.utils.search import GRAM_SIZE, UserSearchIndex
+from dundie.utils.utils import get_username
+
+
+@pytest.fixture(autouse=True)
+def reset_user_search():
+    """The next search of the app loads the index from the database"""
+    user_search.loaded = False
+    yield
+    user_search.load([])
+    user_search.loaded = False
+
+
+def create_index(users: list[tuple[str, str]]) -> UserSearchIndex:
+    index = UserSearchIndex(normalize=get_username)
+    index.load(
+        (user_id, username, name)
+        for user_id, (username, name) in enumerate(users, start=1)
+    )
+    return index
+
+
+def get_usernames(results: list[dict]) -> list[str]:
+    return [result['username'] for result in results]
+
+
+def test_prefix_matches_come_before_substring_matches():
+    index = create_index([
+        ('stanley', 'Stanley Hudson'),
+        ('chuck', 'Chuck Norris'),
+        ('packer', 'Hugh Packer'),
+        ('hunter', 'Hunter Raymond'),
+        ('kevin', 'Kevin Malone'),
+    ])
+
+    # username prefix, name prefix, username substring, name substring
+    assert get_usernames(index.search('hu')) == [
+        'hunter', 'packer', 'chuck', 'stanley'
+    ]
+
+
+def test_exact_username_is_ranked_first():
+    index = create_index([
+        ('jim', 'Jim Halpert'),
+        ('jimmy', 'Jimmy Palmer'),
+        ('ajim', 'Ajim Jimenez'),
+    ])
+
+    assert get_usernames(index.search('jim')) == ['jim', 'jimmy', 'ajim']
+
+
+def test_accents_and_case_are_ignored():
+    index = create_index([
+        ('angela', 'Ângela Martin'),
+        ('jose', 'José Álvarez'),
+    ])
+
+    assert index.search('ÂNG') == [
+        {'username': 'angela', 'name': 'Ângela Martin'}
+    ]
+    assert get_usernames(index.search('jose')) == ['jose']
+    assert get_usernames(index.search('alvá')) == ['jose']
+
+
+def test_queries_longer_than_the_indexed_substrings():
+    index = create_index([
+        ('dwight', 'Dwight Schrute'),
+        ('mose', 'Mose Schrute'),
+        ('holly', 'Holly Flax'),
+        ('toby', 'Toby Flenderson'),
+    ])
+    query = 'schrute'
+    assert len(query) > GRAM_SIZE
+
+    assert get_usernames(index.search(query)) == ['mose', 'dwight']
+    # Every substring of "flexx" is indexed but not the whole query
+    assert index.search('flexx') == []
+    assert get_usernames(index.search('lenderson')) == ['toby']
+
+
+def test_upsert_and_remove():
+    index = create_index([('jim', 'Jim Halpert'), ('pam', 'Pam Beesly')])
+
+    index.upsert(2, 'pam', 'Pam Halpert')
+    assert get_usernames(index.search('halpert')) == ['jim', 'pam']
+    assert index.search('beesly') == []
+
+    index.remove(1)
+    assert get_usernames(index.search('halpert')) == ['pam']
+    assert len(index) == 1
+
+
+def test_private_and_inactive_users_are_removed(session, create_user):
+    jim = create_user('jim')
+    pam = create_user('pam')
+    user_search.load([])
+    update_user_search(jim)
+    update_user_search(pam)
+    assert get_usernames(user_search.search('m')) == ['jim', 'pam']
+
+    jim.private = True
+    update_user_search(jim)
+    pam.is_active = False
+    update_user_search(pam)
+
+    assert user_search.search('m') == []
+    assert len(user_search) == 0
+
+
+def test_names_route(client, auth_headers, session, create_user):
+    jim = create_user('jim')
+    create_user('jimmy')
+    hidden = create_user('jimbo')
+    hidden.private = True
+    session.add(hidden)
+    session.commit()
+    headers = auth_headers(jim)
+
+    response = client.get('/user/names?query=JIM', headers=headers)
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {'username': 'jim', 'name': 'Jim'},
+        {'username': 'jimmy', 'name': 'Jimmy'},
+    ]
+    assert client.get('/user/names', headers=headers).json() == []
+
+
+def test_failed_reloads_are_logged(monkeypatch, caplog):
+    async def load_user_search(session):
+        raise ConnectionError('database is down')
+
+    monkeypatch.setattr(search, 'load_user_search', load_user_search)
+    # The logging config of the migrations disables the existing loggers
+    monkeypatch.setattr(search.logger, 'disabled', False)
+
+    with caplog.at_level(logging.ERROR, logger='dundie.search'):
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(asyncio.wait_for(sync_user_search(0.01), 0.05))
+
+    assert caplog.records
+    record = caplog.records[0]
+    assert record.getMessage() == 'Failed to load the user search index'
+    assert record.exc_info[0] is ConnectionError
+
+
+def test_cancelled_reloads_stop_the_sync(monkeypatch):
+    async def load_user_search(session):
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            # As the session of a query cancelled by the shutdown
+            raise ConnectionError('cannot close the session')
+
+    monkeypatch.setattr(search, 'load_user_search', load_user_search)
+
+    async def main():
+        task = asyncio.create_task(sync_user_search(60))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        done, _ = await asyncio.wait([task], timeout=1)
+        return task in done and task.cancelled()
+
+    assert asyncio.run(main())
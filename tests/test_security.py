@@ -0,0 +1,82 @@
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+from dundie import security
+from dundie.app import app
+from dundie.metrics import HASHING_REJECTED
+from dundie.security import PasswordHasher
+
+
+def get_rejected() -> float:
+    return sum(value for _, _, value in HASHING_REJECTED.samples())
+
+
+@pytest.fixture
+def small_hasher(monkeypatch):
+    """Hasher of the app with one worker and one operation in flight"""
+    hasher = PasswordHasher(workers=1, max_pending=1)
+    monkeypatch.setattr(security, 'hasher', hasher)
+    yield hasher
+    hasher.shutdown()
+
+
+def test_saturated_pool_answers_503(create_user, small_hasher):
+    create_user('jim')
+    rejected = get_rejected()
+    release = threading.Event()
+
+    async def main():
+        blocked = asyncio.create_task(small_hasher.run(release.wait))
+        while small_hasher.pending < 1:
+            await asyncio.sleep(0)
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url='http://test'
+        ) as client:
+            response = await client.post(
+                '/token', data={'username': 'jim', 'password': 'Bears'}
+            )
+        release.set()
+        await blocked
+        return response
+
+    response = asyncio.run(main())
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert get_rejected() == rejected + 1
+    assert small_hasher.pending == 0
+
+
+def test_failed_operations_free_their_slot(small_hasher):
+    def fail():
+        raise ValueError('invalid salt')
+
+    async def main():
+        with pytest.raises(ValueError):
+            await small_hasher.run(fail)
+        assert small_hasher.pending == 0
+        return await small_hasher.run(sum, [1, 2])
+
+    assert asyncio.run(main()) == 3
+
+
+def test_process_pool():
+    hasher = PasswordHasher(kind='process', workers=1)
+
+    async def main():
+        hashed = await hasher.hash('Scranton123')
+        return (
+            await hasher.verify('Scranton123', hashed),
+            await hasher.verify('Stamford123', hashed),
+        )
+
+    try:
+        assert asyncio.run(main()) == (True, False)
+    finally:
+        hasher.shutdown()
+    assert hasher.pending == 0
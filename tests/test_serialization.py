@@ -0,0 +1,99 @@
+from datetime import datetime
+
+import msgpack
+import pytest
+
+from dundie.conditional import as_utc
+from dundie.config import settings
+from dundie.controllers.transaction import check_and_transfer_points
+from dundie.models import Post
+from dundie.serialization import FastJSONResponse, accepts_msgpack
+
+URLS = ['/transaction/list', '/post?sort=like_desc', '/user']
+
+
+@pytest.fixture
+def populated(session, create_user):
+    jim = create_user('jim', balance=1000)
+    create_user('pam')
+    for likes in range(3):
+        session.add(Post(content='ação', user_id=jim.id, likes=likes))
+    session.commit()
+    for _ in range(3):
+        check_and_transfer_points('pam', 10, from_user=jim, session=session)
+    return jim
+
+
+@pytest.mark.parametrize('url', URLS)
+def test_fast_json_is_the_same_json(
+    client, auth_headers, populated, monkeypatch, url
+):
+    headers = auth_headers(populated)
+    expected = client.get(url, headers=headers)
+    assert expected.status_code == 200, expected.text
+
+    rendered = []
+    render = FastJSONResponse.render
+
+    def spy(self, content):
+        rendered.append(content)
+        return render(self, content)
+
+    monkeypatch.setattr(FastJSONResponse, 'render', spy)
+    monkeypatch.setitem(settings.serialization, 'FAST_JSON', True)
+    response = client.get(url, headers=headers)
+
+    assert response.status_code == 200
+    assert rendered
+    assert response.content == expected.content
+
+
+@pytest.mark.parametrize(
+    'accept, expected',
+    [
+        ('application/msgpack', True),
+        ('application/x-msgpack, application/json;q=0.9', True),
+        ('application/msgpack;q=0.5, application/json', False),
+        ('application/json', False),
+        ('*/*', False),
+        ('', False),
+    ],
+)
+def test_accepts_msgpack(accept, expected):
+    assert accepts_msgpack(accept) is expected
+
+
+def parse_dates(value):
+    """Datetimes of JSON or MessagePack items, as aware UTC datetimes"""
+    if isinstance(value, list):
+        return [parse_dates(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    items = {key: parse_dates(item) for key, item in value.items()}
+    for key in ('date', 'created_at'):
+        if isinstance(items.get(key), str):
+            items[key] = datetime.fromisoformat(items[key])
+        if isinstance(items.get(key), datetime):
+            items[key] = as_utc(items[key])
+    return items
+
+
+@pytest.mark.parametrize('url', [*URLS, '/admin/user'])
+def test_msgpack_has_the_json_data(
+    client, auth_headers, create_user, populated, url
+):
+    admin = create_user('michael', dept='management')
+    headers = auth_headers(admin if url == '/admin/user' else populated)
+    expected = client.get(url, headers=headers)
+    assert expected.headers['Vary'] == 'Accept'
+
+    response = client.get(
+        url, headers=headers | {'Accept': 'application/msgpack'}
+    )
+
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'application/msgpack'
+    assert response.headers['Vary'] == 'Accept'
+    data = msgpack.unpackb(response.content, timestamp=3)
+    assert parse_dates(data) == parse_dates(expected.json())
+    assert len(response.content) < len(expected.content)
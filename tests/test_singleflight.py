@@ -0,0 +1,146 @@
+import asyncio
+
+import httpx
+import pytest
+from sqlalchemy import event
+
+from dundie import response_cache
+from dundie.app import app
+from dundie.controllers import post
+from dundie.db import async_engine
+from dundie.models import Post, Products
+from dundie.pagination import count_cache
+from dundie.utils.singleflight import SingleFlight
+
+REQUESTS = 10
+
+
+class GatedFlight(SingleFlight):
+    """
+    Holds the first call of a key until `callers` calls are waiting for it,
+    so the concurrent requests of a test surely overlap.
+    """
+
+    def __init__(self, callers: int):
+        super().__init__()
+        self.callers = callers
+        self.arrived = 0
+        self.ready = asyncio.Event()
+
+    async def do(self, key, func, *args, **kwargs):
+        self.arrived += 1
+        if self.arrived == self.callers:
+            self.ready.set()
+
+        async def gated(*args, **kwargs):
+            await self.ready.wait()
+            return await func(*args, **kwargs)
+
+        return await super().do(key, gated, *args, **kwargs)
+
+
+def get_concurrently(url: str, headers: dict) -> list[httpx.Response]:
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url='http://test'
+        ) as client:
+            return await asyncio.gather(
+                *(client.get(url, headers=headers) for _ in range(REQUESTS))
+            )
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def statements():
+    """SQL statements executed by the async engine during the test"""
+    executed = []
+
+    def record(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    event.listen(async_engine.sync_engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(async_engine.sync_engine, 'before_cursor_execute', record)
+
+
+def test_concurrent_misses_run_the_endpoint_once(
+    client, session, create_user, auth_headers, monkeypatch, statements
+):
+    headers = auth_headers(create_user('jim'))
+    session.add(
+        Products(name='Mug', price=10, description='A mug', image='mug.png')
+    )
+    session.commit()
+
+    # Caches the authenticated user, then drops the cached response
+    client.get('/shop/products', headers=headers)
+    response_cache.backend.clear()
+    flights = GatedFlight(REQUESTS)
+    monkeypatch.setattr(response_cache, '_flights', flights)
+    statements.clear()
+
+    responses = get_concurrently('/shop/products', headers)
+
+    assert [response.status_code for response in responses] == [200] * 10
+    assert {response.text for response in responses} == {responses[0].text}
+    assert responses[0].json()[0]['name'] == 'Mug'
+    assert flights.stats()['calls'] == 1
+    # The products are selected once, besides the ETag query of each request
+    products = [s for s in statements if 'count(' not in s.lower()]
+    assert len(products) == 1
+
+
+def test_concurrent_feed_requests_load_the_page_once(
+    client, session, create_user, auth_headers, monkeypatch, statements
+):
+    jim = create_user('jim')
+    headers = auth_headers(jim)
+    for likes in range(3):
+        session.add(Post(content='post', user_id=jim.id, likes=likes))
+    session.commit()
+
+    url = '/post?sort=like_desc&page=1'
+    client.get(url, headers=headers)
+    count_cache.clear()
+    monkeypatch.setattr(post, '_feed_flights', GatedFlight(REQUESTS))
+    statements.clear()
+
+    responses = get_concurrently(url, headers)
+
+    assert [response.status_code for response in responses] == [200] * 10
+    for response in responses:
+        items = response.json()['items']
+        assert [item['likes'] for item in items] == [2, 1, 0]
+    # One page query and one count, the liked state is loaded per request
+    counts = [s for s in statements if 'count(' in s.lower()]
+    pages = [s for s in statements if 'LIMIT' in s and s not in counts]
+    assert len(pages) == 1
+    assert len(counts) == 1
+
+
+def test_errors_are_shared_and_the_key_is_released():
+    flights = SingleFlight()
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError('boom')
+
+    async def main():
+        results = await asyncio.gather(
+            flights.do('key', fail),
+            flights.do('key', fail),
+            return_exceptions=True,
+        )
+        assert len(flights) == 0
+        # Nothing is cached, the next call runs it again
+        with pytest.raises(ValueError):
+            await flights.do('key', fail)
+        return results
+
+    results = asyncio.run(main())
+    assert [str(result) for result in results] == ['boom', 'boom']
+    assert len(calls) == 2
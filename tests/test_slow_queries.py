@@ -0,0 +1,160 @@
+import json
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import StaticPool
+
+from dundie import slow_queries
+from dundie.config import settings
+from dundie.slow_queries import track_slow_queries, write_entry
+
+
+@pytest.fixture
+def slow_log(tmp_path, monkeypatch):
+    """Logs the statements slower than 20ms to a temporary file"""
+    path = tmp_path / 'logs' / 'slow_queries.log'
+    monkeypatch.setitem(settings.db, 'SLOW_QUERY_LOG', str(path))
+    monkeypatch.setitem(settings.db, 'SLOW_QUERY_MS', 20)
+    # The logging config of the migrations disables the existing loggers
+    monkeypatch.setattr(slow_queries.logger, 'disabled', False)
+
+    def close_handler():
+        handler = slow_queries._handler
+        if handler is not None:
+            slow_queries.logger.removeHandler(handler)
+            handler.close()
+            slow_queries._handler = None
+
+    # The handler of the configured file is opened by the first entry
+    close_handler()
+    yield path
+    close_handler()
+
+
+@pytest.fixture
+def sleepy_engine(slow_log):
+    """SQLite engine tracked as 'test', `sleep(seconds)` waits in SQL"""
+    engine = create_engine('sqlite://', poolclass=StaticPool)
+
+    @event.listens_for(engine, 'connect')
+    def add_sleep(dbapi_connection, connection_record):
+        dbapi_connection.create_function('sleep', 1, time.sleep)
+
+    track_slow_queries(engine, 'test', explain_engine=None)
+    yield engine
+    engine.dispose()
+
+
+def read_entries(path) -> list[dict]:
+    if not path.exists():
+        return []
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_only_statements_above_the_threshold_are_logged(
+    sleepy_engine, slow_log
+):
+    with sleepy_engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+        connection.execute(text('SELECT sleep(:seconds)'), {'seconds': 0})
+        assert read_entries(slow_log) == []
+
+        connection.execute(
+            text('SELECT sleep(:seconds)'), {'seconds': 0.05}
+        )
+
+    entries = read_entries(slow_log)
+    assert len(entries) == 1
+    assert entries[0]['statement'] == 'SELECT sleep(?)'
+
+
+def test_entry_format(sleepy_engine, slow_log):
+    with sleepy_engine.connect() as connection:
+        connection.execute(
+            text('SELECT sleep(:seconds), :name'),
+            {'seconds': 0.03, 'name': 'secret value'},
+        )
+
+    entry, = read_entries(slow_log)
+    assert set(entry) == {
+        'time', 'id', 'kind', 'engine', 'duration_ms', 'route',
+        'statement', 'params',
+    }
+    assert entry['kind'] == 'query'
+    assert entry['engine'] == 'test'
+    assert entry['duration_ms'] >= 30
+    assert entry['route'] is None
+    assert entry['id'] == slow_queries.get_statement_id(entry['statement'])
+    # Only the shape of the parameters, never their values
+    assert entry['params'] == ['float', 'str']
+    assert 'secret value' not in slow_log.read_text()
+
+
+def test_executemany_parameters_shape():
+    rows = [(1, 'jim'), (2, 'pam'), (3, 'dwight')]
+
+    shape = slow_queries.get_params_shape(rows, executemany=True)
+
+    assert shape == {'rows': 3, 'row': ['int', 'str']}
+
+
+def test_concurrent_first_entries_open_one_handler(slow_log):
+    barrier = threading.Barrier(8)
+
+    def log(index):
+        barrier.wait()
+        write_entry({'id': str(index), 'kind': 'query'})
+
+    threads = [
+        threading.Thread(target=log, args=(index,)) for index in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    handlers = [
+        handler for handler in slow_queries.logger.handlers
+        if isinstance(handler, RotatingFileHandler)
+    ]
+    assert handlers == [slow_queries._handler]
+    assert len(read_entries(slow_log)) == 8
+
+
+def test_slow_queries_route(client, auth_headers, create_user, slow_log):
+    michael = create_user('michael', dept='management')
+    jim = create_user('jim')
+    for statement_id, route, duration in (
+        ('a', 'GET /post', 600),
+        ('b', 'GET /transaction/list', 900),
+        ('c', 'GET /post', 2000),
+    ):
+        write_entry({
+            'id': statement_id,
+            'kind': 'query',
+            'duration_ms': duration,
+            'route': route,
+        })
+    write_entry({'id': 'a', 'kind': 'explain', 'plan': [{'Plan': {}}]})
+    url = '/admin/debug/slow-queries'
+
+    response = client.get(url, headers=auth_headers(michael))
+
+    assert response.status_code == 200
+    entries = response.json()
+    # Newest first, with the plan of their statement
+    assert [entry['id'] for entry in entries] == ['c', 'b', 'a']
+    assert entries[2]['plan'] == [{'Plan': {}}]
+    assert 'plan' not in entries[0]
+
+    filtered = client.get(
+        url,
+        params={'route': 'GET /post', 'min_ms': 1000},
+        headers=auth_headers(michael),
+    )
+    assert [entry['id'] for entry in filtered.json()] == ['c']
+
+    assert client.get(url, headers=auth_headers(jim)).status_code == 401